@@ -0,0 +1,117 @@
+"""
+Asynchronous command jobs.
+
+A job is a command line (as sent to the TCP server) queued to run later:
+submitting it returns a job id at once, and the command runs on the job
+thread, one job at a time in submission order. When it finishes, its state
+("done" or "failed") and reply are kept for JOB_HISTORY jobs and passed to
+the on_finished callback, which the server uses to push an event line to the
+"SUB EVENTS" subscribers:
+
+    EVENT job {"id": 3, "command": "set_channel_mxc:1", "state": "done", "result": "...", ...}
+"""
+
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+
+JOB_HISTORY = 1000      # Finished jobs kept for get_job
+MAX_QUEUED_JOBS = 1000  # Jobs waiting to run before new ones are rejected
+JOB_STATES = ("queued", "running", "done", "failed")
+
+@dataclass
+class Job:
+
+    """
+    Attributes:
+        id (int): Job id, increasing from 1.
+        command (str): The command line.
+        state (str): One of JOB_STATES.
+        result (str): Reply of the command once finished.
+        submitted, started, finished (float): time.time() of each step (None until reached).
+    """
+
+    id: int
+    command: str
+    state: str = "queued"
+    result: str | None = None
+    submitted: float | None = None
+    started: float | None = None
+    finished: float | None = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+def format_event(kind: str, payload: dict) -> bytes:
+    """ Event line sent to the "events" subscribers: "EVENT <kind> <json>". """
+    return f"EVENT {kind} {json.dumps(payload, ensure_ascii=False)}\n".encode('utf-8')
+
+class JobQueue:
+
+    """
+    Runs submitted commands in order on one thread.
+    Args:
+        execute (callable): execute(command) -> (ok, reply); ok=False marks the job as failed.
+        on_finished (callable): on_finished(job), called on the job thread after each job.
+        history (int): Finished jobs kept.
+        max_queued (int): Jobs waiting before submit() refuses new ones.
+    """
+
+    def __init__(self, execute, on_finished=None, history: int = JOB_HISTORY, max_queued: int = MAX_QUEUED_JOBS):
+        self.execute = execute
+        self.on_finished = on_finished
+        self.history = history
+        self._queue = queue.Queue(max_queued)
+        self._jobs = OrderedDict()      # {id: Job}, oldest first
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._thread = threading.Thread(target=self._run, name="command-jobs", daemon=True)
+        self._thread.start()
+
+    def submit(self, command: str) -> Job:
+        """
+        Queue a command.
+        Raises:
+            queue.Full: MAX_QUEUED_JOBS jobs are already waiting.
+        """
+        with self._lock:
+            job = Job(next(self._ids), command, submitted=time.time())
+            self._queue.put_nowait(job)
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: int) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self) -> int:
+        """ Jobs waiting to run. """
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.state = "running"
+            job.started = time.time()
+            try:
+                ok, job.result = self.execute(job.command)
+            except Exception as e:
+                ok, job.result = False, f"Error running job: {e}"
+            job.finished = time.time()
+            job.state = "done" if ok else "failed"
+
+            with self._lock:
+                # Forget the oldest finished jobs
+                finished = [job_id for job_id, old in self._jobs.items() if old.state in ("done", "failed")]
+                for job_id in finished[:max(0, len(finished) - self.history)]:
+                    del self._jobs[job_id]
+
+            if self.on_finished is not None:
+                try:
+                    self.on_finished(job)
+                except Exception as e:
+                    print(f"Error notifying the end of job {job.id}: {e}")
@@ -0,0 +1,261 @@
+"""
+Table-driven dispatch of the TCP server commands.
+
+A command line is "name" or "name:arg1:arg2...". Each command is registered
+once with its argument schema, and dispatch() finds it with a dictionary
+lookup on the name (no prefix matching), converts and validates the arguments,
+runs it and times it:
+
+    commands = CommandRegistry()
+
+    @commands.command("set_heater_power", Argument("power", float, minimum=0.0, maximum=1.0,
+                                                   error="Heater power must be between 0.0 and 1.0"))
+    def set_heater_power(power):
+        ...
+        return f"Set heater power to {power}"
+
+The function returns the reply text. Invalid arguments and exceptions are
+turned into error replies by the engine, so command functions only describe
+the device operation and its verification (see retry() for readbacks). A
+reply starting with "❌" (or an exception) marks the command as failed.
+
+Commands registered with coalesce=True write one device parameter: a request
+runs at once, and the requests for the same command arriving while it runs
+(e.g. a slider being dragged) are merged: only the last value is written and
+verified next, and the earlier requests get a "superseded by" reply.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+
+from command_stats import CommandStats
+
+COMMAND_PHASES = ("parse", "run")
+_REQUIRED = object()
+
+class CommandError(Exception):
+
+    """ An invalid command; its message is the reply sent to the client. """
+
+@dataclass(frozen=True)
+class Argument:
+
+    """
+    One positional argument of a command.
+    Attributes:
+        name (str): Keyword passed to the command function.
+        type (callable): Conversion of the text (float, int, str...).
+        minimum, maximum: Inclusive bounds (None for no bound).
+        choices (tuple): Allowed values, after conversion.
+        check (callable): check(value) -> bool, for any other rule.
+        default: Value used when the argument is missing (required if not given).
+        error (str): Reply when the value is out of bounds (a generic one by default).
+        rest (bool): The last argument takes the rest of the line, colons included.
+    """
+
+    name: str
+    type: object = float
+    minimum: float | None = None
+    maximum: float | None = None
+    choices: tuple | None = None
+    check: object = None
+    default: object = _REQUIRED
+    error: str | None = None
+    rest: bool = False
+
+    def convert(self, text: str):
+        try:
+            value = self.type(text.strip())
+        except (TypeError, ValueError):
+            raise CommandError(f"❌ Invalid {self.name} {text.strip()!r}: expected {getattr(self.type, '__name__', 'value')}")
+        if ((self.minimum is not None and value < self.minimum)
+                or (self.maximum is not None and value > self.maximum)
+                or (self.choices is not None and value not in self.choices)
+                or (self.check is not None and not self.check(value))):
+            raise CommandError(self.error or f"❌ Invalid {self.name} {value}: {self.describe()}")
+        return value
+
+    def describe(self) -> str:
+        rules = []
+        if self.minimum is not None:
+            rules.append(f">= {self.minimum}")
+        if self.maximum is not None:
+            rules.append(f"<= {self.maximum}")
+        if self.choices is not None:
+            rules.append(f"one of {list(self.choices)}")
+        return " and ".join(rules) or "rejected"
+
+@dataclass(frozen=True)
+class Command:
+
+    name: str
+    function: object
+    arguments: tuple
+    error: str          # Prefix of the reply when the function raises
+    coalesce: bool = False
+
+    def parse(self, texts: list) -> dict:
+        if self.arguments and self.arguments[-1].rest and len(texts) > len(self.arguments):
+            texts = texts[:len(self.arguments) - 1] + [":".join(texts[len(self.arguments) - 1:])]
+        if len(texts) > len(self.arguments):
+            raise CommandError(f"❌ {self.name} takes at most {len(self.arguments)} argument(s), got {len(texts)}")
+        values = {}
+        for index, argument in enumerate(self.arguments):
+            if index < len(texts) and texts[index].strip():
+                values[argument.name] = argument.convert(texts[index])
+            elif argument.default is not _REQUIRED:
+                values[argument.name] = argument.default
+            else:
+                raise CommandError(f"❌ Missing {argument.name}: {self.usage()}")
+        return values
+
+    def usage(self) -> str:
+        return self.name + "".join(f":<{argument.name}>" if argument.default is _REQUIRED else f"[:<{argument.name}>]"
+                                   for argument in self.arguments)
+
+class _CoalescedKey:
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.seq = 0            # Number of the latest request
+        self.latest = None      # Text of the latest request
+        self.running = False    # A request of the key is running
+
+class Coalescer:
+
+    """
+    Merges rapid requests for the same key. A request runs at once when no other
+    request of its key is running; otherwise it waits for it, and only the last
+    of the requests that waited runs next.
+    """
+
+    def __init__(self):
+        self.superseded = 0
+        self._lock = threading.Lock()
+        self._keys = {}
+
+    def run(self, key: str, text: str, function) -> tuple:
+        """
+        Returns:
+            tuple: (True, result of function()) if this request ran, or
+            (False, text of the newer request) if it was superseded.
+        """
+        with self._lock:
+            state = self._keys.setdefault(key, _CoalescedKey())
+        with state.condition:
+            state.seq += 1
+            seq = state.seq
+            state.latest = text
+            state.condition.notify_all()    # Supersedes the request waiting, if any
+            # One write of a key at a time; a newer request may arrive while waiting for it
+            while state.running and state.seq == seq:
+                state.condition.wait()
+            if state.seq != seq:
+                self.superseded += 1
+                return False, state.latest
+            state.running = True
+
+        try:
+            return True, function()
+        finally:
+            with state.condition:
+                state.running = False
+                state.condition.notify_all()
+
+class CommandRegistry:
+
+    """
+    The commands of the server, by name.
+    Args:
+        stats_window (int): Samples kept per command for the timing statistics.
+    """
+
+    def __init__(self, stats_window: int = 1000):
+        self._commands = {}
+        self.stats = CommandStats(stats_window, phases=COMMAND_PHASES)
+        self.coalescer = Coalescer()
+
+    def add(self, name: str, function, *arguments: Argument, error: str | None = None, coalesce: bool = False) -> Command:
+        """ Register function(**arguments) -> reply text under name. """
+        if name in self._commands:
+            raise ValueError(f"Command {name!r} is already registered")
+        command = Command(name, function, tuple(arguments), error or f"❌ Error running {name}", coalesce)
+        self._commands[name] = command
+        return command
+
+    def command(self, name: str, *arguments: Argument, error: str | None = None, coalesce: bool = False):
+        """ Decorator version of add(). """
+        def register(function):
+            self.add(name, function, *arguments, error=error, coalesce=coalesce)
+            return function
+        return register
+
+    def coalesce_key(self, text: str) -> str | None:
+        """ Key under which a command line is coalesced (None if it never is). """
+        command = self._commands.get(text.strip().partition(":")[0].strip())
+        return command.name if command is not None and command.coalesce else None
+
+    def names(self) -> list:
+        return sorted(self._commands)
+
+    def get(self, name: str) -> Command | None:
+        return self._commands.get(name)
+
+    def dispatch(self, text: str) -> str:
+        """ Run a command line and return its reply text (never raises). """
+        return self.execute(text)[1]
+
+    def execute(self, text: str) -> tuple:
+        """
+        Run a command line (never raises).
+        Returns:
+            tuple: (ok, reply text); ok is False for unknown or invalid commands,
+            exceptions and replies starting with "❌".
+        """
+        name, _, rest = text.strip().partition(":")
+        command = self._commands.get(name.strip())
+        if command is None:
+            message = f"Unknown command {name.strip()!r}"
+            print(message)
+            return False, message
+
+        start = time.perf_counter()
+        try:
+            values = command.parse(rest.split(":") if rest else [])
+        except CommandError as e:
+            self.stats.record_call(command.name, {"parse": time.perf_counter() - start}, e)
+            message = str(e)
+            print(message)
+            return False, message
+
+        parsed = time.perf_counter()
+        error = None
+        try:
+            if command.coalesce:
+                ran, result = self.coalescer.run(command.name, text.strip(), lambda: command.function(**values))
+                message = result if ran else f"⏭️ {text.strip()} superseded by {result}"
+            else:
+                message = command.function(**values)
+        except CommandError as e:
+            error = e
+            message = str(e)
+        except Exception as e:
+            error = e
+            message = f"{command.error}: {e}"
+        self.stats.record_call(command.name, {"parse": parsed - start, "run": time.perf_counter() - parsed}, error)
+        print(message)
+        return error is None and not str(message).startswith("❌"), message
+
+def retry(operation, *args, attempts: int = 3, accept=lambda result: result is not None, **kwargs):
+    """
+    Call operation(*args, **kwargs) until accept(result) or attempts calls were made.
+    Returns:
+        The last result (check it with accept() again to know if it succeeded).
+    """
+    result = None
+    for _ in range(attempts):
+        result = operation(*args, **kwargs)
+        if accept(result):
+            break
+    return result
@@ -0,0 +1,133 @@
+"""
+Client of the tcp_server command sessions ("CMD" mode, see event_server.py).
+
+One TCP connection is kept open and reused for every command, and several
+commands can be in flight at once: each one is sent with an id and its reply
+is matched by that id.
+
+    session = CommandSession("127.0.0.1", 65432)
+    print(session.send("get_command_stats"))
+    replies = session.send_many(["set_dwell_mxc:10", "set_pause_mxc:5", "set_mxc_temperature_setpoint:50"])
+    session.close()
+
+The commands of a session run on the server in the order they were sent.
+"""
+
+import itertools
+import socket
+import threading
+from concurrent.futures import Future
+
+SESSION_TIMEOUT = 10.0  # Seconds to connect and to wait for a reply
+
+class CommandSession:
+
+    """
+    Persistent, pipelined command connection (thread-safe).
+    Args:
+        host (str), port (int): Address of the TCP server.
+        timeout (float): Default seconds to wait for a reply.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = SESSION_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._pending = {}      # {id: (socket, Future)} of the commands waiting for a reply
+        self._ids = itertools.count(1)
+
+    def _connect(self):
+        # Called with the lock held
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(b"CMD\n")
+        reader = sock.makefile('rb')
+        greeting = reader.readline().decode('utf-8', errors='ignore').strip()
+        if greeting != "CMD ready":
+            sock.close()
+            raise ConnectionError(f"The server does not support command sessions (replied {greeting!r})")
+        sock.settimeout(None)
+        self._sock = sock
+        threading.Thread(target=self._receive, args=(sock, reader), name="command-session", daemon=True).start()
+
+    def _receive(self, sock, reader):
+        try:
+            for line in reader:
+                text = line.decode('utf-8', errors='ignore').strip()
+                request_id, _, reply = text.partition(" ")
+                if not request_id.startswith("@"):
+                    # Untagged: an error about the session itself (e.g. an over-long line), which
+                    # the server closes afterwards: none of the pending commands will get a reply
+                    self._fail_pending(sock, ConnectionError(f"The server ended the command session: {text}"))
+                    continue
+                with self._lock:
+                    _, future = self._pending.pop(request_id[1:], (None, None))
+                if future is not None:
+                    future.set_result(reply)
+        except OSError as e:
+            print(f"Command session with {self.host}:{self.port} failed: {e}")
+        finally:
+            with self._lock:
+                if self._sock is sock:
+                    self._sock = None
+            self._fail_pending(sock, ConnectionError("The command session was closed before the reply"))
+            sock.close()
+
+    def _fail_pending(self, sock, error: Exception):
+        # Fail the commands still waiting for a reply on sock
+        with self._lock:
+            lost = [request_id for request_id, (owner, _) in self._pending.items() if owner is sock]
+            lost = [self._pending.pop(request_id)[1] for request_id in lost]
+        for future in lost:
+            future.set_exception(error)
+
+    def submit(self, command: str) -> Future:
+        """
+        Send a command without waiting for its reply.
+        Returns:
+            Future: Resolves to the reply text (e.g. "Command received - ...").
+        Raises:
+            ValueError: The command contains a line break.
+            OSError: The server cannot be reached.
+        """
+        if "\n" in command or "\r" in command:
+            raise ValueError("A command cannot contain line breaks")
+        future = Future()
+        with self._lock:
+            request_id = str(next(self._ids))
+            data = f"@{request_id} {command}\n".encode('utf-8')
+            for attempt in (1, 2):
+                if self._sock is None:
+                    self._connect()
+                try:
+                    self._sock.sendall(data)
+                    break
+                except OSError:
+                    # Stale connection (e.g. the server was restarted): reconnect once
+                    self._sock.close()
+                    self._sock = None
+                    if attempt == 2:
+                        raise
+            self._pending[request_id] = (self._sock, future)
+        return future
+
+    def send(self, command: str, timeout: float | None = None) -> str:
+        """ Send a command and wait for its reply. """
+        return self.submit(command).result(self.timeout if timeout is None else timeout)
+
+    def send_many(self, commands: list, timeout: float | None = None) -> list:
+        """ Send every command at once, then wait for the replies (in the same order). """
+        futures = [self.submit(command) for command in commands]
+        return [future.result(self.timeout if timeout is None else timeout) for future in futures]
+
+    def close(self):
+        with self._lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
@@ -0,0 +1,159 @@
+"""
+Rolling per-command timing statistics for the Lake Shore 370 driver.
+
+Every transaction sent by lakeshore370.LakeShore370 is recorded under the
+mnemonic(s) of the command, split in three phases:
+
+    lock    time from the driver call until the command is sent: waiting for
+            the driver mutex (other callers) plus the pacing since the last I/O.
+            The time an operation spent queued in the DeviceWorker before the
+            driver was called is not included: see the "queue" phase of
+            DeviceWorker.stats
+    rtt     serial round trip: write of the command and read of the reply
+    parse   conversion of the reply into Python values
+
+Only the last `window` samples of each phase are kept, so the percentiles
+follow the current state of the serial link. The lock and rtt of chained
+queries are recorded under the joined mnemonics, e.g. "SCAN?;RDGR?;RDGPWR?",
+and the parse time of each reply under its own mnemonic.
+
+Other layers can keep their own phases (e.g. the command registry of the TCP
+server times "parse" and "run" per client command) with record_call().
+Observers added with add_observer() see every call as it is recorded (the TCP
+server feeds its metrics histograms this way, see metrics.py).
+"""
+
+import math
+import threading
+from collections import deque
+
+try:
+    import pyvisa
+except ImportError:     # The dummy driver runs without VISA
+    pyvisa = None
+
+PHASES = ("lock", "rtt", "parse")
+PERCENTILES = (50, 95, 99)
+
+def command_key(command: str) -> str:
+    """ Mnemonics of a (possibly chained) command: "RDGK? 6;RDGR? 6" -> "RDGK?;RDGR?". """
+    mnemonics = []
+    for part in command.split(";"):
+        mnemonic = part.strip().partition(" ")[0].upper()
+        if mnemonic:
+            mnemonics.append(mnemonic)
+    return ";".join(mnemonics)
+
+def is_timeout(error: BaseException) -> bool:
+    """ True if the exception is a VISA I/O timeout. """
+    return (pyvisa is not None and isinstance(error, pyvisa.errors.VisaIOError)
+            and error.error_code == pyvisa.constants.StatusCode.error_timeout)
+
+def _percentile(ordered: list, percent: float) -> float:
+    # Nearest-rank percentile of an already sorted list
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+class _CommandRecord:
+
+    def __init__(self, window: int, phases: tuple):
+        self.samples = {phase: deque(maxlen=window) for phase in phases}
+        self.count = 0
+        self.timeouts = 0
+        self.errors = 0
+
+class CommandStats:
+
+    """
+    Thread-safe rolling statistics of the commands sent to the device.
+    Attributes:
+        window (int): Number of samples kept per command and phase.
+        phases (tuple): Names of the timed phases (PHASES by default).
+    """
+
+    def __init__(self, window: int = 1000, phases: tuple = PHASES):
+        self.window = window
+        self.phases = tuple(phases)
+        self._lock = threading.Lock()
+        self._records = {}
+        self._observers = []
+
+    def add_observer(self, observer):
+        """ observer(key, samples, error) is called with every record_call()/record_io(), outside the lock. """
+        self._observers.append(observer)
+
+    def _record_for(self, key: str) -> _CommandRecord:
+        record = self._records.get(key)
+        if record is None:
+            record = self._records[key] = _CommandRecord(self.window, self.phases)
+        return record
+
+    def record_call(self, key: str, samples: dict, error: BaseException | None = None):
+        """ Record one call under key: {phase: seconds} of the phases it went through, and its error if it failed. """
+        with self._lock:
+            record = self._record_for(key)
+            record.count += 1
+            for phase, seconds in samples.items():
+                record.samples[phase].append(seconds)
+            if error is not None and is_timeout(error):
+                record.timeouts += 1
+            elif error is not None:
+                record.errors += 1
+        for observer in self._observers:
+            try:
+                observer(key, samples, error)
+            except Exception as e:
+                print(f"Error in command statistics observer: {e}")
+
+    def record_io(self, command: str, lock: float, rtt: float, error: BaseException | None = None):
+        """ Record one transaction: lock and round-trip time in seconds, and its error if it failed. """
+        samples = {"lock": lock} if error is not None else {"lock": lock, "rtt": rtt}
+        self.record_call(command_key(command), samples, error)
+
+    def record_parse(self, command: str, seconds: float):
+        """ Record the time spent parsing the reply of a query. """
+        key = command_key(command)
+        with self._lock:
+            self._record_for(key).samples["parse"].append(seconds)
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: {mnemonic: {'count', 'timeouts', 'errors', 'lock', 'rtt', 'parse'}} where
+            each phase is {'n', 'p50', 'p95', 'p99', 'max'} in milliseconds (None without samples).
+        """
+        with self._lock:
+            snapshot = {key: (record.count, record.timeouts, record.errors,
+                              {phase: sorted(samples) for phase, samples in record.samples.items()})
+                        for key, record in self._records.items()}
+
+        summary = {}
+        for key, (count, timeouts, errors, phases) in sorted(snapshot.items()):
+            entry = {'count': count, 'timeouts': timeouts, 'errors': errors}
+            for phase, ordered in phases.items():
+                if ordered:
+                    entry[phase] = {'n': len(ordered), 'max': round(ordered[-1] * 1000, 3)}
+                    for percent in PERCENTILES:
+                        entry[phase][f'p{percent}'] = round(_percentile(ordered, percent) * 1000, 3)
+                else:
+                    entry[phase] = {'n': 0, 'max': None, **{f'p{percent}': None for percent in PERCENTILES}}
+            summary[key] = entry
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+def format_summary(summary: dict) -> str:
+    """ One line per command: count, timeouts and the p50/p95/p99 of each phase in ms. """
+    lines = []
+    for key, entry in summary.items():
+        phases = []
+        for phase, values in entry.items():
+            if not isinstance(values, dict):
+                continue    # count, timeouts, errors
+            if values['n']:
+                phases.append(f"{phase} {values['p50']}/{values['p95']}/{values['p99']}")
+        lines.append(f"{key}: n={entry['count']} timeouts={entry['timeouts']} errors={entry['errors']} "
+                     + " ".join(phases))
+    return "\n".join(lines)
@@ -0,0 +1,174 @@
+"""
+Calibration curves of the Lake Shore 370 evaluated on the host.
+
+The 370 computes a channel temperature (RDGK?) by interpolating its resistance
+reading in the calibration curve assigned to the channel (INSET field 4). The
+curves are downloaded once with CRVHDR?/CRVPT?, cached on disk as JSON and
+evaluated here with NumPy, so the acquisition only needs RDGR? per channel and
+archived resistances can be converted to temperatures offline:
+
+    curve = read_cached_curve(4)
+    temperatures = curve.temperature(resistances)
+
+Like the instrument, the temperature is interpolated linearly between
+breakpoints in the units of the curve: Ohms for format 3 (Ohm/K) and
+log10(Ohms) for format 4 (log Ohm/K). Resistances outside the curve range
+give None for a single resistance (published as null, JSON has no NaN) and NaN
+in an array.
+"""
+
+import json
+import os
+
+import numpy as np
+
+CURVE_FORMAT_OHM = 3          # Ohm/K
+CURVE_FORMAT_LOG_OHM = 4      # log Ohm/K
+CURVE_FORMATS = (CURVE_FORMAT_OHM, CURVE_FORMAT_LOG_OHM)
+
+CURVE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "curve_cache")
+
+class CalibrationCurve:
+
+    """
+    One calibration curve of the instrument.
+    Attributes:
+        number (int): Curve number in the instrument (1 to 20).
+        name (str), serial (str): Sensor model and serial number from CRVHDR?.
+        curve_format (int): CURVE_FORMAT_OHM or CURVE_FORMAT_LOG_OHM.
+        limit (float): Temperature limit in K.
+        coefficient (int): 1 for negative, 2 for positive temperature coefficient.
+        units (np.ndarray): Breakpoint units values (Ohms or log10 Ohms), ascending.
+        temperatures (np.ndarray): Breakpoint temperatures in K.
+    """
+
+    def __init__(self, number: int, name: str, serial: str, curve_format: int,
+                 limit: float, coefficient: int, points: list):
+        if curve_format not in CURVE_FORMATS:
+            raise ValueError(f"Unsupported curve format {curve_format} (supported: {CURVE_FORMATS})")
+        if len(points) < 2:
+            raise ValueError(f"Curve {number} has {len(points)} breakpoints, at least 2 are needed")
+
+        self.number = int(number)
+        self.name = name
+        self.serial = serial
+        self.curve_format = int(curve_format)
+        self.limit = float(limit)
+        self.coefficient = int(coefficient)
+
+        table = np.array(points, dtype=float)
+        table = table[np.argsort(table[:, 0])]
+        self.units = table[:, 0]
+        self.temperatures = table[:, 1]
+
+    @classmethod
+    def from_instrument(cls, number: int, header: list, points: list):
+        """ Build a curve from the CRVHDR? fields and the CRVPT? breakpoints. """
+        name, serial, curve_format, limit, coefficient = header[:5]
+        return cls(number, name, serial, int(curve_format), float(limit), int(coefficient), points)
+
+    @property
+    def header(self) -> list:
+        """ Header fields as compared against CRVHDR? to validate the disk cache. """
+        return [self.name, self.serial, self.curve_format, self.limit, self.coefficient]
+
+    def temperature(self, resistance):
+        """
+        Temperature in K for one resistance or an array of resistances in Ohms.
+        Returns:
+            float | None | np.ndarray: None for a single resistance outside the curve,
+            NaN where an array resistance is outside the curve.
+        """
+        resistance = np.asarray(resistance, dtype=float)
+        if self.curve_format == CURVE_FORMAT_LOG_OHM:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                units = np.log10(resistance)
+        else:
+            units = resistance
+
+        temperature = np.interp(units, self.units, self.temperatures, left=np.nan, right=np.nan)
+        if temperature.ndim == 0:
+            return None if np.isnan(temperature) else float(temperature)
+        return temperature
+
+    def to_dict(self) -> dict:
+        return {
+            "number": self.number,
+            "name": self.name,
+            "serial": self.serial,
+            "format": self.curve_format,
+            "limit": self.limit,
+            "coefficient": self.coefficient,
+            "points": np.column_stack((self.units, self.temperatures)).tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["number"], data["name"], data["serial"], data["format"],
+                   data["limit"], data["coefficient"], data["points"])
+
+def _header_matches(curve: CalibrationCurve, header: list) -> bool:
+    name, serial, curve_format, limit, coefficient = header[:5]
+    try:
+        return (curve.name == name and curve.serial == serial and curve.curve_format == int(curve_format)
+                and curve.limit == float(limit) and curve.coefficient == int(coefficient))
+    except ValueError:
+        return False
+
+def curve_cache_path(number: int, cache_dir: str = CURVE_CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"curve_{int(number):02d}.json")
+
+def read_cached_curve(number: int, cache_dir: str = CURVE_CACHE_DIR) -> CalibrationCurve | None:
+    """ Curve stored on disk by a previous download, or None if there is none. """
+    path = curve_cache_path(number, cache_dir)
+    try:
+        with open(path) as f:
+            return CalibrationCurve.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Ignoring unreadable curve cache {path}.\nReason: {e}")
+        return None
+
+def save_curve(curve: CalibrationCurve, cache_dir: str = CURVE_CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = curve_cache_path(curve.number, cache_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(curve.to_dict(), f, indent=1)
+    os.replace(tmp_path, path)
+
+def download_curve(ls, number: int, header: list | None = None) -> CalibrationCurve:
+    """
+    Read a curve from the instrument through the driver (CRVHDR? + CRVPT?).
+    Raises:
+        IOError: If the header or the breakpoints could not be read.
+    """
+    if header is None:
+        header = ls.get_curve_header(number)
+    if header is None:
+        raise IOError(f"Could not read the header of curve {number}")
+    points = ls.get_curve_points(number)
+    if points is None:
+        raise IOError(f"Could not read the breakpoints of curve {number}")
+    return CalibrationCurve.from_instrument(number, header, points)
+
+def load_curve(ls, number: int, cache_dir: str = CURVE_CACHE_DIR) -> CalibrationCurve:
+    """
+    Get a curve, downloading it only if the disk cache is missing or its header
+    no longer matches the instrument's CRVHDR? (the curve was replaced).
+    Meant to run on the device worker: device.call(load_curve, number).
+    """
+    header = ls.get_curve_header(number)
+    if header is None:
+        raise IOError(f"Could not read the header of curve {number}")
+
+    curve = read_cached_curve(number, cache_dir)
+    if curve is not None and _header_matches(curve, header):
+        return curve
+
+    print(f"Downloading calibration curve {number} ({header[0]})...")
+    curve = download_curve(ls, number, header)
+    save_curve(curve, cache_dir)
+    print(f"Curve {number} cached with {len(curve.units)} breakpoints in {curve_cache_path(number, cache_dir)}")
+    return curve
@@ -0,0 +1,102 @@
+"""
+Delta-encoded subscription stream ("SUB DELTA").
+
+Instead of the full broadcast line on every tick, a delta subscriber receives:
+
+    K <seq> <timestamp> name: value,name: value,...         keyframe, every field
+    D <seq> <base seq> <timestamp> name: value,...          only the fields that changed
+                                                            since the tick <base seq>
+
+A keyframe is sent on connect, then every KEYFRAME_INTERVAL ticks. A client
+applies a delta only if its base is the last tick it applied; otherwise it has
+missed a line (e.g. dropped by the slow-consumer policy) and sends "RESYNC" on
+the same connection to get a new keyframe. DeltaDecoder implements that logic.
+"""
+
+from wire_format import format_text_fields, parse_text_fields
+
+KEYFRAME_INTERVAL = 60      # Ticks between periodic keyframes
+
+def encode_keyframe(seq: int, timestamp: float, fields: dict) -> bytes:
+    return f"K {seq} {timestamp:.3f} {format_text_fields(fields)}\n".encode('utf-8')
+
+def encode_delta(seq: int, base_seq: int, timestamp: float, changed: dict) -> bytes:
+    return f"D {seq} {base_seq} {timestamp:.3f} {format_text_fields(changed)}\n".encode('utf-8')
+
+class DeltaEncoder:
+
+    """
+    Builds the delta stream from successive ticks (one encoder shared by every
+    delta subscriber, so each line is encoded once per tick).
+    """
+
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.seq = None
+        self.timestamp = None
+        self.fields = None
+        self._ticks_since_keyframe = 0
+
+    def update(self, seq: int, timestamp: float, fields: dict) -> bytes:
+        """ Store a tick and return its line: a keyframe or the delta from the previous tick. """
+        previous_seq, previous = self.seq, self.fields
+        self.seq, self.timestamp, self.fields = seq, timestamp, dict(fields)
+
+        self._ticks_since_keyframe += 1
+        if previous is None or self._ticks_since_keyframe >= self.keyframe_interval:
+            self._ticks_since_keyframe = 0
+            return encode_keyframe(seq, timestamp, self.fields)
+
+        changed = {name: value for name, value in self.fields.items() if previous.get(name) != value}
+        return encode_delta(seq, previous_seq, timestamp, changed)
+
+    def keyframe(self) -> bytes:
+        """ Keyframe of the last tick (sent to new subscribers and on RESYNC). """
+        if self.fields is None:
+            return b""
+        return encode_keyframe(self.seq, self.timestamp, self.fields)
+
+class DeltaDecoder:
+
+    """
+    Client side: rebuilds the full field values (as strings) from the stream.
+    Attributes:
+        fields (dict): Current value of every field, as text.
+        seq (int): Last tick applied (None until the first keyframe).
+        needs_resync (bool): A gap was detected; send "RESYNC" and wait for a keyframe.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.seq = None
+        self.needs_resync = False
+
+    def feed_line(self, line: str) -> bool:
+        """
+        Apply one line of the stream.
+        Returns:
+            bool: True if the fields were updated, False if the line was skipped.
+        """
+        kind, _, rest = line.strip().partition(" ")
+        if kind == "K":
+            seq, _, rest = rest.partition(" ")
+            _, _, text = rest.partition(" ")
+            if self.seq is not None and int(seq) <= self.seq and not self.needs_resync:
+                return False    # Old keyframe still queued before a newer state
+            self.fields = parse_text_fields(text)
+            self.seq = int(seq)
+            self.needs_resync = False
+            return True
+
+        if kind == "D":
+            seq, base, _, text = (rest.split(" ", 3) + [""])[:4]
+            if self.needs_resync or self.seq is None or int(seq) <= self.seq:
+                return False
+            if int(base) != self.seq:
+                self.needs_resync = True
+                return False
+            self.fields.update(parse_text_fields(text))
+            self.seq = int(seq)
+            return True
+
+        return False
@@ -0,0 +1,101 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from command_stats import CommandStats
+
+# Lower numbers are served first
+PRIORITY_COMMAND = 0    # User writes/reads coming from handle_command
+PRIORITY_POLL = 10      # Routine acquisition polling
+
+# Timed phases of an operation: waiting in the queue (from submit), then running on the driver
+OPERATION_PHASES = ("queue", "run")
+
+def _operation_name(operation) -> str:
+    if isinstance(operation, str):
+        return operation
+    operation = getattr(operation, "func", operation)     # functools.partial
+    return getattr(operation, "__name__", type(operation).__name__)
+
+class DeviceWorker:
+
+    """
+    Single thread that owns the LakeShore 370 driver (and its VISA session).
+    Every device operation is queued here and executed one at a time, so no
+    caller needs to hold a lock around the driver. Operations are served by
+    priority and, within the same priority, in submission order: a command
+    sent by a client overtakes any polling operation still waiting in the queue.
+    Attributes:
+        device: The driver instance (lakeshore370.LakeShore370 or the dummy).
+        on_wait (callable): on_wait(priority, seconds) with the time each operation
+            waited in the queue before running (None to not measure it).
+        stats (CommandStats): Rolling "queue" and "run" times per operation (driver
+            method name or callable name). The driver's own command_stats start
+            when the driver is called, so they do not include the queue.
+    """
+
+    def __init__(self, device, name: str = "lakeshore-device", on_wait=None):
+        self.device = device
+        self.on_wait = on_wait
+        self.stats = CommandStats(phases=OPERATION_PHASES)
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, *args, priority: int = PRIORITY_COMMAND, **kwargs) -> Future:
+        """
+        Queue a device operation.
+        Args:
+            operation (str|callable): Name of a driver method, or a callable that
+                receives the driver as its first argument.
+            priority (int): PRIORITY_COMMAND or PRIORITY_POLL (lower runs first).
+        Returns:
+            Future: Resolves to the return value of the operation.
+        """
+        future = Future()
+        self._queue.put((priority, next(self._counter), time.perf_counter(), operation, args, kwargs, future))
+        return future
+
+    def call(self, operation, *args, priority: int = PRIORITY_COMMAND, timeout: float | None = None, **kwargs):
+        """ Queue a device operation and wait for its result. """
+        return self.submit(operation, *args, priority=priority, **kwargs).result(timeout)
+
+    def pending(self) -> int:
+        """ Number of operations waiting in the queue. """
+        return self._queue.qsize()
+
+    def stop(self):
+        """ Stop the worker once the operations already queued are done. """
+        self._queue.put((float("inf"), next(self._counter), 0.0, None, (), {}, None))
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            priority, _, submitted, operation, args, kwargs, future = self._queue.get()
+            if operation is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            if self.on_wait is not None:
+                try:
+                    self.on_wait(priority, started - submitted)
+                except Exception as e:
+                    print(f"Error reporting the device queue wait: {e}")
+            error = None
+            try:
+                if isinstance(operation, str):
+                    result = getattr(self.device, operation)(*args, **kwargs)
+                else:
+                    result = operation(self.device, *args, **kwargs)
+            except BaseException as e:
+                error = e
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                self.stats.record_call(_operation_name(operation),
+                                       {"queue": started - submitted, "run": time.perf_counter() - started}, error)
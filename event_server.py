@@ -0,0 +1,529 @@
+"""
+Single-threaded event loop for the TCP server (selectors based).
+
+One loop thread accepts connections, reads requests and writes replies and
+broadcasts for every socket with non-blocking I/O, so thousands of idle
+subscribers or short-lived command connections cost no threads. Only the
+command handler (which may wait on the device worker) runs on a small thread
+pool; its reply is handed back to the loop to be sent.
+
+The wire protocol is the one of the former thread-per-connection handler:
+    - The first read of a connection decides its mode.
+    - "SUB..." turns the connection into a subscriber that receives every
+      broadcast of its stream until it disconnects ("name:args" commands
+      starting with "sub", such as "submit_job:...", are still commands). The subscription parser
+      maps the request (e.g. "SUB" or "SUB BIN") to the stream name. A stream
+      may have a greeting (e.g. a keyframe) sent to every new subscriber, and
+      again when the subscriber sends a "RESYNC" line. The parser may also
+      return a backlog with the stream name, sent before the first broadcast.
+    - A first line "CMD" opens a command session: the server answers
+      "CMD ready" and then reads newline-delimited commands until the client
+      disconnects. A command may start with a client-chosen id, "@<id> <command>",
+      and its reply is then prefixed with the same "@<id> ". Clients may send
+      many commands without waiting for the replies (up to SESSION_MAX_PENDING
+      in flight, then the server stops reading); the commands of a session run
+      in the order they were sent. A queued command made pointless by a later
+      one of the same session (see the supersede argument) is answered
+      without running it.
+    - Anything else is a single command: the handler reply is sent back and
+      the connection is closed.
+
+Each subscriber has a bounded queue of outbound frames. A broadcast frame is
+encoded once and the same bytes object is queued for every subscriber. When a
+subscriber cannot keep up and its queue is full, the slow-consumer policy
+decides what happens:
+    "drop_oldest"   the oldest queued frame is dropped
+    "coalesce"      every queued frame is dropped, only the latest is kept
+    "disconnect"    the subscriber is disconnected
+A frame already partially written to the socket is never dropped, so the line
+stream stays intact.
+"""
+
+import collections
+import selectors
+import socket
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+FIRST_READ_SIZE = 1024      # The first recv() of a connection is the whole request
+READ_SIZE = 4096
+COMMAND_WORKERS = 4         # Threads running command handlers (device operations)
+SUBSCRIBER_QUEUE_SIZE = 16  # Frames queued per subscriber before the slow-consumer policy applies
+SLOW_SUBSCRIBER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+SESSION_MAX_PENDING = 256   # Commands queued per session before the server stops reading it
+SESSION_MAX_LINE = 65536    # Longest command line accepted in a session
+
+class _Connection:
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.mode = None                # None until the first read, then "SUB", "SESSION" or "CMD"
+        self.stream = None              # Broadcast stream of a subscriber
+        self.inbuf = b""                # Partial line received from a subscriber or session
+        self.request = ""               # First message of the connection
+        self.outbox = collections.deque()   # Outbound frames (bytes, shared between subscribers)
+        self.offset = 0                 # Bytes of outbox[0] already sent
+        self.dropped = 0                # Frames dropped by the slow-consumer policy
+        self.pending = collections.deque()  # Session commands waiting to run: (id or None, text)
+        self.running = False            # A session command is running on the command pool
+        self.eof = False                # The session client closed its side
+        self.close_when_sent = False
+        self.events = 0                 # Selector events currently registered
+
+class EventServer:
+
+    """
+    Non-blocking TCP server running on one selectors loop.
+    Args:
+        host (str), port (int): Listening address.
+        command_handler (callable): command_handler(text) -> bytes, run on the
+            command pool for every command (single command connections and
+            session lines); its return value is the reply sent back.
+        command_workers (int): Size of the command thread pool.
+        subscription_parser (callable): subscription_parser(request) -> stream name
+            for a "SUB..." request, or (stream name, backlog) where backlog() -> bytes
+            is run on the loop thread and sent first; it raises ValueError to
+            reject the request. By default every subscriber gets the "text" stream.
+        queue_size (int): Maximum frames queued per subscriber.
+        slow_policy (str): One of SLOW_SUBSCRIBER_POLICIES.
+        supersede (callable): supersede(text, later_texts) -> bytes or None, called on
+            the loop thread before running a session command with the commands
+            queued after it; a reply returned is sent instead of running it.
+    """
+
+    def __init__(self, host: str, port: int, command_handler, command_workers: int = COMMAND_WORKERS,
+                 subscription_parser=None, queue_size: int = SUBSCRIBER_QUEUE_SIZE, slow_policy: str = "drop_oldest",
+                 supersede=None):
+        if slow_policy not in SLOW_SUBSCRIBER_POLICIES:
+            raise ValueError(f"Unknown slow subscriber policy {slow_policy!r} (valid: {SLOW_SUBSCRIBER_POLICIES})")
+        if queue_size < 1:
+            raise ValueError("The subscriber queue size must be at least 1")
+        self.host = host
+        self.port = port
+        self.command_handler = command_handler
+        self.subscription_parser = subscription_parser or (lambda request: "text")
+        self.supersede = supersede
+        self.commands = ThreadPoolExecutor(max_workers=command_workers, thread_name_prefix="command")
+        self.queue_size = queue_size
+        self.slow_policy = slow_policy
+
+        # Slow-consumer counters
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.slow_disconnects = 0
+
+        self._selector = selectors.DefaultSelector()
+        self._connections = {}          # {socket: _Connection}
+        self._subscribers = set()       # _Connection in "SUB" mode
+        self._streams = {}              # {stream name: set of subscribed _Connection}
+        self._greetings = {}            # {stream name: callable returning the greeting bytes}
+
+        # Work posted from other threads, run by the loop
+        self._calls = collections.deque()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+
+        self._listener = None
+        self._loop_thread = None
+        self._running = False
+
+    # ---- Thread-safe API
+    def call_soon_threadsafe(self, function, *args):
+        """ Run function(*args) on the loop thread. """
+        self._calls.append((function, args))
+        try:
+            self._wakeup_send.send(b"\0")
+        except BlockingIOError:
+            pass    # The loop already has pending wake-ups
+
+    def broadcast(self, message: bytes, stream: str = "text"):
+        """ Queue a message for every subscriber of a stream (callable from any thread). """
+        self.call_soon_threadsafe(self._broadcast, message, stream)
+
+    def set_greeting(self, stream: str, greeting):
+        """
+        Set what new subscribers of a stream receive first: a callable returning
+        bytes, run on the loop thread. Calls are ordered with broadcast(), so a
+        greeting set right after a broadcast describes the state after it.
+        """
+        self.call_soon_threadsafe(self._greetings.__setitem__, stream, greeting)
+
+    def has_subscribers(self, stream: str) -> bool:
+        """ Whether a stream has subscribers, so publishers can skip encoding it. """
+        return bool(self._streams.get(stream))
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscriber_stats(self, timeout: float = 5.0) -> dict:
+        """
+        Slow-consumer counters, read on the loop thread (callable from any thread).
+        Returns:
+            dict: Policy, queue size, global counters (frames broadcast, dropped,
+            slow disconnects) and {addr: {'stream', 'queued', 'dropped'}} per subscriber.
+        """
+        # Before the loop runs (or after it stopped) nothing else touches the subscribers
+        if self._running and threading.current_thread() is not self._loop_thread:
+            future = Future()
+            self.call_soon_threadsafe(lambda: future.set_result(self.subscriber_stats()))
+            return future.result(timeout)
+
+        subscribers = {f"{connection.addr[0]}:{connection.addr[1]}": {'stream': connection.stream, 'queued': len(connection.outbox), 'dropped': connection.dropped}
+                       for connection in self._subscribers}
+        return {
+            'policy': self.slow_policy,
+            'queue_size': self.queue_size,
+            'subscribers': len(subscribers),
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'slow_disconnects': self.slow_disconnects,
+            'sessions': sum(1 for connection in self._connections.values() if connection.mode == "SESSION"),
+            'per_subscriber': subscribers,
+        }
+
+    def stop(self):
+        self.call_soon_threadsafe(self._stop)
+
+    # ---- Loop
+    def serve_forever(self):
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((self.host, self.port))
+        self._listener.listen(socket.SOMAXCONN)
+        self._listener.setblocking(False)
+        self.port = self._listener.getsockname()[1]
+
+        self._selector.register(self._listener, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ, self._drain_calls)
+        print(f"Server listening on {self.host}:{self.port}")
+
+        self._loop_thread = threading.current_thread()
+        self._running = True
+        try:
+            while self._running:
+                for key, events in self._selector.select():
+                    callback = key.data
+                    if callback in (self._accept, self._drain_calls):
+                        callback()
+                    else:
+                        self._service(callback, events)
+        finally:
+            for connection in list(self._connections.values()):
+                self._close(connection)
+            self._selector.unregister(self._listener)
+            self._selector.unregister(self._wakeup_recv)
+            self._listener.close()
+            self.commands.shutdown(wait=False)
+
+    def _stop(self):
+        self._running = False
+
+    def _drain_calls(self):
+        try:
+            while self._wakeup_recv.recv(READ_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+        while self._calls:
+            function, args = self._calls.popleft()
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"Error in event loop call {function.__name__}: {e}")
+
+    def _accept(self):
+        while True:
+            try:
+                sock, addr = self._listener.accept()
+            except BlockingIOError:
+                return
+            except OSError as e:
+                print(f"Error accepting connection: {e}")
+                return
+            print(f"Connected by {addr}")
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = _Connection(sock, addr)
+            self._connections[sock] = connection
+            self._set_events(connection, selectors.EVENT_READ)
+
+    def _service(self, connection: _Connection, events: int):
+        if events & selectors.EVENT_READ:
+            self._read(connection)
+        if events & selectors.EVENT_WRITE and connection.sock in self._connections:
+            self._flush(connection)
+
+    def _read(self, connection: _Connection):
+        try:
+            data = connection.sock.recv(FIRST_READ_SIZE if connection.mode is None else READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"Error receiving from {connection.addr}: {e}")
+            self._close(connection)
+            return
+
+        if not data:
+            if connection.mode == "SESSION":
+                # Finish the commands already received (and a last unterminated one), then close
+                connection.eof = True
+                lines, connection.inbuf = [connection.inbuf], b""
+                self._queue_session_lines(connection, lines)
+                if connection.running or connection.outbox:
+                    self._update_events(connection)
+                    return
+            self._close(connection)
+            return
+
+        if connection.mode is None:
+            text = data.decode('utf-8', errors='ignore').strip()
+            connection.request = text
+            first_line, _, rest = data.partition(b"\n")
+            # Any "SUB..." request subscribes, as before, except a "name:args" command such as "submit_job:..."
+            if text.upper().startswith("SUB") and ":" not in text.split()[0]:
+                self._subscribe(connection)
+            elif first_line.strip().upper() == b"CMD":
+                self._open_session(connection, rest)
+            else:
+                connection.mode = "CMD"
+                # Nothing else is read from a command connection: wait for the reply only
+                self._set_events(connection, 0)
+                future = self.commands.submit(self.command_handler, text)
+                future.add_done_callback(lambda done: self.call_soon_threadsafe(self._reply, connection, done))
+        elif connection.mode == "SUB":
+            # Subscribers only send control lines
+            connection.inbuf += data
+            *lines, connection.inbuf = connection.inbuf.split(b"\n")
+            connection.inbuf = connection.inbuf[-FIRST_READ_SIZE:]
+            for line in lines:
+                if line.strip().upper() == b"RESYNC":
+                    self._greet(connection)
+        elif connection.mode == "SESSION":
+            self._session_data(connection, data)
+
+    # ---- Command sessions
+    def _open_session(self, connection: _Connection, data: bytes):
+        print(f"Client {connection.addr} opened a command session")
+        connection.mode = "SESSION"
+        self._send(connection, b"CMD ready\n")
+        self._session_data(connection, data)
+
+    def _session_data(self, connection: _Connection, data: bytes):
+        connection.inbuf += data
+        *lines, connection.inbuf = connection.inbuf.split(b"\n")
+        # A whole line may arrive in one read, as well as the start of one
+        if any(len(line) > SESSION_MAX_LINE for line in lines + [connection.inbuf]):
+            print(f"Command line longer than {SESSION_MAX_LINE} bytes from {connection.addr}, closing the session")
+            connection.inbuf = b""
+            connection.pending.clear()
+            connection.close_when_sent = True
+            self._send(connection, f"Error: command line longer than {SESSION_MAX_LINE} bytes\n".encode('utf-8'))
+            return
+        self._queue_session_lines(connection, lines)
+        self._update_events(connection)
+
+    def _queue_session_lines(self, connection: _Connection, lines: list):
+        for line in lines:
+            text = line.decode('utf-8', errors='ignore').strip()
+            if not text:
+                continue
+            request_id = None
+            if text.startswith("@"):
+                request_id, _, text = text[1:].partition(" ")
+                text = text.strip()
+            connection.pending.append((request_id, text))
+        self._run_next(connection)
+
+    def _run_next(self, connection: _Connection):
+        # One command of a session at a time, so they run in the order they were sent
+        if connection.running:
+            return
+        while connection.pending:
+            request_id, text = connection.pending.popleft()
+            reply = None
+            if self.supersede is not None and connection.pending:
+                try:
+                    reply = self.supersede(text, [later for _, later in connection.pending])
+                except Exception as e:
+                    print(f"Error checking superseded command from {connection.addr}: {e}")
+            if reply is None:
+                break
+            self._send(connection, self._session_prefix(request_id) + reply)
+        else:
+            return
+        connection.running = True
+        future = self.commands.submit(self.command_handler, text)
+        future.add_done_callback(lambda done: self.call_soon_threadsafe(self._session_reply, connection, request_id, done))
+
+    @staticmethod
+    def _session_prefix(request_id) -> bytes:
+        return b"" if request_id is None else b"@" + request_id.encode('utf-8') + b" "
+
+    def _session_reply(self, connection: _Connection, request_id, future):
+        connection.running = False
+        if connection.sock not in self._connections:
+            return
+        try:
+            reply = future.result()
+        except Exception as e:
+            print(f"Error handling command from {connection.addr}: {e}")
+            reply = b"Error handling command " + str(e).encode('utf-8') + b"\n"
+        # Reply before starting the next command: the superseded replies it may
+        # send belong to later commands, so the replies stay in submission order
+        self._send(connection, self._session_prefix(request_id) + reply)
+        if connection.sock not in self._connections:
+            return
+        self._run_next(connection)
+        self._update_events(connection)
+
+    def _greet(self, connection: _Connection):
+        greeting = self._greetings.get(connection.stream)
+        if greeting is None:
+            return
+        message = greeting()
+        if message:
+            self._send(connection, message)
+
+    def _subscribe(self, connection: _Connection):
+        try:
+            stream = self.subscription_parser(connection.request)
+            stream, backlog = stream if isinstance(stream, tuple) else (stream, None)
+        except ValueError as e:
+            print(f"Rejected subscription {connection.request!r} from {connection.addr}: {e}")
+            connection.mode = "CMD"
+            connection.close_when_sent = True
+            self._send(connection, f"Error: {e}\n".encode('utf-8'))
+            return
+
+        print(f"Client {connection.addr} connected in subscriber mode ({stream})")
+        connection.mode = "SUB"
+        connection.stream = stream
+        sock = connection.sock
+        # Detect dead peers sooner
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+        except OSError:
+            pass    # Not supported by every OS
+        self._subscribers.add(connection)
+        self._streams.setdefault(stream, set()).add(connection)
+        if backlog is not None:
+            data = backlog()
+            if data:
+                self._send(connection, data)
+        self._greet(connection)
+
+    def _reply(self, connection: _Connection, future):
+        if connection.sock not in self._connections:
+            return      # The client went away while the command was running
+        try:
+            reply = future.result()
+        except Exception as e:
+            print(f"Error handling command from {connection.addr}: {e}")
+            reply = b"Error handling command " + str(e).encode('utf-8') + b"\n"
+        connection.close_when_sent = True
+        self._send(connection, reply)
+
+    def _broadcast(self, message: bytes, stream: str):
+        self.frames_sent += 1
+        for connection in list(self._streams.get(stream, ())):
+            self._enqueue(connection, message)
+
+    def _enqueue(self, connection: _Connection, frame: bytes):
+        # Bounded queue of a subscriber: apply the slow-consumer policy when full
+        outbox = connection.outbox
+        if len(outbox) >= self.queue_size:
+            if self.slow_policy == "disconnect":
+                print(f"Subscriber {connection.addr} is too slow ({len(outbox)} frames queued), disconnecting")
+                self.slow_disconnects += 1
+                self._close(connection)
+                return
+            # The head frame may be partially sent: it must be completed
+            keep = 1 if connection.offset else 0
+            drop = len(outbox) - keep if self.slow_policy == "coalesce" else len(outbox) - self.queue_size + 1
+            drop = min(drop, len(outbox) - keep)
+            if keep:
+                head = outbox.popleft()
+            for _ in range(drop):
+                outbox.popleft()
+            if keep:
+                outbox.appendleft(head)
+            connection.dropped += drop
+            self.frames_dropped += drop
+        self._send(connection, frame)
+
+    def _send(self, connection: _Connection, data: bytes):
+        was_empty = not connection.outbox
+        connection.outbox.append(data)
+        if was_empty:
+            self._flush(connection)
+
+    def _flush(self, connection: _Connection):
+        outbox = connection.outbox
+        try:
+            while outbox:
+                head = outbox[0]
+                sent = connection.sock.send(memoryview(head)[connection.offset:])
+                connection.offset += sent
+                if connection.offset < len(head):
+                    break
+                outbox.popleft()
+                connection.offset = 0
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            print(f"Error sending data to client {connection.addr}: {e}")
+            self._close(connection)
+            return
+
+        if not outbox and (connection.close_when_sent or (connection.eof and not connection.running and not connection.pending)):
+            self._close(connection)
+        else:
+            self._update_events(connection)
+
+    def _update_events(self, connection: _Connection):
+        if connection.sock not in self._connections:
+            return
+        if connection.mode == "SUB":
+            reading = True
+        elif connection.mode == "SESSION":
+            # Back-pressure: stop reading a session with too many commands queued
+            reading = not connection.eof and not connection.close_when_sent and len(connection.pending) < SESSION_MAX_PENDING
+        else:
+            reading = False
+        events = (selectors.EVENT_READ if reading else 0) | (selectors.EVENT_WRITE if connection.outbox else 0)
+        self._set_events(connection, events)
+
+    def _set_events(self, connection: _Connection, events: int):
+        if events == connection.events:
+            return
+        if not events:
+            self._selector.unregister(connection.sock)
+        elif not connection.events:
+            self._selector.register(connection.sock, events, connection)
+        else:
+            self._selector.modify(connection.sock, events, connection)
+        connection.events = events
+
+    def _close(self, connection: _Connection):
+        if self._connections.pop(connection.sock, None) is None:
+            return
+        self._subscribers.discard(connection)
+        if connection.stream is not None:
+            subscribers = self._streams.get(connection.stream)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self._streams[connection.stream]
+        if connection.events:
+            self._selector.unregister(connection.sock)
+            connection.events = 0
+        try:
+            connection.sock.close()
+        except OSError:
+            pass
+        print(f"Connection with {connection.addr} closed")
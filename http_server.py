@@ -1,12 +1,31 @@
 from http.server import BaseHTTPRequestHandler, HTTPServer
+from collections import deque
 import json
 import socket
 import threading
 import time
+import urllib.request
+
+import wire_format
+from command_session import CommandSession
 
 # Configuration for the TCP socket server
 TCP_HOST = '127.0.0.1'      #Replace with the Raspberry Pi's IP address: 192.168.38.3
 TCP_PORT = 65432 
+METRICS_PORT = 9100         # Metrics port of the TCP server, mirrored at /metrics
+
+# Commands are sent through one persistent, pipelined command session (see command_session.py)
+command_session = CommandSession(TCP_HOST, TCP_PORT)
+
+# Subscribe to the typed binary frames (see wire_format.py) instead of parsing the text line
+USE_BINARY_FEED = True
+
+# Chart history served by /get-history, filled from the TCP server backlog on (re)connection
+HISTORY_FIELDS = ("50K", "4K", "STILL", "MXC", "setpoint")
+HISTORY_PERIOD = 1.0        # Seconds between kept ticks: the server ticks faster (0.25 s in "scan" mode)
+HISTORY_SIZE = 6 * 3600     # 6 hours at one tick per HISTORY_PERIOD, the window of the TCP server history
+history = deque(maxlen=HISTORY_SIZE)    # (timestamp, value of each HISTORY_FIELDS)
+last_timestamp = None       # Timestamp of the last tick received, to resume after a reconnection
 
 # Global variables to store the latest temperature data
 current_50K = None
@@ -49,6 +68,10 @@ current_enabled_MXC = None
 current_enabled_50K = None
 current_enabled_4K = None
 current_enabled_STILL = None
+current_age_50K = None
+current_age_4K = None
+current_age_STILL = None
+current_age_MXC = None
 
 class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
 
@@ -101,10 +124,40 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
                                    "enabledMXC": current_enabled_MXC,
                                    "enabled50K": current_enabled_50K,
                                    "enabled4K": current_enabled_4K,
-                                   "enabledSTILL": current_enabled_STILL
+                                   "enabledSTILL": current_enabled_STILL,
+                                   "age50K": current_age_50K,
+                                   "age4K": current_age_4K,
+                                   "ageSTILL": current_age_STILL,
+                                   "ageMXC": current_age_MXC
                                 })
                                    
             self.wfile.write(response.encode('utf-8'))
+
+        elif self.path == '/get-history':
+            # Past values for the charts: {"time": [s since epoch], "50K": [...], ...}
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            ticks = list(history)
+            response = {"time": [tick[0] for tick in ticks]}
+            for index, name in enumerate(HISTORY_FIELDS, start=1):
+                response[name] = [tick[index] for tick in ticks]
+            self.wfile.write(json.dumps(response).encode('utf-8'))
+
+        elif self.path == '/metrics':
+            # OpenMetrics text of the TCP server (acquisition, serial link, subscribers, commands)
+            try:
+                with urllib.request.urlopen(f"http://{TCP_HOST}:{METRICS_PORT}/metrics", timeout=5) as reply:
+                    body = reply.read()
+                    content_type = reply.headers.get('Content-Type', 'text/plain; charset=utf-8')
+            except Exception as e:
+                print(f"Error reading the TCP server metrics: {e}")
+                self.send_error(502, f"TCP server metrics unavailable: {e}")
+                return
+            self.send_response(200)
+            self.send_header('Content-type', content_type)
+            self.end_headers()
+            self.wfile.write(body)
         else:
             self.send_error(404)
 
@@ -121,34 +174,30 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             self.send_header('Content-type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps({"status": response}).encode('utf-8'))
+        elif self.path == '/submit-job':
+            # Slow commands (e.g. set_channel_mxc:1) as a job: the reply is the job id at once,
+            # the outcome is read later with the command "get_job:<id>"
+            content_length = int(self.headers['Content-Length'])
+            data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            response = self.send_command_to_tcp_server(f"submit_job:{data.get('command')}")
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({"status": response}).encode('utf-8'))
         else:
             self.send_error(404)
 
     def send_command_to_tcp_server(self, command):
         """
-        This function creates a new TCP socket called command_socket to send
-        the commands to the TCP server. In this way, the continuous sensor
-        data transmission from the TCP server to the HTTP server is not interrupted.
-        Each POST /send-command request creates a short-lived socket connection
-        to send the command and receive a response.
+        Send a command to the TCP server through the persistent command session
+        (a connection separate from the sensor data subscription, so the
+        continuous data transmission is not interrupted). The session is opened
+        on the first command and reused by the next ones, with no TCP handshake
+        per POST /send-command request.
         """
 
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as command_socket:
-                command_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-                command_socket.settimeout(10)
-                command_socket.connect((TCP_HOST, TCP_PORT))
-                command_socket.sendall(command.encode('utf-8'))
-
-                # Read exactly one line (newline-delimited by the TCP server)
-                buf = b""
-                while b"\n" not in buf:
-                    chunk = command_socket.recv(4096)
-                    if not chunk:
-                        break
-                    buf += chunk
-                response = buf.decode('utf-8', errors='ignore').strip()
-
+            response = command_session.send(command).strip()
             return response or "Error: empty reply from TCP server"
         except Exception as e:
             print(f"Error sending command to TCP server: {e}")
@@ -163,8 +212,14 @@ def connect_to_tcp_server():
         tcp_socket.settimeout(20)
         print(f"Connecting to TCP server at {TCP_HOST}:{TCP_PORT}...")
         tcp_socket.connect((TCP_HOST, TCP_PORT))
-        # Identify as sensor data subscriber
-        tcp_socket.sendall(b'SUB\n')
+        # Identify as sensor data subscriber. The binary feed starts with the server history
+        # (everything on the first connection, what was missed on a reconnection)
+        if not USE_BINARY_FEED:
+            tcp_socket.sendall(b'SUB\n')
+        elif last_timestamp is None:
+            tcp_socket.sendall(b'SUB BIN REPLAY\n')
+        else:
+            tcp_socket.sendall(f'SUB BIN since={last_timestamp!r}\n'.encode('utf-8'))
         print(f"Connected to TCP server.")
         return tcp_socket
     except Exception as e:
@@ -198,6 +253,11 @@ def receive_sensor_data(tcp_socket):
     global current_enabled_50K
     global current_enabled_4K
     global current_enabled_STILL
+
+    global current_age_50K
+    global current_age_4K
+    global current_age_STILL
+    global current_age_MXC
     
     global current_mxc_temperature_setpoint
     global current_mxc_proportional_gain
@@ -223,13 +283,26 @@ def receive_sensor_data(tcp_socket):
     global current_proportional_gain
     global current_integral_gain
     global current_derivative_gain
+    global last_timestamp
 
     buf = b""
+    reader = wire_format.FrameReader()
     while True:
         try:
             chunk = tcp_socket.recv(4096)  # bigger read is fine
             if not chunk:
                 raise ConnectionError("Sensor data socket closed by server")
+
+            if USE_BINARY_FEED:
+                for seq, timestamp, fields in reader.feed(chunk):
+                    if last_timestamp is not None and timestamp <= last_timestamp:
+                        continue    # Already received (the end of a backlog may also arrive live)
+                    last_timestamp = timestamp
+                    if not history or timestamp - history[-1][0] >= HISTORY_PERIOD:
+                        history.append((timestamp, *(fields.get(name) for name in HISTORY_FIELDS)))
+                    _apply_binary_fields(fields)
+                continue
+
             buf += chunk
 
             # Process complete lines
@@ -329,12 +402,19 @@ def receive_sensor_data(tcp_socket):
                 except Exception as e:
                     print(f"Error parsing enabled 50K/4K/STILL variables: {e}")
 
+                # Age (s) of each reading; absent from older servers
+                try:
+                    current_age_50K, current_age_4K, current_age_STILL, current_age_MXC = _organize_age_data(params[41:45])
+                except Exception as e:
+                    print(f"Error parsing reading ages: {e}")
+
 
         except Exception as e:
             print(f"Error receiving LakeShore370 data: {e}")
             try:
                 tcp_socket = connect_to_tcp_server()
                 buf = b""  # reset buffer on reconnect
+                reader = wire_format.FrameReader()
             except Exception as e:
                 print(f"Error reconnecting to TCP server: {e}")
                 time.sleep(5)
@@ -358,6 +438,51 @@ def run(server_class=HTTPServer, handler_class=SimpleHTTPRequestHandler,
     httpd.serve_forever()
 
 # ---- Helper functions ----
+
+# Binary feed field -> global variable it updates
+BINARY_FIELD_GLOBALS = {
+    "50K": "current_50K", "4K": "current_4K", "STILL": "current_STILL", "MXC": "current_MXC",
+    "MXCSP": "current_mxc_temperature_setpoint",
+    "MXCP": "current_mxc_proportional_gain",
+    "MXCI": "current_mxc_integral_gain",
+    "MXCD": "current_mxc_derivative_gain",
+    "MXCHR": "current_mxc_heater_range",
+    "dwellMXC": "current_dwell_MXC", "pauseMXC": "current_pause_MXC",
+    "modeMXC": "current_excitation_mode_MXC",
+    "rangeMXC": "current_excitation_range_MXC",
+    "autorangeMXC": "current_excitation_autorange_MXC",
+    "dwell_50K": "current_dwell_50K", "dwell_4K": "current_dwell_4K", "dwell_STILL": "current_dwell_STILL",
+    "pause_50K": "current_pause_50K", "pause_4K": "current_pause_4K", "pause_STILL": "current_pause_STILL",
+    "setpoint": "current_temperature_setpoint",
+    "heater_power": "current_heater_power",
+    "heater_range": "current_heater_range",
+    "temperature_limit": "current_temperature_limit",
+    "timeout": "current_timeout",
+    "proportional_gain": "current_proportional_gain",
+    "integral_gain": "current_integral_gain",
+    "derivative_gain": "current_derivative_gain",
+    "R50K": "current_R50K", "R4K": "current_R4K", "RSTILL": "current_RSTILL", "RMXC": "current_RMXC",
+    "P50K": "current_P50K", "P4K": "current_P4K", "PSTILL": "current_PSTILL", "PMXC": "current_PMXC",
+    "enabledMXC": "current_enabled_MXC", "enabled50K": "current_enabled_50K",
+    "enabled4K": "current_enabled_4K", "enabledSTILL": "current_enabled_STILL",
+    "age50K": "current_age_50K", "age4K": "current_age_4K", "ageSTILL": "current_age_STILL", "ageMXC": "current_age_MXC",
+}
+
+def _apply_binary_fields(fields):
+
+    # Same representation as the text parsing: MXC setpoint in mK, settings as strings, times as floats
+    values = dict(fields)
+    if values.get("MXCSP") is not None:
+        values["MXCSP"] = values["MXCSP"] * 1000
+    for name in ("MXCHR", "modeMXC", "rangeMXC", "autorangeMXC"):
+        if values.get(name) is not None:
+            values[name] = str(values[name])
+    for name in ("dwellMXC", "pauseMXC", "dwell_50K", "dwell_4K", "dwell_STILL", "pause_50K", "pause_4K", "pause_STILL"):
+        if values.get(name) is not None:
+            values[name] = float(values[name])
+
+    globals().update({BINARY_FIELD_GLOBALS[name]: value for name, value in values.items() if name in BINARY_FIELD_GLOBALS})
+
 def _organize_temperature_data(params):
 
     current_50K = params[0].split(':')[-1].strip()
@@ -490,6 +615,19 @@ def _organize_power_data(params):
 
     return current_P50K, current_P4K, current_PSTILL, current_PMXC
 
+def _organize_age_data(params):
+
+    ages = []
+    for param in params:
+        value = param.split(':')[-1].strip()
+        try:
+            ages.append(float(value))
+        except ValueError:
+            ages.append(None)   # "None" when the age of the reading is unknown
+
+    ages += [None] * (4 - len(ages))
+    return tuple(ages)
+
 def _organize_control_params(params):
 
     try:
@@ -2,8 +2,11 @@ import pyvisa
 import threading
 import time
 
-# Shared mutex lock for safe device access
-_lakeshore_mutex = threading.Lock()
+from command_stats import CommandStats
+
+# Shared mutex lock for safe device access (re-entrant, so that a transaction
+# such as update_inset can hold it across several paced I/O calls)
+_lakeshore_mutex = threading.RLock()
 
 DEFAULT_CHANNELS = [1, 2, 5, 6]
 DEFAULT_CHANNELS_ID = ["50K", "4K", "STILL", "MXC"]
@@ -86,6 +89,25 @@ DEFAULT_CURVES = {
     6 : 4,
 }
 
+# Calibration curve memory: curves 1 to 20, up to 200 breakpoints each
+MAX_CURVES = 20
+MAX_CURVE_POINTS = 200
+
+# INSET record fields, in the order used by the INSET command, and their limits
+INSET_FIELDS = ("enabled", "dwell", "pause", "curve", "tempco")
+INSET_LIMITS = {
+    "enabled": (0, 1),
+    "dwell": (1, 200),
+    "pause": (3, 200),
+    "curve": (0, 20),
+    "tempco": (1, 2),
+}
+
+# Chained queries are joined with ';' and answered with ';'-separated replies.
+# Keep each chained line short enough for the instrument input buffer.
+QUERY_SEPARATOR = ";"
+MAX_CHAINED_QUERY_LENGTH = 64
+
 class LakeShore370:
 
     """A class to interface with the Lake Shore 370 temperature controller.
@@ -95,23 +117,154 @@ class LakeShore370:
         addr (str): The VISA address of the device.
         baud_rate (int): The baud rate for serial communication.
         timeout (int): The timeout for device communication in milliseconds.
+        inset_cache_ttl (float): Seconds an INSET? record is served from the cache
+            before it is read again from the device.
+        min_command_interval (float): Minimum time in seconds between the end of a
+            query and the next command sent to the device.
+        write_settle_time (float): Minimum time in seconds between a settings
+            write and the next command sent to the device.
+        visa_library (str): pyvisa backend, e.g. '@py' (default: pyvisa's choice).
+        stats_window (int): Number of timing samples kept per command for
+            get_command_stats.
     """
     #! -- Initialization -- #
     def __init__(self,
                  addr = 'ASRL/dev/ttyUSB0::INSTR',
                  baud_rate = 9600,
-                 timeout = 2000):
-
-        self.rm = pyvisa.ResourceManager()
+                 timeout = 2000,
+                 inset_cache_ttl = 10.0,
+                 min_command_interval = 0.05,
+                 write_settle_time = 0.1,
+                 visa_library = '',
+                 stats_window = 1000):
+
+        self.rm = pyvisa.ResourceManager(visa_library)
         self.device = self.rm.open_resource(addr)
-        self.device.baud_rate = baud_rate
-        self.device.data_bits = 7
-        self.device.stop_bits = pyvisa.constants.StopBits.one
-        self.device.parity = pyvisa.constants.Parity.odd
+        # Serial line settings only apply to serial resources (not e.g. to the
+        # TCPIP::...::SOCKET resource of lakeshore370_emulator)
+        if addr.upper().startswith("ASRL"):
+            self.device.baud_rate = baud_rate
+            self.device.data_bits = 7
+            self.device.stop_bits = pyvisa.constants.StopBits.one
+            self.device.parity = pyvisa.constants.Parity.odd
         self.device.write_termination = '\r\n'
         self.device.read_termination = '\r\n'
         self.device.timeout = timeout  # milliseconds
+
+        # Per-channel cache of INSET? records: {channel: (fields, timestamp)}
+        # fields = [on/off, dwell, pause, curve, temperature coefficient]
+        self.inset_cache_ttl = inset_cache_ttl
+        self._inset_cache = {}
+
+        # Pacing: the next command may not be sent before self._ready_at
+        self.min_command_interval = min_command_interval
+        self.write_settle_time = write_settle_time
+        self._ready_at = 0.0
+
+        # Rolling lock / round-trip / parse timings per command (see command_stats.py)
+        self.command_stats = CommandStats(stats_window)
+
+    #! -- Paced device I/O -- #
+    def _query(self, command: str, parse=None):
+        """
+        Send a query once the device is ready for it and return the raw reply,
+        or parse(reply) if a parser is given (its time is recorded as parse time).
+        """
+        requested = time.perf_counter()
+        with _lakeshore_mutex:
+            self._wait_until_ready()
+            sent = time.perf_counter()
+            error = None
+            try:
+                response = self.device.query(command)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self._ready_at = time.monotonic() + self.min_command_interval
+                self.command_stats.record_io(command, sent - requested, time.perf_counter() - sent, error)
+
+        if parse is None:
+            return response
+        return self._timed_parse(command, parse, response)
+
+    def _write(self, command: str):
+        """ Send a command once the device is ready for it. """
+        requested = time.perf_counter()
+        with _lakeshore_mutex:
+            self._wait_until_ready()
+            sent = time.perf_counter()
+            error = None
+            try:
+                self.device.write(command)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self._ready_at = time.monotonic() + self.write_settle_time
+                self.command_stats.record_io(command, sent - requested, time.perf_counter() - sent, error)
+
+    def _timed_parse(self, command: str, parse, reply: str):
+        started = time.perf_counter()
+        try:
+            return parse(reply)
+        finally:
+            self.command_stats.record_parse(command, time.perf_counter() - started)
+
+    def get_command_stats(self, reset: bool = False) -> dict:
+        """
+        Get the rolling timing statistics of the commands sent to the device.
+        Args:
+            reset (bool): Clear the statistics after reading them.
+        Returns:
+            dict: {mnemonic: {'count', 'timeouts', 'errors', 'lock', 'rtt', 'parse'}}, each
+            phase with its sample count, p50, p95, p99 and max in milliseconds.
+        """
+        summary = self.command_stats.summary()
+        if reset:
+            self.command_stats.reset()
+        return summary
+
+    def _wait_until_ready(self):
+        # Only wait for whatever is left of the spacing since the last I/O
+        remaining = self._ready_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
     
+    #! -- INSET cache -- #
+    def get_inset_settings(self, channel: int, refresh: bool = False) -> list:
+        """
+        Get the INSET record of a channel as a list of strings:
+        [on/off, dwell time, pause time, curve number, temperature coefficient].
+        The record is served from the cache while it is younger than
+        inset_cache_ttl, unless refresh is True.
+        Raises:
+            Exception: If there is an error communicating with the device.
+        """
+        cached = self._inset_cache.get(channel)
+        if not refresh and cached is not None and time.monotonic() - cached[1] < self.inset_cache_ttl:
+            return list(cached[0])
+
+        response = self._query(f"INSET? {channel}")
+        fields = [field.strip() for field in response.strip().split(",")]
+        if len(fields) < 5:
+            raise ValueError(f"Unexpected INSET? reply for channel {channel}: {response!r}")
+        self._store_inset(channel, fields)
+        return list(fields)
+
+    def clear_inset_cache(self, channel: int | None = None):
+        """
+        Drop the cached INSET record of a channel (or of every channel if None),
+        so that the next read goes to the device.
+        """
+        if channel is None:
+            self._inset_cache.clear()
+        else:
+            self._inset_cache.pop(channel, None)
+
+    def _store_inset(self, channel: int, fields: list):
+        self._inset_cache[channel] = ([str(field).strip() for field in fields[:5]], time.monotonic())
+
     #! -- Device get Methods -- #
     def get_temperature(self, channel: int):
         """ 
@@ -119,9 +272,7 @@ class LakeShore370:
             Given in Kelvin
         """
         try:
-            with _lakeshore_mutex:
-                response = self.device.query(f"RDGK? {channel}")
-            return float(response.strip())
+            return self._query(f"RDGK? {channel}", parse=float)
         except Exception as e:
             print(f"Reading channel {channel} failed.\nReason: {e}")
             return None
@@ -132,9 +283,7 @@ class LakeShore370:
             Given in Ohms
         """
         try:
-            with _lakeshore_mutex:
-                response = self.device.query(f"RDGR? {channel}")
-            return float(response.strip())
+            return self._query(f"RDGR? {channel}", parse=float)
         except Exception as e:
             print(f"Reading channel {channel} failed.\nReason: {e}")
             return None
@@ -145,21 +294,16 @@ class LakeShore370:
             Given in Watts
         """
         try:
-            with _lakeshore_mutex:
-                response = self.device.query(f"RDGPWR? {channel}")
-            return float(response.strip())
+            return self._query(f"RDGPWR? {channel}", parse=float)
         except Exception as e:
             print(f"Reading channel {channel} failed.\nReason: {e}")
             return None
 
     def get_channel_status(self, channel: int, verbose=False):
         try:
-            with _lakeshore_mutex:
-                response = self.device.query(f"INSET? {channel}")
-            status = int(response.split(",")[0])
-            #time.sleep(0.1)  # Wait for the device to respond
+            status = int(self.get_inset_settings(channel)[0])
             if verbose:
-                if status == '1':
+                if status == 1:
                     print(f"Channel {channel} is ON.")
                 else:
                     print(f"Channel {channel} is OFF.")
@@ -183,9 +327,7 @@ class LakeShore370:
             return None
 
         try:
-            with _lakeshore_mutex:
-                response = self.device.query(f"SETP? {channel}")
-            return float(response.strip())
+            return self._query(f"SETP? {channel}", parse=float)
 
         except Exception as e:
             print(f"Getting temperature setpoint for channel {channel} failed.\nReason: {e}")
@@ -194,9 +336,7 @@ class LakeShore370:
     def get_temperature_setpoint(self):
         try:
             channel = 6 # MXC channel
-            with _lakeshore_mutex:
-                response = self.device.query(f"SETP? {channel}")
-            return float(response.strip())
+            return self._query(f"SETP? {channel}", parse=float)
         except Exception as e:
             print(f"Getting temperature setpoint for channel {channel} failed.\nReason: {e}")
             return None
@@ -215,16 +355,7 @@ class LakeShore370:
             dict: A dictionary containing the control parameters.
         """
         try:
-            with _lakeshore_mutex:
-                response = self.device.query("PID?")
-            parameters = response.split(",")
-            control_params = {
-                "P": float(parameters[0]),
-                "I": float(parameters[1]),
-                "D": float(parameters[2]),
-            }
-            
-            return control_params
+            return self._query("PID?", parse=_parse_pid_reply)
         
         except Exception as e:
             print(f"Getting control parameters failed.\nReason: {e}")
@@ -232,9 +363,7 @@ class LakeShore370:
 
     def get_dwell_time(self, channel: int):
         try:
-            with _lakeshore_mutex:
-                response = self.device.query(f"INSET? {channel}")
-            dwell_time = int(response.split(",")[1])
+            dwell_time = int(self.get_inset_settings(channel)[1])
             return dwell_time
         except Exception as e:
             print(f"Getting dwell time for channel {channel} failed.\nReason: {e}")
@@ -242,9 +371,7 @@ class LakeShore370:
     
     def get_pause_time(self, channel: int):
         try:
-            with _lakeshore_mutex:
-                response = self.device.query(f"INSET? {channel}")
-            pause_time = int(response.split(",")[2])
+            pause_time = int(self.get_inset_settings(channel)[2])
             return pause_time
         except Exception as e:
             print(f"Getting pause time for channel {channel} failed.\nReason: {e}")
@@ -257,12 +384,53 @@ class LakeShore370:
         """
         
         try:
-            current_status = self.device.query("SCAN?")
+            current_status = self._query("SCAN?")
             return current_status.split(",")
         except Exception as e:
             print(f"Could not read current autoscan status. Reason: {e}")
             return None
     
+    def query_many(self, queries: list) -> list:
+        """
+        Send several queries chained in as few transactions as possible.
+        Args:
+            queries (list): Query strings, e.g. ["RDGK? 6", "RDGR? 6", "PID?"].
+        Returns:
+            list: One typed result per query, in the same order (see
+            QUERY_PARSERS). A query whose reply could not be read or parsed
+            yields None.
+        """
+        results = []
+        for batch in _chain_queries(queries):
+            try:
+                response = self._query(QUERY_SEPARATOR.join(batch))
+                replies = response.strip().split(QUERY_SEPARATOR)
+                if len(replies) != len(batch):
+                    raise ValueError(f"expected {len(batch)} replies, got {len(replies)}: {response!r}")
+            except Exception as e:
+                print(f"Chained query {batch} failed.\nReason: {e}")
+                results.extend([None] * len(batch))
+                continue
+
+            for query, reply in zip(batch, replies):
+                results.append(self._parse_reply(query, reply))
+
+        return results
+
+    def _parse_reply(self, query: str, reply: str):
+        mnemonic, _, argument = query.strip().partition(" ")
+        parser = QUERY_PARSERS.get(mnemonic.upper(), str.strip)
+        try:
+            value = self._timed_parse(query, parser, reply)
+        except Exception as e:
+            print(f"Parsing reply {reply!r} to {query!r} failed.\nReason: {e}")
+            return None
+
+        # Only a record of a known channel can be cached
+        if mnemonic.upper() == "INSET?" and argument.strip().isdigit():
+            self._store_inset(int(argument), value)
+        return value
+
     #! --- Multichannel Get methods ----- #
     
     def get_channels_on(self):
@@ -339,8 +507,7 @@ class LakeShore370:
         """
 
         try:
-            with _lakeshore_mutex:
-                response = self.device.query("CSET?")
+            response = self._query("CSET?")
             
             if return_dict: 
                 control_params = response.strip().split(",")
@@ -389,10 +556,8 @@ class LakeShore370:
         """
 
         try:
-            with _lakeshore_mutex:
-                response = self.device.query("HTRRNG?")
+            response = self._query("HTRRNG?")
             control_heater_range = response.strip()
-            time.sleep(0.1)  # Wait for the device to respond
             control_settings = self.get_control_settings()
             control_heater_display = control_settings[4]
             if control_heater_display == '1':
@@ -424,8 +589,7 @@ class LakeShore370:
             return None
         
         try:
-            with _lakeshore_mutex:
-                response = self.device.query(f"RDGRNG? {channel}")
+            response = self._query(f"RDGRNG? {channel}")
             
             values = response.strip().split(",")
 
@@ -438,6 +602,60 @@ class LakeShore370:
             print(f"Getting sensor resistance settings for channel {channel} failed.\nReason: {e}")
             return None
 
+    #! -- Calibration curves -- #
+
+    def get_curve_header(self, curve_number: int) -> list | None:
+
+        """
+        Get the header of a calibration curve.
+        Args:
+            curve_number (int): The curve number (1 to 20).
+        Returns:
+            list: [name, serial number, format, limit value, temperature coefficient]
+            as strings, or None if the query failed.
+        """
+
+        if curve_number < 1 or curve_number > MAX_CURVES:
+            print(f"Curve number must be between 1 and {MAX_CURVES}")
+            return None
+
+        header = self.query_many([f"CRVHDR? {int(curve_number)}"])[0]
+        if header is None or len(header) < 5:
+            print(f"Unexpected header for curve {curve_number}: {header}")
+            return None
+        return header
+
+    def get_curve_points(self, curve_number: int, chunk: int = 20) -> list | None:
+
+        """
+        Get the breakpoints of a calibration curve. The points are read in chained
+        chunks and the download stops at the first empty (0, 0) point.
+        Args:
+            curve_number (int): The curve number (1 to 20).
+            chunk (int): Number of points requested per transaction.
+        Returns:
+            list: [(units value, temperature)] in the instrument order, or None if
+            a point could not be read.
+        """
+
+        if curve_number < 1 or curve_number > MAX_CURVES:
+            print(f"Curve number must be between 1 and {MAX_CURVES}")
+            return None
+
+        points = []
+        for start in range(1, MAX_CURVE_POINTS + 1, chunk):
+            indices = range(start, min(start + chunk, MAX_CURVE_POINTS + 1))
+            replies = self.query_many([f"CRVPT? {int(curve_number)},{index}" for index in indices])
+            for index, reply in zip(indices, replies):
+                if reply is None or len(reply) < 2:
+                    print(f"Reading point {index} of curve {curve_number} failed.")
+                    return None
+                units, temperature = reply[0], reply[1]
+                if units == 0 and temperature == 0:
+                    return points
+                points.append((units, temperature))
+        return points
+
     # ! -- Device set Methods -- #
 
     def set_temperature_setpoint(self, value: float, units: str = 'K', verbose=False):
@@ -446,30 +664,22 @@ class LakeShore370:
             print("Units must be 'K' or 'Ohms'.")
             return
         try:
-            with _lakeshore_mutex:
-                self.device.write(f"SETP {value}")
+            self._write(f"SETP {value}")
             if verbose: print(f"Set temperature setpoint to {value} {units}.")
         except Exception as e:
             print(f"Setting temperature setpoint failed.\nReason: {e}")
 
     def set_channel_off(self, channel: int, verbose: bool = False):
         try:
-            parameters = self.device.query(f"INSET? {channel}").split(",")
-            time.sleep(0.5)  # Wait for the device to respond
-            if parameters[0] == '0':
+            if self.get_inset_settings(channel)[0] == '0':
                 print(f"Channel {channel} is already off.")
                 return False
-                
-            else:
-                dwell = parameters[1]
-                pause = parameters[2]
-                curve = parameters[3]
-                temp_coeff = parameters[4]
-                if verbose: print(f"Setting channel {channel} off.")
-                self.device.write(f"INSET {channel},0,{dwell},{pause},{curve},{temp_coeff}")
-                if verbose: print(f"Channel {channel} is now set off")
-                # if the other parameters are not specificied command won't work
-                return True
+
+            if verbose: print(f"Setting channel {channel} off.")
+            if not self.update_inset(channel, enabled=0):
+                return False
+            if verbose: print(f"Channel {channel} is now set off")
+            return True
 
         except Exception as e:
             print(f"Setting channel {channel} off failed.\nReason: {e}")
@@ -482,35 +692,23 @@ class LakeShore370:
             return False
 
         if settings is None:
-            try:
-                with _lakeshore_mutex:
-                    parameters = self.device.query(f"INSET? {channel}").split(",")
-                time.sleep(0.5)  # Wait for the device to respond
-                dwell = parameters[1]
-                pause = parameters[2]
-                curve = parameters[3]
-                temp_coeff = parameters[4]
-                if verbose: print(f"Setting channel {channel} on.")
-                self.device.write(f"INSET {channel},1,{dwell},{pause},{curve},{temp_coeff}")
-                if verbose: print(f"Channel {channel} is set on with parameters: {dwell}, {pause}, {curve}, {temp_coeff}")
-                return True
-            except Exception as e:
-                print(f"Reading channel {channel} parameters failed when switching on.\nReason: {e}")
+            if verbose: print(f"Setting channel {channel} on.")
+            if not self.update_inset(channel, enabled=1):
+                print(f"Switching channel {channel} on failed.")
                 return False
+            if verbose: print(f"Channel {channel} is set on with parameters: {self.get_inset_settings(channel)[1:]}")
+            return True
         else: 
             if len(settings) != 4:
                 print("Settings must be a list of 4 elements: [dwell time, pause time, curve number, temperature coefficient]")
                 return False
             dwell, pause, curve, temp_coeff = settings
             
-            try:
-                with _lakeshore_mutex:
-                    self.device.write(f"INSET {channel},1,{dwell},{pause},{curve},{temp_coeff}")
-                print(f"Channel {channel} is set on with custom parameters: {dwell}, {pause}, {curve}, {temp_coeff}")
-                return True
-            except Exception as e:
-                print(f"Setting channel {channel} on failed.\nReason: {e}")
+            if not self.update_inset(channel, enabled=1, dwell=dwell, pause=pause, curve=curve, tempco=temp_coeff):
+                print(f"Setting channel {channel} on failed.")
                 return False
+            print(f"Channel {channel} is set on with custom parameters: {dwell}, {pause}, {curve}, {temp_coeff}")
+            return True
 
     def set_autoscan(self, status: bool | str = "Off", channel: int = 6) -> bool:
         
@@ -535,7 +733,7 @@ class LakeShore370:
 
         # Read current status from the instrument
         try:
-            current_status = self.device.query("SCAN?")  # e.g., "... ,0" or "... ,1"
+            current_status = self._query("SCAN?")  # e.g., "... ,0" or "... ,1"
             print(current_status)
             current_status = current_status.strip().split(",")[-1].strip()
             current_bool = bool(int(current_status))  # 0 -> False, 1 -> True
@@ -548,7 +746,7 @@ class LakeShore370:
             return False
         else:
             try:
-                self.device.write(f"SCAN {int(channel)},{int(status_bool)}")
+                self._write(f"SCAN {int(channel)},{int(status_bool)}")
                 return True
             except Exception as e:
                 print(f"Could not set autoscan {'ON' if current_bool else 'OFF'}.\nReason: {e}")
@@ -584,8 +782,7 @@ class LakeShore370:
 
         try:
             print(f"✏️ Setting temperature setpoint for channel {channel} to {value} K.")
-            with _lakeshore_mutex:
-                self.device.write(f"SETP {value},{channel}")
+            self._write(f"SETP {value},{channel}")
             if verbose: print(f"Set temperature setpoint for channel {channel} to {value} K.")
             return True
         except Exception as e:
@@ -614,14 +811,63 @@ class LakeShore370:
             if P is None: P = self.get_control_parameters().get("P", DEFAULT_PID["P"])
             if I is None: I = self.get_control_parameters().get("I", DEFAULT_PID["I"])
             if D is None: D = self.get_control_parameters().get("D", DEFAULT_PID["D"])
-            with _lakeshore_mutex:
-                self.device.write(f"PID {P},{I},{D}")
+            self._write(f"PID {P},{I},{D}")
             if verbose: print(f"Set control parameters for channel {channel}: P={P}, I={I}, D={D}.")
             return True
         except Exception as e:
             print(f"Setting control parameters for channel {channel} failed.\nReason: {e}")
             return False
 
+    def update_inset(self, channel: int, **fields) -> bool:
+
+        """
+        Update any subset of the INSET settings of a channel in one transaction:
+        the current record is read once, merged with the given fields and written
+        once, holding the device for the whole read-modify-write.
+        Args:
+            channel (int): The channel number (1 to 16).
+            enabled (int|bool): 1 to switch the channel on, 0 to switch it off.
+            dwell (int): Dwell time in seconds (1 to 200).
+            pause (int): Pause time in seconds (3 to 200).
+            curve (int): Curve number, 0 for no curve (0 to 20).
+            tempco (int): Temperature coefficient, 1 for negative, 2 for positive.
+        Returns:
+            bool: True if the operation was successful, False otherwise.
+        """
+
+        unknown = set(fields) - set(INSET_FIELDS)
+        if unknown:
+            print(f"Unknown INSET fields: {sorted(unknown)}. Allowed: {list(INSET_FIELDS)}")
+            return False
+
+        try:
+            values = {name: int(value) for name, value in fields.items()}
+        except (TypeError, ValueError) as e:
+            print(f"Invalid INSET value for channel {channel}: {e}")
+            return False
+
+        for name, value in values.items():
+            low, high = INSET_LIMITS[name]
+            if value < low or value > high:
+                print(f"INSET {name} must be between {low} and {high}, got {value}.")
+                return False
+
+        try:
+            with _lakeshore_mutex:
+                if len(values) == len(INSET_FIELDS):
+                    record = [values[name] for name in INSET_FIELDS]
+                else:
+                    current = self.get_inset_settings(channel, refresh=True)
+                    record = [values.get(name, int(current[index])) for index, name in enumerate(INSET_FIELDS)]
+                self._write(f"INSET {channel},{record[0]},{record[1]},{record[2]},{record[3]},{record[4]}")
+                self._store_inset(channel, record)
+            return True
+
+        except Exception as e:
+            print(f"Updating INSET settings {values} for channel {channel} failed.\nReason: {e}")
+            self.clear_inset_cache(channel)
+            return False
+
     def set_channel_dwell_time(self, dwell_time, channel: int):
         
         """
@@ -645,15 +891,10 @@ class LakeShore370:
             if channel not in DEFAULT_CHANNELS:
                 print(f"Channel {channel} is not valid. Valid channels are: {DEFAULT_CHANNELS}")
                 return False 
-            else:
-                with _lakeshore_mutex:
-                    parameters = self.device.query(f"INSET? {channel}").split(",")
-                pause = parameters[2]
-                curve = parameters[3]
-                temp_coeff = parameters[4]
-                self.device.write(f"INSET {channel},1,{dwell_time},{pause},{curve},{temp_coeff}")
+            elif self.update_inset(channel, dwell=dwell_time):
                 print(f"Dwell time for channel {channel} set to {dwell_time} seconds.")
                 return True
+            return False
 
         except Exception as e:
             print(f"Getting dwell time for channel {channel} failed.\nReason: {e}")
@@ -678,15 +919,8 @@ class LakeShore370:
                 print(f"Channel {channel} is not valid. Valid channels are: {DEFAULT_CHANNELS}")
                 return False
 
-            with _lakeshore_mutex:
-                parameters = self.device.query(f"INSET? {channel}").split(",")
-
-            dwell = parameters[1]
-            curve = parameters[3]
-            temp_coeff = parameters[4]
-
-            with _lakeshore_mutex:
-                self.device.write(f"INSET {channel},1,{dwell},{int(pause_time)},{curve},{temp_coeff}")
+            if not self.update_inset(channel, pause=pause_time):
+                return False
 
             print(f"Pause time for channel {channel} set to {pause_time} seconds.")
             return True
@@ -722,18 +956,13 @@ class LakeShore370:
             return False 
 
         try:
-            with _lakeshore_mutex:
-                parameters = self.device.query(f"INSET? {channel}").split(",")
-            current_curve = parameters[3]
+            current_curve = self.get_inset_settings(channel)[3]
             if int(current_curve) == int(curve_number):
                 print(f"Curve number {int(curve_number)} is already set to channel {int(channel)}")
                 return False
-            dwell = parameters[1]
-            pause = parameters[2]
-            temp_coeff = parameters[4]
-            self.device.write(f"INSET {channel},1,{dwell},{pause},{int(curve_number)},{temp_coeff}")
-            print(f"Curve #{int(curve_number)} succesfully set to channel {channel}.")
-            return True
+            if self.update_inset(channel, curve=curve_number):
+                print(f"Curve #{int(curve_number)} succesfully set to channel {channel}.")
+                return True
 
         except Exception as e:
             print(f"Setting curve for channel {channel} failed.\nReason: {e}")
@@ -771,8 +1000,7 @@ class LakeShore370:
             return False
 
         try:
-            with _lakeshore_mutex:
-                self.device.write(f"CSET {controlled_channel},{filtered_readings},{units},{delay},{heater_display},{str(heater_range)},{heater_resistance}")
+            self._write(f"CSET {controlled_channel},{filtered_readings},{units},{delay},{heater_display},{str(heater_range)},{heater_resistance}")
             if verbose: print(f"Control settings set to: {settings}")
             return True
         except Exception as e:
@@ -795,8 +1023,7 @@ class LakeShore370:
             return False
 
         try:
-            with _lakeshore_mutex:
-                self.device.write(f"HTRRNG {range_value}")
+            self._write(f"HTRRNG {range_value}")
             if verbose: print(f"Control range set to: {CURRENT_RANGE_LIST[range_value][0]}")
             return True
         except Exception as e:
@@ -819,14 +1046,12 @@ class LakeShore370:
             return False
 
         current_settings = self.get_control_settings()
-        time.sleep(0.2)  # Wait for the device to respond
         if current_settings is None:
             print("Failed to get current control settings.")
             return False
         else:
             try:
-                with _lakeshore_mutex:
-                    self.device.write(f"CSET {channel},{current_settings[1]},{current_settings[2]},{current_settings[3]},{current_settings[4]},{current_settings[5]},{current_settings[6]}")
+                self._write(f"CSET {channel},{current_settings[1]},{current_settings[2]},{current_settings[3]},{current_settings[4]},{current_settings[5]},{current_settings[6]}")
                 if verbose: print(f"Control channel set to {channel}.")
                 return True
 
@@ -888,8 +1113,7 @@ class LakeShore370:
         print(cmd)
         
         try:
-            with _lakeshore_mutex:
-                self.device.write(cmd)
+            self._write(cmd)
             if verbose: 
                 print(f"Sensor resistance settings for channel {channel} set to: {settings}")
             return True
@@ -909,6 +1133,33 @@ class LakeShore370:
             print(f"Failed to close device connection.\nReason: {e}")
             return False
         
+def _split_reply(reply: str) -> list:
+    return [field.strip() for field in reply.strip().split(",")]
+
+def _parse_pid_reply(reply: str) -> dict:
+    parameters = reply.split(",")
+    return {
+        "P": float(parameters[0]),
+        "I": float(parameters[1]),
+        "D": float(parameters[2]),
+    }
+
+def _chain_queries(queries: list):
+    """ Group queries into ';'-joined lines no longer than MAX_CHAINED_QUERY_LENGTH """
+    batch = []
+    length = 0
+    for query in queries:
+        extra = len(query) + (len(QUERY_SEPARATOR) if batch else 0)
+        if batch and length + extra > MAX_CHAINED_QUERY_LENGTH:
+            yield batch
+            batch = []
+            extra = len(query)
+            length = 0
+        batch.append(query)
+        length += extra
+    if batch:
+        yield batch
+
 def _translate_control_settings_to_dictionary(control_params: list) -> dict:
 
     controlled_channel = control_params[0]
@@ -968,4 +1219,19 @@ def _i2s(x):
     elif len(x) == 2: x = x
     else: raise("Excitation range format wrong. Only permited str or int.")
     return x
-    
\ No newline at end of file
+
+# Typed parsers for the replies handled by LakeShore370.query_many, by mnemonic
+QUERY_PARSERS = {
+    "RDGK?": float,
+    "RDGR?": float,
+    "RDGPWR?": float,
+    "SETP?": float,
+    "PID?": _parse_pid_reply,
+    "HTRRNG?": str.strip,
+    "INSET?": _split_reply,
+    "CSET?": _split_reply,
+    "SCAN?": _split_reply,
+    "CRVHDR?": _split_reply,
+    "CRVPT?": lambda reply: [float(field) for field in _split_reply(reply)],
+    "RDGRNG?": lambda reply: _translate_sensor_resistance_settings_to_dictionary(_split_reply(reply)),
+}
@@ -0,0 +1,88 @@
+import asyncio
+import functools
+
+from device_worker import DeviceWorker, PRIORITY_COMMAND
+
+class AsyncLakeShore370:
+
+    """
+    asyncio front-end for the Lake Shore 370 drivers.
+    It exposes the same methods as lakeshore370.LakeShore370 and
+    lakeshore370_dummy.LakeShore370, but every method is a coroutine: the
+    serial I/O runs on a DeviceWorker thread that owns the driver, so awaiting
+    a device read never blocks the event loop.
+
+    Usage:
+        ls = await AsyncLakeShore370.open('ASRL/dev/ttyUSB0::INSTR')
+        temperature = await ls.get_temperature(6)
+        await ls.close()
+
+    Attributes:
+        worker (DeviceWorker): The worker thread executing the device calls. It can
+            be shared with synchronous code that uses the same driver.
+        owns_worker (bool): True if the worker was created here from a driver; only
+            then does close() close the driver and stop the worker. A worker passed
+            in is left running for the code that shares it.
+    """
+
+    def __init__(self, driver=None, worker: DeviceWorker | None = None):
+        if worker is None:
+            if driver is None:
+                raise ValueError("Either a driver or a DeviceWorker must be given.")
+            worker = DeviceWorker(driver)
+            self.owns_worker = True
+        else:
+            self.owns_worker = False
+        self.worker = worker
+
+    @classmethod
+    async def open(cls, *args, dummy: bool = False, **kwargs):
+        """
+        Create the driver without blocking the event loop (opening the VISA
+        resource can take a while) and wrap it.
+        Args:
+            *args, **kwargs: Passed to the driver constructor (addr, baud_rate, ...).
+            dummy (bool): If True, use lakeshore370_dummy instead of the real driver.
+        """
+        if dummy:
+            from lakeshore370_dummy import LakeShore370
+        else:
+            from lakeshore370 import LakeShore370
+        driver = await asyncio.to_thread(LakeShore370, *args, **kwargs)
+        return cls(driver)
+
+    async def call(self, operation, *args, priority: int = PRIORITY_COMMAND, **kwargs):
+        """
+        Run a driver method (by name) or a callable receiving the driver on the worker.
+        """
+        future = self.worker.submit(operation, *args, priority=priority, **kwargs)
+        return await asyncio.wrap_future(future)
+
+    async def close(self):
+        """ Close the device connection and stop the worker thread, if this object created the worker. """
+        if not self.owns_worker:
+            return None
+        try:
+            return await self.call("close")
+        finally:
+            await asyncio.to_thread(self.worker.stop)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        attribute = getattr(self.worker.device, name)
+        if not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        async def method(*args, **kwargs):
+            return await self.call(name, *args, **kwargs)
+
+        return method
@@ -1,7 +1,10 @@
+import math
 import threading
 import time
 import random
 
+from command_stats import CommandStats
+
 _lakeshore_mutex = threading.Lock()
 
 
@@ -79,6 +82,20 @@ DEFAULT_CURVES = {
     6: 4,
 }
 
+# Valores nominales simulados (también definen las curvas sintéticas)
+DUMMY_NOMINAL_TEMPS_K = {
+    "50K": 50.0,
+    "4K": 4.2,
+    "STILL": 1.0,
+    "MXC": 0.100,   # 100 mK
+}
+DUMMY_NOMINAL_RESISTANCES_OHM = {
+    "50K": 100.0,
+    "4K": 200.0,
+    "STILL": 500.0,
+    "MXC": 1000.0,
+}
+
 #Mapa canal → etiqueta
 CHANNEL_LABEL = {
     1: "50K",
@@ -157,20 +174,11 @@ class LakeShore370:
       * dwell/pause times, autoscan, etc.
     """
 
-    def __init__(self, addr=None, baud_rate=9600, timeout=2000):
+    def __init__(self, addr=None, baud_rate=9600, timeout=2000, inset_cache_ttl=10.0,
+                 min_command_interval=0.05, write_settle_time=0.1, stats_window=1000):
         # Estado interno simulado
-        self._temps_K = {
-            "50K": 50.0,
-            "4K": 4.2,
-            "STILL": 1.0,
-            "MXC": 0.100,   # 100 mK
-        }
-        self._resistances_ohm = {
-            "50K": 100.0,
-            "4K": 200.0,
-            "STILL": 500.0,
-            "MXC": 1000.0,
-        }
+        self._temps_K = DUMMY_NOMINAL_TEMPS_K.copy()
+        self._resistances_ohm = DUMMY_NOMINAL_RESISTANCES_OHM.copy()
         self._powers_W = {
             "50K": 0.0,
             "4K": 0.0,
@@ -211,10 +219,20 @@ class LakeShore370:
             "MXC": 1,
         }
 
+        # Curva y coeficiente de temperatura por canal (campos 4 y 5 de INSET)
+        self._curves = DEFAULT_CURVES.copy()
+        self._tempcos = {ch: 2 for ch in DEFAULT_CHANNELS}
+
         # Autoscan: [channel, status]
         # status 0 = off, 1 = on
         self._autoscan = ["6", "0"]
 
+        # Sin hardware no hay nada que cachear, pero se mantiene la misma API
+        self.inset_cache_ttl = inset_cache_ttl
+        self.min_command_interval = min_command_interval
+        self.write_settle_time = write_settle_time
+        self.command_stats = CommandStats(stats_window)
+
         print("Dummy LakeShore370 inicializado (sin hardware real).")
 
     # ---------------------- GET MÉTODOS ------------------------------
@@ -222,6 +240,25 @@ class LakeShore370:
     def _label_from_channel(self, channel: int) -> str:
         return CHANNEL_LABEL.get(channel, f"CH{channel}")
 
+    def get_inset_settings(self, channel: int, refresh: bool = False) -> list:
+        """
+        Devuelve el registro INSET del canal como lista de strings:
+        [on/off, dwell, pause, curva, coeficiente de temperatura].
+        """
+        label = self._label_from_channel(channel)
+        with _lakeshore_mutex:
+            return [
+                str(int(self._channel_status.get(channel, 0))),
+                str(int(self._dwell_times.get(label, 0))),
+                str(int(self._pause_times.get(label, 0))),
+                str(int(self._curves.get(channel, 0))),
+                str(int(self._tempcos.get(channel, 2))),
+            ]
+
+    def clear_inset_cache(self, channel: int | None = None):
+        # El dummy lee siempre de su estado interno
+        pass
+
     def get_temperature(self, channel: int):
         """
         Devuelve temperatura en K del canal indicado.
@@ -300,6 +337,96 @@ class LakeShore370:
             # Lo devolvemos como lista de strings, tcp_server ya lo normaliza.
             return list(self._autoscan)
 
+    def query_many(self, queries: list) -> list:
+        """
+        Versión dummy de query_many: responde cada consulta desde el estado
+        interno, con los mismos tipos que QUERY_PARSERS del driver real.
+        """
+        results = []
+        for query in queries:
+            started = time.perf_counter()
+            error = None
+            try:
+                results.append(self._answer(query))
+            except Exception as e:
+                error = e
+                print(f"[DUMMY] Query {query!r} failed.\nReason: {e}")
+                results.append(None)
+            self.command_stats.record_io(query, 0.0, time.perf_counter() - started, error)
+        return results
+
+    def get_command_stats(self, reset: bool = False) -> dict:
+        """
+        Estadísticas de tiempos por comando (sólo las consultas de query_many:
+        el dummy no tiene espera ni puerto serie, el rtt es el tiempo de _answer).
+        """
+        summary = self.command_stats.summary()
+        if reset:
+            self.command_stats.reset()
+        return summary
+
+    def _answer(self, query: str):
+        mnemonic, _, argument = query.strip().partition(" ")
+        mnemonic = mnemonic.upper()
+        channel = int(argument) if argument else None
+
+        if mnemonic == "RDGK?":
+            return self.get_temperature(channel)
+        if mnemonic == "RDGR?":
+            return self.get_resistance(channel)
+        if mnemonic == "RDGPWR?":
+            return self.get_power(channel)
+        if mnemonic == "SETP?":
+            return self.get_temperature_setpoint()
+        if mnemonic == "PID?":
+            return self.get_control_parameters()
+        if mnemonic == "HTRRNG?":
+            return self.get_control_range()
+        if mnemonic == "INSET?":
+            return self.get_inset_settings(channel)
+        if mnemonic == "CSET?":
+            return self.get_control_settings()
+        if mnemonic == "SCAN?":
+            return self.get_autoscan()
+        if mnemonic == "RDGRNG?":
+            return self.get_sensor_resistance_settings(channel, return_dict=True)
+        raise ValueError(f"Unsupported query {query!r}")
+
+    def _curve_channel(self, curve_number: int):
+        for channel, curve in self._curves.items():
+            if int(curve) == int(curve_number):
+                return channel
+        return None
+
+    def get_curve_header(self, curve_number: int):
+        """
+        Cabecera de una curva sintética (formato log Ohm/K) que pasa por el punto
+        nominal temperatura/resistencia del canal que la usa.
+        """
+        channel = self._curve_channel(curve_number)
+        if channel is None:
+            return ["User Curve", "", "3", "+375.000", "1"]
+        label = self._label_from_channel(channel)
+        limit = DUMMY_NOMINAL_TEMPS_K[label] * 10
+        return [CURVE_NAMES.get(channel, label)[:15].strip(), f"DUMMY{channel:02d}", "4", f"{limit:+.3f}", "1"]
+
+    def get_curve_points(self, curve_number: int, chunk: int = 20):
+        """
+        Puntos de la curva sintética: R = R0 * T0 / T, una década por debajo y
+        por encima de la temperatura nominal del canal.
+        """
+        channel = self._curve_channel(curve_number)
+        if channel is None:
+            return []
+        label = self._label_from_channel(channel)
+        t0 = DUMMY_NOMINAL_TEMPS_K[label]
+        r0 = DUMMY_NOMINAL_RESISTANCES_OHM[label]
+        points = []
+        for i in range(41):
+            temperature = t0 * 10 ** (-1 + i / 20)
+            points.append((round(math.log10(r0 * t0 / temperature), 5), temperature))
+        return sorted(points)
+
     def get_channels_dwell_time(self, channels=None):
         if channels is None:
             channels = DEFAULT_CHANNELS
@@ -595,6 +722,32 @@ class LakeShore370:
             print(f"[DUMMY] Pause time for {label} (ch {channel}) set to {pause} s")
         return True
 
+    def update_inset(self, channel: int, **fields) -> bool:
+        """
+        Actualiza cualquier subconjunto de los campos INSET del canal
+        (enabled, dwell, pause, curve, tempco) en una sola operación.
+        """
+        unknown = set(fields) - {"enabled", "dwell", "pause", "curve", "tempco"}
+        if unknown:
+            print(f"Unknown INSET fields: {sorted(unknown)}")
+            return False
+
+        label = self._label_from_channel(channel)
+        with _lakeshore_mutex:
+            if "enabled" in fields:
+                self._channel_status[channel] = int(fields["enabled"])
+            if "dwell" in fields:
+                self._dwell_times[label] = float(fields["dwell"])
+            if "pause" in fields:
+                self._pause_times[label] = float(fields["pause"])
+            if "curve" in fields:
+                self._curves[channel] = int(fields["curve"])
+            if "tempco" in fields:
+                self._tempcos[channel] = int(fields["tempco"])
+
+        print(f"[DUMMY] INSET {label} (ch {channel}) updated: {fields}")
+        return True
+
     def close(self):
         print("[DUMMY] Closing dummy LakeShore370 (no hardware).")
         return True
@@ -0,0 +1,360 @@
+"""
+Protocol-level emulator of the Lake Shore 370 AC resistance bridge.
+
+Unlike lakeshore370_dummy, which replaces the driver in Python, this emulator
+speaks the instrument's ASCII command set over a pseudo-terminal or a TCP socket,
+so the real lakeshore370.LakeShore370 driver (parsing, terminations, timeouts,
+pacing) can be exercised and benchmarked without hardware.
+
+Usage:
+    python lakeshore370_emulator.py                 # serve on a pty
+    python lakeshore370_emulator.py --port 7777     # serve on a TCP socket
+    python lakeshore370_emulator.py --benchmark     # time the real driver against the emulator
+
+The VISA resource string to open is printed on start-up, e.g.
+    LakeShore370(addr='ASRL/dev/pts/5::INSTR')
+    LakeShore370(addr='TCPIP::127.0.0.1::7777::SOCKET')
+"""
+
+import argparse
+import math
+import os
+import random
+import socket
+import threading
+import time
+import tty
+
+from default_config import DEFAULT_SETTINGS, DEFAULT_PID, DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS, CURVE_NAMES
+
+TERMINATION = b"\r\n"
+BITS_PER_BYTE = 10          # start + 7 data + parity + stop
+RESPONSE_DELAY = 0.005      # Instrument turnaround before the reply starts, in seconds
+
+# Simulated thermometers: {channel: (temperature K, R0 Ohm, T0 K, exponent)}
+# R(T) = R0 * (T0 / T) ** exponent
+THERMOMETERS = {
+    1: (50.0,  100.0,  50.0,  0.3),
+    2: (4.2,   200.0,  4.2,   0.8),
+    5: (1.0,   500.0,  1.0,   1.0),
+    6: (0.100, 1000.0, 0.100, 1.5),
+}
+CURVE_POINTS = 60           # Breakpoints of the generated calibration curves
+
+class EmulatedLakeShore370:
+
+    """
+    State model of a Lake Shore 370 answering ASCII commands.
+    Supports RDGK?, RDGR?, RDGPWR?, INSET(?), SETP(?), PID(?), HTRRNG(?), CSET(?),
+    RDGRNG(?), SCAN(?), CRVHDR?, CRVPT?, HTRST?, HTR? and *IDN?. Several commands can be chained
+    with ';' and the replies of the queries are returned joined by ';'.
+    Only the channel selected by SCAN is measured; the other channels hold their
+    last reading. With autoscan on, the scanner moves to the next enabled channel
+    after the pause + dwell time of the current one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        self.inset = {channel: [0, 10, 3, 0, 2] for channel in range(1, 17)}
+        for channel, settings in DEFAULT_SETTINGS.items():
+            dwell, pause, curve, tempco = [int(x) for x in settings[0].split(",")]
+            self.inset[channel] = [1, dwell, pause, curve, tempco]
+
+        self.rdgrng = {channel: [0, 5, 14, 1, 0] for channel in range(1, 17)}
+        self.rdgrng[6] = [
+            DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS["excitation_mode"],
+            DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS["excitation_range"],
+            DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS["resistance_range"],
+            DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS["autorange"],
+            DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS["excitation"],
+        ]
+
+        self.setpoint = 0.1
+        self.pid = [DEFAULT_PID["P"], DEFAULT_PID["I"], DEFAULT_PID["D"]]
+        self.heater_range = 5
+        self.cset = [6, 1, 1, 1, 1, 8, 100.0]
+
+        self.scan_channel = 6
+        self.autoscan = 0
+        self.scan_since = time.monotonic()
+
+        # Calibration curves generated from the thermometer models: {curve: (header, points)}
+        self.curves = {}
+        for channel in THERMOMETERS:
+            curve = self.inset[channel][3]
+            if curve:
+                self.curves[curve] = thermometer_curve(channel)
+
+        self.temperatures = {channel: model[0] for channel, model in THERMOMETERS.items()}
+        self.held = {channel: self._measure(channel) for channel in THERMOMETERS}
+
+    # ---- Command handling
+    def handle_line(self, line: str) -> str | None:
+        """ Execute one received line; returns the reply, or None if it has no queries. """
+        replies = []
+        with self._lock:
+            self._update_scan(time.monotonic())
+            for command in line.strip().split(";"):
+                command = command.strip()
+                if not command:
+                    continue
+                try:
+                    reply = self._handle_command(command)
+                except (ValueError, IndexError, KeyError):
+                    reply = None    # The instrument silently ignores malformed commands
+                if reply is not None:
+                    replies.append(reply)
+        return ";".join(replies) if replies else None
+
+    def _handle_command(self, command: str):
+        mnemonic, _, argument = command.partition(" ")
+        mnemonic = mnemonic.upper()
+        args = [arg.strip() for arg in argument.split(",") if arg.strip()]
+
+        if mnemonic == "*IDN?":
+            return "LSCI,MODEL370,EMULATOR,1.0"
+        if mnemonic in ("RDGK?", "RDGR?", "RDGPWR?"):
+            channel = int(args[0])
+            temperature, resistance, power = self._reading(channel)
+            value = {"RDGK?": temperature, "RDGR?": resistance, "RDGPWR?": power}[mnemonic]
+            return f"{value:+.5E}"
+        if mnemonic == "INSET?":
+            on, dwell, pause, curve, tempco = self.inset[int(args[0])]
+            return f"{on},{dwell:03d},{pause:03d},{curve:02d},{tempco}"
+        if mnemonic == "INSET":
+            channel = int(args[0])
+            self.inset[channel] = [int(args[1]), int(float(args[2])), int(float(args[3])), int(args[4]), int(args[5])]
+            return None
+        if mnemonic == "SETP?":
+            return f"{self.setpoint:+.5E}"
+        if mnemonic == "SETP":
+            self.setpoint = float(args[0])
+            return None
+        if mnemonic == "PID?":
+            return ",".join(f"{value:+.4f}" for value in self.pid)
+        if mnemonic == "PID":
+            self.pid = [float(arg) for arg in args[:3]]
+            return None
+        if mnemonic == "HTRRNG?":
+            return str(self.heater_range)
+        if mnemonic == "HTRRNG":
+            self.heater_range = int(args[0])
+            return None
+        if mnemonic == "CSET?":
+            return ",".join(str(value) for value in self.cset)
+        if mnemonic == "CSET":
+            self.cset = [int(args[0]), int(args[1]), int(args[2]), int(args[3]), int(args[4]), int(args[5]), float(args[6])]
+            return None
+        if mnemonic == "RDGRNG?":
+            mode, excitation, resistance, autorange, cs_off = self.rdgrng[int(args[0])]
+            return f"{mode},{excitation:02d},{resistance:02d},{autorange},{cs_off}"
+        if mnemonic == "RDGRNG":
+            self.rdgrng[int(args[0])] = [int(arg) for arg in args[1:6]]
+            return None
+        if mnemonic == "SCAN?":
+            return f"{self.scan_channel:02d},{self.autoscan}"
+        if mnemonic == "SCAN":
+            channel = int(args[0])
+            if channel != self.scan_channel:
+                self.scan_since = time.monotonic()
+            self.scan_channel = channel
+            self.autoscan = int(args[1])
+            return None
+        if mnemonic == "CRVHDR?":
+            header, _ = self.curves.get(int(args[0]), (("User Curve", "", 3, 375.0, 1), []))
+            name, serial, curve_format, limit, coefficient = header
+            return f"{name:<15},{serial:<10},{curve_format},{limit:+.3f},{coefficient}"
+        if mnemonic == "CRVPT?":
+            _, points = self.curves.get(int(args[0]), (None, []))
+            index = int(args[1])
+            if not 1 <= index <= 200:
+                raise ValueError(f"Curve point index out of range: {index}")
+            units, temperature = points[index - 1] if index <= len(points) else (0.0, 0.0)
+            return f"{units:+.5f},{temperature:+.6E}"
+        if mnemonic == "HTRST?":
+            return "0"
+        if mnemonic == "HTR?":
+            return f"{0.0:+.4E}"
+        if mnemonic.endswith("?"):
+            raise ValueError(f"Unsupported query {command!r}")
+        return None
+
+    # ---- Measurement model
+    def _update_scan(self, now: float):
+        if not self.autoscan:
+            return
+        enabled = [channel for channel in range(1, 17) if self.inset[channel][0]]
+        if not enabled:
+            return
+        while True:
+            _, dwell, pause, _, _ = self.inset[self.scan_channel]
+            if now - self.scan_since < pause + dwell:
+                return
+            self.scan_since += pause + dwell
+            following = [channel for channel in enabled if channel > self.scan_channel]
+            self.scan_channel = following[0] if following else enabled[0]
+
+    def _reading(self, channel: int):
+        # Only the scanned channel is measured, once its pause (settle) time is over
+        settled = time.monotonic() - self.scan_since >= self.inset[self.scan_channel][2]
+        if channel == self.scan_channel and self.inset[channel][0] and settled:
+            self.held[channel] = self._measure(channel)
+        return self.held.get(channel, (0.0, 0.0, 0.0))
+
+    def _measure(self, channel: int):
+        if channel not in THERMOMETERS:
+            return (0.0, 0.0, 0.0)
+        temperature = self.temperatures[channel] * (1 + random.uniform(-1e-3, 1e-3))
+        resistance = thermometer_resistance(channel, temperature)
+        excitation_current = 1e-10
+        return (temperature, resistance, resistance * excitation_current ** 2)
+
+def thermometer_resistance(channel: int, temperature: float) -> float:
+    """ Resistance in Ohms of the simulated thermometer on a channel. """
+    _, r0, t0, exponent = THERMOMETERS[channel]
+    return r0 * (t0 / temperature) ** exponent
+
+def thermometer_curve(channel: int):
+    """
+    Calibration curve (log Ohm/K format) of the simulated thermometer on a channel,
+    covering a decade below and above its nominal temperature.
+    Returns:
+        tuple: (header, points) with header = (name, serial, format, limit, coefficient)
+        and points = [(log10 Ohm, K)] in ascending units order.
+    """
+    nominal = THERMOMETERS[channel][0]
+    low, high = math.log10(nominal / 10), math.log10(nominal * 10)
+    temperatures = [10 ** (low + (high - low) * i / (CURVE_POINTS - 1)) for i in range(CURVE_POINTS)]
+    points = sorted((round(math.log10(thermometer_resistance(channel, t)), 5), t) for t in temperatures)
+    name = CURVE_NAMES.get(channel, f"EMU-CH{channel}")
+    header = (name[:15].strip(), f"EMU{channel:02d}", 4, round(nominal * 10, 3), 1)
+    return header, points
+
+class SerialLink:
+
+    """
+    Serves an EmulatedLakeShore370 over a byte stream (pty or socket), delaying
+    received and transmitted bytes as a serial line at the given baud rate would.
+    """
+
+    def __init__(self, instrument: EmulatedLakeShore370, baud_rate: int = 9600, response_delay: float = RESPONSE_DELAY):
+        self.instrument = instrument
+        self.byte_time = BITS_PER_BYTE / baud_rate if baud_rate else 0.0
+        self.response_delay = response_delay
+
+    def serve(self, read, write):
+        """ Serve until read() returns b''. read(n) -> bytes, write(bytes) -> None. """
+        buffer = b""
+        while True:
+            chunk = read(1024)
+            if not chunk:
+                return
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                # The line could not have arrived faster than the serial line allows
+                time.sleep(self.byte_time * (len(line) + 1))
+                reply = self.instrument.handle_line(line.decode("ascii", errors="ignore"))
+                if reply is None:
+                    continue
+                data = reply.encode("ascii") + TERMINATION
+                time.sleep(self.response_delay + self.byte_time * len(data))
+                write(data)
+
+def serve_pty(instrument: EmulatedLakeShore370, baud_rate: int = 9600):
+    """
+    Serve the emulator on a new pseudo-terminal in a background thread.
+    Returns:
+        str: The VISA resource string of the pty.
+    """
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    link = SerialLink(instrument, baud_rate)
+
+    def write(data):
+        os.write(master, data)
+
+    def read(size):
+        try:
+            return os.read(master, size)
+        except OSError:
+            return b""
+
+    threading.Thread(target=link.serve, args=(read, write), daemon=True).start()
+    return f"ASRL{os.ttyname(slave)}::INSTR"
+
+def serve_socket(instrument: EmulatedLakeShore370, host: str = "127.0.0.1", port: int = 7777, baud_rate: int = 9600):
+    """
+    Serve the emulator on a TCP socket in a background thread, one client at a time.
+    Args:
+        port (int): TCP port; 0 picks a free one.
+    Returns:
+        str: The VISA resource string of the socket.
+    """
+    link = SerialLink(instrument, baud_rate)
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen()
+
+    def accept_loop():
+        while True:
+            conn, addr = server_socket.accept()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with conn:
+                link.serve(conn.recv, conn.sendall)
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return f"TCPIP::{host}::{server_socket.getsockname()[1]}::SOCKET"
+
+def benchmark(ticks: int = 20, baud_rate: int = 9600):
+    """
+    Run the real driver against the emulator and print the time per poll tick
+    for individual queries and for chained query_many batches.
+    The socket transport is used, since some kernels refuse 7-bit settings on ptys.
+    """
+    from lakeshore370 import LakeShore370
+
+    addr = serve_socket(EmulatedLakeShore370(), port=0, baud_rate=baud_rate)
+    ls = LakeShore370(addr=addr, baud_rate=baud_rate)
+    queries = [f"{mnemonic} {channel}" for channel in (1, 2, 5, 6) for mnemonic in ("RDGK?", "RDGR?", "RDGPWR?")]
+    queries += ["SETP? 6", "PID?", "HTRRNG?", "CSET?", "RDGRNG? 6", "SCAN?"]
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for query in queries:
+            ls._query(query)
+    single = (time.perf_counter() - start) / ticks
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        ls.query_many(queries)
+    chained = (time.perf_counter() - start) / ticks
+
+    print(f"{len(queries)} queries per tick at {baud_rate} baud:")
+    print(f"  one query per transaction: {single * 1000:.1f} ms/tick")
+    print(f"  chained with query_many:   {chained * 1000:.1f} ms/tick")
+    ls.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lake Shore 370 protocol emulator")
+    parser.add_argument("--port", type=int, help="Serve on this TCP port instead of a pty")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--baud", type=int, default=9600, help="Simulated baud rate (0 disables byte timing)")
+    parser.add_argument("--benchmark", action="store_true", help="Benchmark the real driver against the emulator")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(baud_rate=args.baud)
+    else:
+        if args.port:
+            addr = serve_socket(EmulatedLakeShore370(), args.host, args.port, args.baud)
+        else:
+            addr = serve_pty(EmulatedLakeShore370(), args.baud)
+        print(f"VISA resource: {addr}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
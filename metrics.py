@@ -0,0 +1,261 @@
+"""
+Process metrics in the OpenMetrics (Prometheus) text format.
+
+Instruments are created once on a MetricsRegistry and updated from any thread;
+render() writes every metric as text, and MetricsServer serves it on a side
+port for a local scraper:
+
+    registry = MetricsRegistry()
+    poll_duration = registry.histogram("lakeshore_poll_duration_seconds", "Duration of an acquisition poll cycle")
+    poll_duration.observe(0.21)
+    MetricsServer(registry, "0.0.0.0", 9100).start()    # GET http://host:9100/metrics
+
+Values that already live elsewhere (subscriber queues, publisher counters...)
+are read at scrape time by collectors: registry.add_collector(function), where
+function() returns instruments filled on the spot.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+# Seconds, from a fast dummy/serial reply to a VISA timeout
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+class _Metric:
+
+    """ A metric family: one value (or histogram) per combination of label values. """
+
+    kind = "unknown"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        if not self.labels:
+            self._values[()] = self._initial()     # Exposed as 0 before the first update
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} expects the labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> list:
+        lines = [f"# TYPE {self.name} {self.kind}", f"# HELP {self.name} {_escape(self.help)}"]
+        with self._lock:
+            items = sorted(((key, self._copy(value)) for key, value in self._values.items()), key=lambda item: item[0])
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _initial(self):
+        return 0
+
+    def _copy(self, value):
+        # Value as rendered, read under the lock
+        return value
+
+    def _samples(self, key: tuple, value) -> list:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+class Counter(_Metric):
+
+    """ Monotonic count; exposed as <name>_total. """
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """ Copy a count kept elsewhere (collectors). """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self, key: tuple, value) -> list:
+        return [f"{self.name}_total{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+class Gauge(_Metric):
+
+    """ Value that goes up and down. """
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class _HistogramValue:
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.count = 0
+        self.sum = 0.0
+
+class Histogram(_Metric):
+
+    """
+    Distribution of observed values in cumulative buckets (upper bounds, + Inf implied).
+    Args:
+        buckets (tuple): Sorted upper bounds, in the unit of the observations.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _initial(self) -> _HistogramValue:
+        return _HistogramValue(len(self.buckets) + 1)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = self._initial()
+            entry.counts[index] += 1
+            entry.count += 1
+            entry.sum += value
+
+    def _copy(self, entry: _HistogramValue) -> _HistogramValue:
+        # observe() updates the entries in place
+        copy = _HistogramValue(0)
+        copy.counts, copy.count, copy.sum = list(entry.counts), entry.count, entry.sum
+        return copy
+
+    def _samples(self, key: tuple, entry: _HistogramValue) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), entry.counts):
+            cumulative += count
+            labels = _format_labels(self.labels, key, f'le="{_format_value(float(bound))}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labels, key)
+        lines.append(f"{self.name}_count{labels} {entry.count}")
+        lines.append(f"{self.name}_sum{labels} {_format_value(entry.sum)}")
+        return lines
+
+class MetricsRegistry:
+
+    """ The metrics of the process, rendered in registration order. """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name!r} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, collector):
+        """ collector() -> iterable of Counter/Gauge/Histogram, called on every render(). """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """ Every metric in the OpenMetrics text format, "# EOF" terminated. """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                for metric in collector():
+                    lines.extend(metric.render())
+            except Exception as e:
+                # A failing collector must not hide the other metrics
+                print(f"Error collecting metrics from {getattr(collector, '__name__', collector)}: {e}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    registry = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass    # One line per scrape would flood the log
+
+class MetricsServer:
+
+    """
+    Serves GET /metrics on its own port and thread.
+    Args:
+        registry (MetricsRegistry): Metrics served.
+        host (str), port (int): Listening address.
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str, port: int):
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
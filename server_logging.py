@@ -0,0 +1,164 @@
+"""
+Asynchronous, rotating logging for the TCP server.
+
+setup_logging() sends every log record through a queue: the threads that log
+(acquisition, publishers, commands) only enqueue the record, and a single
+listener thread formats it and writes it to the rotating log file and the
+console. The existing print() calls are captured the same way (one record per
+line, at ERROR level for lines that report an error, WARNING for warnings,
+INFO otherwise), so no thread blocks on console or disk I/O.
+
+Two filters keep the log readable and small:
+    SamplingFilter   records logged with extra={"sample": key} (e.g. the
+                     per-tick status line) pass at most once per interval
+    RateLimitFilter  an identical warning/error line is written once per
+                     period, followed by "(repeated N times)" when it recurs
+"""
+
+import io
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+LOG_FILE = "tcp_server.log"
+LOG_LEVEL = "INFO"
+LOG_MAX_BYTES = 5 * 1024 * 1024     # Size rotation: bytes per log file...
+LOG_BACKUP_COUNT = 5                # ...and rotated files kept
+TICK_LOG_INTERVAL = 60.0            # Seconds between two sampled per-tick status lines
+ERROR_REPEAT_PERIOD = 60.0          # Seconds an identical warning/error line is suppressed
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+
+class SamplingFilter(logging.Filter):
+
+    """ Lets through one record per `interval` seconds for each "sample" key; other records always pass. """
+
+    def __init__(self, interval: float = TICK_LOG_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.interval:
+                return False
+            self._last[key] = now
+        return True
+
+class RateLimitFilter(logging.Filter):
+
+    """
+    Suppresses the repetitions of an identical WARNING or ERROR message for
+    `period` seconds; the next one let through reports how many were dropped.
+    """
+
+    def __init__(self, period: float = ERROR_REPEAT_PERIOD, max_keys: int = 1000):
+        super().__init__()
+        self.period = period
+        self.max_keys = max_keys
+        self._seen = {}     # {(level, message): [monotonic time written, repetitions suppressed]}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.period:
+                entry[1] += 1
+                return False
+            suppressed = entry[1] if entry is not None else 0
+            if len(self._seen) >= self.max_keys:
+                self._seen.clear()
+            self._seen[key] = [now, 0]
+        if suppressed:
+            record.msg = f"{record.getMessage()} (repeated {suppressed} times since the last report)"
+            record.args = None
+        return True
+
+def print_level(line: str) -> int:
+    """ Log level of a captured print() line. """
+    lowered = line.lower()
+    if "❌" in line or lowered.startswith("error") or "error " in lowered[:40] or " failed" in lowered:
+        return logging.ERROR
+    if "⚠️" in line or "warning" in lowered:
+        return logging.WARNING
+    return logging.INFO
+
+class PrintCapture(io.TextIOBase):
+
+    """ File object replacing sys.stdout: every complete line becomes a log record. """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self._local = threading.local()     # Partial line of each thread
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        pending = getattr(self._local, "pending", "") + text
+        *lines, self._local.pending = pending.split("\n")
+        for line in lines:
+            if line.strip():
+                self.logger.log(print_level(line), line.rstrip())
+        return len(text)
+
+    def flush(self):
+        pass
+
+def setup_logging(log_file: str | None = LOG_FILE, level: str = LOG_LEVEL, console: bool = True,
+                  max_bytes: int = LOG_MAX_BYTES, backup_count: int = LOG_BACKUP_COUNT, rotate_when: str | None = None,
+                  capture_prints: bool = True) -> logging.handlers.QueueListener:
+    """
+    Route the logging module (and print() if capture_prints) through a queue.
+    Args:
+        log_file (str): Log file path, None for no file.
+        level (str): Minimum level written ("DEBUG", "INFO", "WARNING"...).
+        console (bool): Also write to the console (the original stdout).
+        max_bytes (int), backup_count (int): Size rotation of the log file.
+        rotate_when (str): Time rotation instead of size rotation, as in
+            logging.handlers.TimedRotatingFileHandler (e.g. "midnight").
+        capture_prints (bool): Replace sys.stdout so print() output is logged.
+    Returns:
+        QueueListener: The running listener; stop() it to flush the queue on exit.
+    """
+    formatter = logging.Formatter(LOG_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
+    handlers = []
+    if log_file:
+        if rotate_when:
+            file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when=rotate_when, backupCount=backup_count, encoding="utf-8")
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        handlers.append(file_handler)
+    if console:
+        handlers.append(logging.StreamHandler(sys.__stdout__))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Filtered before enqueuing, so suppressed records cost no queue traffic
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+    if capture_prints:
+        sys.stdout = PrintCapture(logging.getLogger("print"))
+    return listener
@@ -0,0 +1,189 @@
+"""
+Shadow copy of the instrument configuration.
+
+One ShadowState holds the last known value of every configurable parameter of
+the LakeShore (setpoint, PID, heater range, excitation, channel on/off, dwell,
+pause...), so readers never need a device round trip:
+
+    shadow.get("dwell_MXC")             # -> 10
+    shadow.values()                     # -> {name: value} of every parameter
+
+Two kinds of updates keep it authoritative:
+
+    write(name, value)      a client command wrote the value to the device
+                            (verified=True if it was also read back)
+    observe(values, read_at)
+                            the verifier (a ShadowVerifier thread) read these
+                            values from the device; they win over any earlier
+                            write
+
+Every parameter carries a version, bumped each time its value changes, and the
+time the device last confirmed it. A device read that started before the last
+write of a parameter is ignored for that parameter, so a poll racing with a
+command cannot undo the write. A write the device later contradicts is
+reported as a drift.
+"""
+
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+@dataclass
+class ShadowValue:
+
+    """
+    Attributes:
+        value: Last known value, in the format of the device readings (None until known).
+        version (int): Number of changes of the value, 0 until known.
+        source (str): "write" or "device", origin of the current value.
+        updated (float): time.time() of the last change.
+        verified (float): time.time() the device last confirmed the value (None if never).
+    """
+
+    value: object = None
+    version: int = 0
+    source: str | None = None
+    updated: float | None = None
+    verified: float | None = None
+    written_at: float | None = None     # time.monotonic() of the last write
+
+    def to_dict(self) -> dict:
+        entry = asdict(self)
+        del entry['written_at']
+        return entry
+
+class ShadowState:
+
+    """
+    Thread-safe shadow of the instrument parameters.
+    Args:
+        names (iterable): Parameters known from the start (others are added on their first update).
+    """
+
+    def __init__(self, names=()):
+        self._lock = threading.Lock()
+        self._entries = {name: ShadowValue() for name in names}
+        self.version = 0        # Total number of changes, to notice any change at once
+        self.drifts = 0         # Writes the device later contradicted
+
+    def get(self, name: str, default=None):
+        with self._lock:
+            entry = self._entries.get(name)
+            return entry.value if entry is not None and entry.version else default
+
+    def entry(self, name: str) -> ShadowValue | None:
+        with self._lock:
+            entry = self._entries.get(name)
+            return ShadowValue(**asdict(entry)) if entry is not None else None
+
+    def values(self) -> dict:
+        """ {name: value} of every parameter (None while unknown). """
+        with self._lock:
+            return {name: entry.value for name, entry in self._entries.items()}
+
+    def entries(self) -> dict:
+        """ {name: ShadowValue.to_dict()} of every parameter. """
+        with self._lock:
+            return {name: entry.to_dict() for name, entry in self._entries.items()}
+
+    def write(self, name: str, value, verified: bool = False):
+        """ Record a value a command wrote to the device (verified: it was read back too). """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.setdefault(name, ShadowValue())
+            self._set(entry, value, "write", now)
+            entry.written_at = time.monotonic()
+            entry.verified = now if verified else None
+
+    def observe(self, values: dict, read_at: float):
+        """
+        Reconcile with values read from the device.
+        Args:
+            values (dict): {name: value} read; None values (failed reads) are skipped.
+            read_at (float): time.monotonic() when the read was requested.
+        """
+        now = time.time()
+        drifts = []
+        with self._lock:
+            for name, value in values.items():
+                if value is None:
+                    continue
+                entry = self._entries.setdefault(name, ShadowValue())
+                if entry.written_at is not None and read_at < entry.written_at:
+                    continue    # Read before the last write: it says nothing about the new value
+                if entry.source == "write" and entry.value != value:
+                    self.drifts += 1
+                    drifts.append((name, entry.value, value))
+                self._set(entry, value, "device", now)
+                entry.verified = now
+        for name, written, actual in drifts:
+            print(f"⚠️ {name} was written as {written!r} but the device reports {actual!r}")
+
+    def _set(self, entry: ShadowValue, value, source: str, now: float):
+        # Called with the lock held
+        if entry.version == 0 or entry.value != value:
+            entry.version += 1
+            entry.updated = now
+            self.version += 1
+        # Keep the device's representation (e.g. 10 rather than 10.0) even when equal
+        entry.value = value
+        entry.source = source
+
+class ShadowVerifier:
+
+    """
+    Thread reconciling a ShadowState with the device: read() every interval, and
+    at once whenever refresh is set (e.g. after a client write).
+    Args:
+        state (ShadowState): The shadow to verify.
+        read (callable): read() -> {name: value} read from the device itself (not
+            from a driver cache); None values are failed reads.
+        interval (float): Seconds between verifications without a refresh.
+        refresh (threading.Event): Set it to verify without waiting for the interval.
+        on_verify (callable): on_verify(reason) before each verification, reason
+            "start", "interval" or "write" (None to not report it).
+    Attributes:
+        verified_at (float): time.monotonic() the last verification was requested (None if never).
+    """
+
+    def __init__(self, state: ShadowState, read, interval: float, refresh: threading.Event | None = None, on_verify=None):
+        self.state = state
+        self.read = read
+        self.interval = interval
+        self.refresh = refresh if refresh is not None else threading.Event()
+        self.on_verify = on_verify
+        self.verified_at = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="shadow-verifier", daemon=True)
+
+    def verify(self, reason: str = "start") -> bool:
+        """ Read the device once and reconcile the shadow. Returns False if the read failed. """
+        if self.on_verify is not None:
+            self.on_verify(reason)
+        requested = time.monotonic()
+        try:
+            values = self.read()
+        except Exception as e:
+            print(f"Verifying the shadow state failed.\nReason: {e}")
+            return False
+        self.state.observe(values, requested)
+        self.verified_at = requested
+        return True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = None):
+        self._stopped.set()
+        self.refresh.set()      # Wake the thread up
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            refreshed = self.refresh.wait(self.interval)
+            if self._stopped.is_set():
+                return
+            # Cleared before reading: a write during the read triggers another verification
+            self.refresh.clear()
+            self.verify("write" if refreshed else "interval")
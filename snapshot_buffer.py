@@ -0,0 +1,153 @@
+"""
+Ring buffer of acquisition snapshots shared between the acquisition and its publishers.
+
+The acquisition thread only appends one immutable Snapshot per poll tick.
+Every consumer (TCP broadcast, console log, HTTP feed, persistence...) runs in
+its own SnapshotPublisher thread and reads the ring at its own pace, so a slow
+consumer never stretches the sample period or delays the other consumers:
+
+    ring = SnapshotRing(256)
+    SnapshotPublisher(ring, "broadcast", send_snapshot).start()
+    ring.append(sensor_values, control_params, sensor_params)
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from types import MappingProxyType
+
+@dataclass(frozen=True)
+class Snapshot:
+
+    """
+    One acquisition tick. The dictionaries are read-only views and must not be
+    modified by consumers.
+    Attributes:
+        seq (int): Sequence number, increasing by one per tick from 1.
+        timestamp (float): Wall-clock time of the tick (time.time()).
+        monotonic (float): time.monotonic() of the tick, for ages and rates.
+        sensor_values (Mapping): temperatures, resistances, powers and ages per channel.
+        control_params (Mapping): MXC setpoint, PID and heater range.
+        sensor_params (Mapping): Excitation, dwell/pause times, autoscan and enabled channels.
+        extra (Mapping): Any other state published with the tick (e.g. software heater settings).
+    """
+
+    seq: int
+    timestamp: float
+    monotonic: float
+    sensor_values: MappingProxyType
+    control_params: MappingProxyType
+    sensor_params: MappingProxyType
+    extra: MappingProxyType
+
+class SnapshotRing:
+
+    """
+    Fixed-size ring of the latest snapshots (thread-safe). Old snapshots are
+    overwritten once `capacity` newer ones have been appended.
+    """
+
+    def __init__(self, capacity: int = 256):
+        if capacity < 1:
+            raise ValueError("The snapshot ring capacity must be at least 1")
+        self.capacity = capacity
+        self._snapshots = deque(maxlen=capacity)
+        self._seq = 0
+        self._condition = threading.Condition()
+
+    def append(self, sensor_values: dict, control_params: dict, sensor_params: dict, extra: dict | None = None,
+               timestamp: float | None = None) -> Snapshot:
+        """ Store a new tick and wake up the consumers waiting for it. """
+        with self._condition:
+            self._seq += 1
+            snapshot = Snapshot(
+                seq=self._seq,
+                timestamp=time.time() if timestamp is None else timestamp,
+                monotonic=time.monotonic(),
+                sensor_values=MappingProxyType(sensor_values),
+                control_params=MappingProxyType(control_params),
+                sensor_params=MappingProxyType(sensor_params),
+                extra=MappingProxyType(extra or {}),
+            )
+            self._snapshots.append(snapshot)
+            self._condition.notify_all()
+        return snapshot
+
+    @property
+    def last_seq(self) -> int:
+        """ Sequence number of the latest snapshot (0 before the first one). """
+        return self._seq
+
+    def latest(self) -> Snapshot | None:
+        with self._condition:
+            return self._snapshots[-1] if self._snapshots else None
+
+    def since(self, seq: int) -> list:
+        """ Snapshots still in the ring with a sequence number greater than seq, oldest first. """
+        with self._condition:
+            return self._since(seq)
+
+    def _since(self, seq: int) -> list:
+        if not self._snapshots or self._snapshots[-1].seq <= seq:
+            return []
+        first = self._snapshots[0].seq
+        return list(self._snapshots)[max(0, seq + 1 - first):]
+
+    def wait_since(self, seq: int, timeout: float | None = None) -> list:
+        """ Like since(), but waits up to timeout seconds for a snapshot newer than seq. """
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > seq, timeout)
+            return self._since(seq)
+
+class SnapshotPublisher:
+
+    """
+    Thread feeding the snapshots of a ring to a publish callback.
+    Args:
+        ring (SnapshotRing): The ring to consume.
+        name (str): Name used in the thread name and error messages.
+        publish (callable): publish(snapshot), called in this publisher thread.
+        every_snapshot (bool): If False (default), only the latest snapshot is
+            published when the consumer fell behind (intermediate ticks are
+            skipped); if True every snapshot still in the ring is published in order.
+    Attributes:
+        published (int): Snapshots passed to publish.
+        skipped (int): Snapshots not published (skipped while behind or overwritten in the ring).
+    """
+
+    def __init__(self, ring: SnapshotRing, name: str, publish, every_snapshot: bool = False):
+        self.ring = ring
+        self.name = name
+        self.publish = publish
+        self.every_snapshot = every_snapshot
+        self.published = 0
+        self.skipped = 0
+        self._seq = ring.last_seq
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"publisher-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = None):
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            snapshots = self.ring.wait_since(self._seq, timeout=1.0)
+            if not snapshots:
+                continue
+            self.skipped += snapshots[0].seq - self._seq - 1     # Overwritten before being read
+            if not self.every_snapshot:
+                self.skipped += len(snapshots) - 1
+                snapshots = snapshots[-1:]
+            for snapshot in snapshots:
+                self._seq = snapshot.seq
+                try:
+                    self.publish(snapshot)
+                    self.published += 1
+                except Exception as e:
+                    print(f"Error publishing snapshot {snapshot.seq} to {self.name}: {e}")
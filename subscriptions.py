@@ -0,0 +1,163 @@
+"""
+Field-filtered, rate-decimated subscriptions.
+
+    SUB fields=MXC,RMXC rate=0.1 agg=mean
+
+subscribes to the MXC temperature and resistance, averaged over windows of
+1 / rate = 10 seconds. Options:
+
+    fields=a,b,...    broadcast fields to send (names of wire_format.FIELDS)
+    channels=MXC,...  every reading field of a channel (temperature, R, P, age, enabled)
+    rate=<Hz>         lines per second (default: every acquisition tick)
+    agg=last|mean|min|max
+                      how the ticks of a window are combined (default: last);
+                      non-numeric values always use the last one
+
+Each line is "seq: <tick>,time: <timestamp>,name: value,...". Subscribers asking
+for the same selection share one FilteredStream, so each distinct subscription
+is aggregated and encoded once per tick however many clients use it.
+"""
+
+import threading
+import time
+
+from wire_format import CHANNEL_IDS, FIELD_NAMES, format_text_fields
+
+AGGREGATIONS = ("last", "mean", "min", "max")
+GROUP_GRACE_PERIOD = 10.0   # Seconds a group without subscribers is kept before being dropped
+
+def channel_fields(channel_id: str) -> list:
+    """ Reading fields of a channel: temperature, resistance, power, age and enabled flag. """
+    return [channel_id, f"R{channel_id}", f"P{channel_id}", f"age{channel_id}", f"enabled{channel_id}"]
+
+class Subscription:
+
+    """
+    A parsed subscription request.
+    Attributes:
+        fields (tuple): Selected field names, in schema order.
+        rate (float | None): Lines per second, None for every tick.
+        agg (str): One of AGGREGATIONS.
+    """
+
+    def __init__(self, fields, rate: float | None = None, agg: str = "last"):
+        unknown = [name for name in fields if name not in FIELD_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown fields {unknown}")
+        if not fields:
+            raise ValueError("No fields selected")
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"agg must be one of {AGGREGATIONS}")
+        self.fields = tuple(name for name in FIELD_NAMES if name in set(fields))
+        self.rate = rate
+        self.agg = agg
+
+    @classmethod
+    def parse(cls, options: list):
+        """ Build a subscription from the "key=value" options following SUB. """
+        fields = []
+        rate = None
+        agg = "last"
+        for option in options:
+            key, separator, value = option.partition("=")
+            key = key.lower()
+            if not separator or not value:
+                raise ValueError(f"Expected key=value, got {option!r}")
+            if key == "fields":
+                fields += [name.strip() for name in value.split(",") if name.strip()]
+            elif key == "channels":
+                for channel_id in value.split(","):
+                    channel_id = channel_id.strip().upper()
+                    if channel_id not in CHANNEL_IDS:
+                        raise ValueError(f"Unknown channel {channel_id!r} (valid: {CHANNEL_IDS})")
+                    fields += channel_fields(channel_id)
+            elif key == "rate":
+                try:
+                    rate = float(value)
+                except ValueError:
+                    raise ValueError(f"rate must be a number, got {value!r}")
+            elif key == "agg":
+                agg = value.lower()
+            else:
+                raise ValueError(f"Unknown subscription option {key!r}")
+        if not fields:
+            fields = list(FIELD_NAMES)
+        return cls(fields, rate, agg)
+
+    @property
+    def key(self) -> str:
+        """ Stream name shared by every subscriber with the same selection. """
+        rate = "tick" if self.rate is None else f"{self.rate:g}"
+        return f"filtered:{','.join(self.fields)};rate={rate};agg={self.agg}"
+
+def _aggregate(values: list, agg: str):
+    numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    if agg == "last" or not numbers:
+        return values[-1]
+    if agg == "mean":
+        return sum(numbers) / len(numbers)
+    if agg == "min":
+        return min(numbers)
+    return max(numbers)
+
+class FilteredStream:
+
+    """ Aggregates the ticks of a subscription and builds its lines. """
+
+    def __init__(self, subscription: Subscription):
+        self.subscription = subscription
+        self.window = None if subscription.rate is None else 1.0 / subscription.rate
+        self._window_start = None
+        self._values = {name: [] for name in subscription.fields}
+
+    def update(self, seq: int, timestamp: float, monotonic: float, fields: dict) -> bytes | None:
+        """ Add a tick; returns the line to send when the window is complete, else None. """
+        for name in self.subscription.fields:
+            self._values[name].append(fields.get(name))
+        if self._window_start is None:
+            self._window_start = monotonic
+        if self.window is not None and monotonic - self._window_start < self.window:
+            return None
+
+        line = {'seq': seq, 'time': f"{timestamp:.3f}"}
+        for name in self.subscription.fields:
+            line[name] = _aggregate(self._values[name], self.subscription.agg)
+            self._values[name].clear()
+        self._window_start = monotonic if self.window is None else self._window_start + self.window
+        if self.window is not None and monotonic - self._window_start >= self.window:
+            self._window_start = monotonic     # The acquisition stalled: restart the window
+        return (format_text_fields(line) + "\n").encode('utf-8')
+
+class SubscriptionGroups:
+
+    """ The distinct filtered subscriptions in use (thread-safe). """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams = {}      # {key: FilteredStream}
+        self._idle_since = {}   # {key: monotonic time the group was first seen without subscribers}
+
+    def register(self, subscription: Subscription) -> str:
+        with self._lock:
+            key = subscription.key
+            if key not in self._streams:
+                self._streams[key] = FilteredStream(subscription)
+            self._idle_since.pop(key, None)
+            return key
+
+    def streams(self) -> list:
+        with self._lock:
+            return list(self._streams.items())
+
+    def prune(self, has_subscribers) -> None:
+        """ Drop the groups that have had no subscribers for GROUP_GRACE_PERIOD. """
+        now = time.monotonic()
+        with self._lock:
+            for key in list(self._streams):
+                if has_subscribers(key):
+                    self._idle_since.pop(key, None)
+                elif now - self._idle_since.setdefault(key, now) >= GROUP_GRACE_PERIOD:
+                    del self._streams[key]
+                    del self._idle_since[key]
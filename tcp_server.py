@@ -1,11 +1,71 @@
+import functools
+import logging
+import queue
 import socket
 import random
 import time
 import threading
+from collections import deque
 from lakeshore370_dummy import LakeShore370
+from device_worker import DeviceWorker, PRIORITY_POLL
+from command_stats import format_summary, is_timeout
+from command_registry import Argument, CommandRegistry, retry
+from command_jobs import JobQueue, format_event
+from event_server import EventServer
+from snapshot_buffer import SnapshotRing, SnapshotPublisher
+import wire_format
+from delta_stream import DeltaEncoder, encode_keyframe
+from subscriptions import Subscription, SubscriptionGroups
+from history_buffer import HistoryRing, parse_since
+from server_logging import setup_logging
+from metrics import Counter, Gauge, MetricsRegistry, MetricsServer
+from shadow_state import ShadowState, ShadowVerifier
+try:
+    import curves
+except ImportError:     # Without NumPy the temperatures are read from the device (RDGK?)
+    curves = None
 from default_config import DEFAULT_PID, CURRENT_RANGE_LIST, DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS, SENSOR_RESISTANCE_RANGE_LIST, DEFAULT_CHANNELS, DEFAULT_CHANNELS_ID, DEFAULT_SETTINGS
 
-ls = LakeShore370()
+# Metrics (see metrics.py): OpenMetrics text served on METRICS_PORT, mirrored by http_server at /metrics
+METRICS_PORT = 9100
+SAMPLE_RATE_WINDOW = 60.0       # Seconds over which the achieved sample rate of each channel is computed
+metrics = MetricsRegistry()
+poll_duration = metrics.histogram("lakeshore_poll_duration_seconds", "Duration of an acquisition poll cycle")
+poll_errors = metrics.counter("lakeshore_poll_errors", "Acquisition poll cycles that failed")
+channel_readings = metrics.counter("lakeshore_channel_readings", "Readings stored per channel", ("channel",))
+serial_latency = metrics.histogram("lakeshore_serial_rtt_seconds", "Serial round trip of a device transaction", ("command",))
+serial_lock_wait = metrics.histogram("lakeshore_serial_lock_wait_seconds",
+                                     "Wait for the driver mutex and the command pacing before a transaction", ("command",))
+serial_failures = metrics.counter("lakeshore_serial_failures", "Failed device transactions", ("command", "kind"))
+device_queue_wait = metrics.histogram("lakeshore_device_queue_wait_seconds",
+                                      "Time a device operation waited for the device worker", ("priority",))
+command_latency = metrics.histogram("tcp_command_duration_seconds", "Parse and run time of a client command", ("command",))
+command_failures = metrics.counter("tcp_command_failures", "Client commands rejected or raising an error", ("command",))
+config_reads = metrics.counter("lakeshore_config_reads", "Reads of the control/configuration tier", ("reason",))
+sample_times = {channel_id: deque(maxlen=1000) for channel_id in DEFAULT_CHANNELS_ID}     # monotonic() of the last readings
+metrics_started = time.monotonic()
+
+def _observe_serial(key: str, samples: dict, error):
+    # Called by the driver's CommandStats for every transaction
+    if "lock" in samples:
+        serial_lock_wait.observe(samples["lock"], command=key)
+    if "rtt" in samples:
+        serial_latency.observe(samples["rtt"], command=key)
+    if error is not None:
+        serial_failures.inc(command=key, kind="timeout" if is_timeout(error) else "error")
+
+def _observe_command(key: str, samples: dict, error):
+    # Called by the command registry's CommandStats for every client command
+    command_latency.observe(sum(samples.values()), command=key)
+    if error is not None:
+        command_failures.inc(command=key)
+
+def _observe_device_wait(priority: int, seconds: float):
+    device_queue_wait.observe(seconds, priority="poll" if priority == PRIORITY_POLL else "command")
+
+# The device worker thread owns the LakeShore: every device access goes through it
+device = DeviceWorker(LakeShore370(), on_wait=_observe_device_wait)
+device.call(lambda ls: ls.command_stats.add_observer(_observe_serial))
 
 
 
@@ -13,7 +73,14 @@ ls = LakeShore370()
 HOST = '0.0.0.0' # Listen on all network interfaces
 PORT = 65432  # Port to listen on
 
-# Mutex to protect the heater power level
+# Acquisition mode:
+#   "all"  - read every enabled channel on each tick
+#   "scan" - follow the scanner and only read the channel it is measuring
+ACQUISITION_MODE = "scan"
+POLL_INTERVAL = 0.5             # Seconds between ticks in "all" mode
+SCAN_POLL_INTERVAL = 0.25       # Seconds between ticks in "scan" mode
+
+# Mutex to protect the (software) heater settings below
 heater_mutex = threading.Lock() 
 
 
@@ -35,26 +102,16 @@ def apply_default_channel_timing(channel: int) -> bool:
         print(f"Error parsing DEFAULT_SETTINGS for channel {channel}: {e}")
         return False
 
-    ok = True
-    try:
-        with heater_mutex:
-            ok_dwell = ls.set_channel_dwell_time(dwell, channel=channel)
-        if not ok_dwell:
-            ok = False
-    except Exception as e:
-        print(f"Error applying default dwell to channel {channel}: {e}")
-        ok = False
-
+    # Dwell y pause se escriben juntos en un único INSET (lectura-modificación-escritura atómica)
     try:
-        with heater_mutex:
-            ok_pause = ls.set_channel_pause_time(pause, channel=channel)
-        if not ok_pause:
-            ok = False
+        ok = bool(device.call("update_inset", channel, dwell=dwell, pause=pause))
     except Exception as e:
-        print(f"Error applying default pause to channel {channel}: {e}")
+        print(f"Error applying default timing to channel {channel}: {e}")
         ok = False
 
     if ok:
+        shadow.write(f"dwell_{_channel_id(channel)}", dwell)
+        shadow.write(f"pause_{_channel_id(channel)}", pause)
         print(f"✅ Applied default timing to channel {channel}: dwell={dwell}s, pause={pause}s")
     else:
         print(f"⚠️ Could not fully apply default timing to channel {channel}")
@@ -67,26 +124,28 @@ def apply_default_mxc_settings() -> None:
     Aplica los parámetros por defecto de MXC (PID y ajustes de resistencia).
     """
     try:
-        with heater_mutex:
-            ls.set_control_parameters(
-                P=DEFAULT_PID["P"],
-                I=DEFAULT_PID["I"],
-                D=DEFAULT_PID["D"],
-            )
-
-            ls.set_sensor_resistance_settings(
-                channel=6,
-                settings=DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS,
-            )
+        device.call(
+            "set_control_parameters",
+            P=DEFAULT_PID["P"],
+            I=DEFAULT_PID["I"],
+            D=DEFAULT_PID["D"],
+        )
+
+        device.call(
+            "set_sensor_resistance_settings",
+            channel=6,
+            settings=DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS,
+        )
 
         print("✅ Applied default MXC PID and resistance settings")
     except Exception as e:
         print(f"Error applying default MXC settings: {e}")
 
-# Global variables
-clients = [] # List to keep track of connected clients
-clients_lock = threading.Lock() # Mutex to protect the clients list
+# Acquisition snapshots shared with the publishers (see snapshot_buffer.py)
+SNAPSHOT_RING_SIZE = 256
+snapshots = SnapshotRing(SNAPSHOT_RING_SIZE)
 
+# Global variables
 current_temperature_setpoint = 0.0 # Current temperature setpoint for PID controll (in K)
 current_heater_power = 0.0 # Current heater power level (0.0 to 1.0)
 current_heater_range = 'LOW' # Current heater power range ('LOW', 'MID', 'HIGH')
@@ -95,1053 +154,896 @@ current_timeout = 300.0 # Current temperature setpoint for control (in s)
 current_proportional_gain = 0.0 # Current proportional gain
 current_integral_gain = 0.0 # Current integral gain
 current_derivative_gain = 0.0 # Current derivative gain
-current_mxc_temperature_setpoint = 0.0 # Current MXC temperature setpoint
-current_mxc_proportional_gain = DEFAULT_PID['P'] # Current MXC proportional gain
-current_mxc_integral_gain = DEFAULT_PID['I'] # Current MXC integral gain
-current_mxc_derivative_gain = DEFAULT_PID['D'] # Current MXC derivative gain
-current_mxc_resistance_mode = DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS['excitation_mode'] # Current MXC resistance mode
-current_mxc_resistance_range = DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS['excitation_range'] # Current MXC resistance range
-current_mxc_resistance_autorange = DEFAULT_MXC_RESISTANCE_RANGE_SETTINGS['autorange'] # Current MXC resistance autorange
-
-def _is_connected(sock) -> bool:
-    try:
-        return sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0 and sock.fileno() != -1
-    except OSError:
+
+# Shadow of the instrument configuration (see shadow_state.py): updated by the commands that
+# write the device, reconciled by the configuration verifier thread, and read by the broadcast
+# and the commands instead of querying the device. Values are kept as the device readings return them.
+RESISTANCE_SETTINGS = {     # get_sensor_resistance_settings(channel=6) key -> shadow parameter
+    'excitation_mode': "mxc_excitation_mode",
+    'excitation_range': "mxc_excitation_range",
+    'resistance_range': "mxc_resistance_range",
+    'autorange': "mxc_autorange",
+    'excitation': "mxc_excitation",
+}
+CHANNEL_PARAMETERS = ("enabled", "dwell", "pause", "curve")     # Per channel: "<parameter>_<channel id>"
+SHADOW_PARAMETERS = (("mxc_setpoint", "mxc_P", "mxc_I", "mxc_D", "mxc_heater_range", "control_settings", "scan")
+                     + tuple(RESISTANCE_SETTINGS.values())
+                     + tuple(f"{parameter}_{channel_id}" for parameter in CHANNEL_PARAMETERS for channel_id in DEFAULT_CHANNELS_ID))
+shadow = ShadowState(SHADOW_PARAMETERS)
+
+# Commands of the TCP server, "name" or "name:arg:arg" (see command_registry.py)
+commands = CommandRegistry()
+commands.stats.add_observer(_observe_command)
+
+# Software heater settings: plain values guarded by heater_mutex
+def _software_heater_setter(variable: str, message: str):
+    def setter(**arguments):
+        (value,) = arguments.values()
+        with heater_mutex:
+            globals()[variable] = value
+        return message.format(value)
+    return setter
+
+for name, variable, argument, message, error in (
+    # "set_temperature_setpoint:10" in Kelvin
+    ("set_temperature_setpoint", "current_temperature_setpoint",
+     Argument("setpoint", float, minimum=0.0, maximum=20.0, error="Temperature setpoint should be between 0 K and 20 K"),
+     "Temperature setpoint to {}", "Error setting new temperature setpoint"),
+    # "set_heater_power:0.5"
+    ("set_heater_power", "current_heater_power",
+     Argument("power", float, minimum=0.0, maximum=1.0, error="Heater power must be between 0.0 and 1.0"),
+     "Set heater power to {}", "Error setting heater power"),
+    # "set_heater_range:LOW"
+    ("set_heater_range", "current_heater_range",
+     Argument("range", str, choices=('LOW', 'MID', 'HIGH'), error="Heater range must be LOW, MID or HIGH"),
+     "Set heater range to {}", "Error setting heater range"),
+    # "set_temperature_limit:20" in K
+    ("set_temperature_limit", "current_temperature_limit",
+     Argument("limit", float, check=lambda value: 0.0 < value <= 30.0, error="Temperature limit must be positive and lower than 30 K"),
+     "Set temperature limit to {} K", "Error setting temperature limit"),
+    # "set_timeout:300" in s
+    ("set_timeout", "current_timeout",
+     Argument("timeout", float, check=lambda value: value > 0.0, error="Controll timeout must be positive"),
+     "Set timeout to {} s", "Error setting timeout"),
+    # "set_proportional_gain:0.5", "set_integral_gain:0.5", "set_derivative_gain:0.5"
+    ("set_proportional_gain", "current_proportional_gain",
+     Argument("gain", float, minimum=0.0, error="Proportional gain must be non-negative"),
+     "Set proportional gain to {}", "Error setting proportional gain"),
+    ("set_integral_gain", "current_integral_gain",
+     Argument("gain", float, minimum=0.0, error="Integral gain must be non-negative"),
+     "Set integral gain to {}", "Error setting integral gain"),
+    ("set_derivative_gain", "current_derivative_gain",
+     Argument("gain", float, minimum=0.0, error="Derivative gain must be non-negative"),
+     "Set derivative gain to {}", "Error setting derivative gain"),
+):
+    commands.add(name, _software_heater_setter(variable, message), argument, error=error)
+
+# MXC control loop of the LakeShore (channel 6)
+@commands.command("set_mxc_temperature_setpoint",
+                  Argument("setpoint", float, minimum=10.0, maximum=500.0, error="❌ Temperature setpoint for MXC must be between 10 mK and 500 mK"),
+                  error="❌ Error setting temperature setpoint for MXC", coalesce=True)
+def set_mxc_temperature_setpoint(setpoint):
+    # "set_mxc_temperature_setpoint:100" in mK
+    if not device.call("set_channel_setpoint", setpoint, channel=6):
+        return "❌ Failed to set temperature setpoint for MXC"
+
+    actual_setpoint = retry(device.call, "get_channel_setpoint", channel=6, attempts=5)
+    if actual_setpoint is None:
+        return "❌ Failed to read back MXC setpoint after multiple attempts."
+    shadow.write("mxc_setpoint", actual_setpoint, verified=True)
+    actual_setpoint *= 1000  # Convert to mK for consistency
+
+    if abs(actual_setpoint - setpoint) < 1e-2:
+        return f"✅ Setpoint for MXC succesfully set to {setpoint} mK"
+    return (f"⚠️ Mismatch: Tried to set MXC setpoint to {setpoint:.2f} mK, "
+            f"but the device reports {actual_setpoint:.2f} mK")
+
+def _mxc_gain_setter(key: str, label: str):
+    def setter(gain):
+        if not device.call("set_control_parameters", **{key: gain}):
+            return f"❌ Failed to set {label} gain for MXC"
+        actual_gain = retry(lambda: (device.call("get_control_parameters") or {}).get(key))
+        if actual_gain is None:
+            return f"❌ Failed to read back MXC {label} gain after multiple attempts."
+        shadow.write(f"mxc_{key}", actual_gain, verified=True)
+        return f"✅ {label.capitalize()} gain for MXC succesfully set to {gain}"
+    return setter
+
+for key, label in (("P", "proportional"), ("I", "integral"), ("D", "derivative")):
+    # "set_mxc_proportional_gain:1.0", ...
+    commands.add(f"set_mxc_{label}_gain", _mxc_gain_setter(key, label),
+                 Argument("gain", float, minimum=0.0, error=f"❌ {label.capitalize()} gain must be non-negative"),
+                 error=f"❌ Error setting {label} gain for MXC", coalesce=True)
+
+@commands.command("set_mxc_heater_range",
+                  Argument("range", int, minimum=0, maximum=8, error="❌ Heater range must be between 0 (OFF) and 8 (100 mA)"),
+                  error="❌ Error setting heater range for MXC", coalesce=True)
+def set_mxc_heater_range(range):
+    # "set_mxc_heater_range:<0 (OFF) to 8 (100 mA)>", see CURRENT_RANGE_LIST
+    new_range = str(range)
+    if not device.call("set_control_range", new_range):
+        return "❌ Failed to set heater range for MXC"
+    shadow.write("mxc_heater_range", new_range)
+    return f"✅ Heater range for MXC succesfully set to {CURRENT_RANGE_LIST[new_range][0]} {CURRENT_RANGE_LIST[new_range][1]}"
+
+# Scanner channels: command suffix -> (LakeShore channel, name in the replies)
+COMMAND_CHANNELS = {"mxc": (6, "MXC"), "50k": (1, "50K"), "4k": (2, "4K"), "still": (5, "STILL")}
+
+def _channel_time_setter(operation: str, kind: str, channel: int, label: str):
+    def setter(**arguments):
+        (seconds,) = arguments.values()
+        seconds = int(seconds)      # The INSET record holds whole seconds (update_inset truncates too)
+        if not device.call(operation, seconds, channel=channel):
+            return f"❌ Failed to set {kind} time for {label}"
+        shadow.write(f"{kind}_{label}", seconds)
+        return f"✅ {kind.capitalize()} time succesfully set for {label} to {seconds} s"
+    return setter
+
+def _channel_status_setter(channel: int, label: str):
+    def setter(status, reset):
+        current_status = shadow.get(f"enabled_{label}")
+        if current_status is None:
+            current_status = int(device.call("get_channel_status", channel=channel))
+        if current_status == status:
+            return f"❌ {label} sensor is already {'On' if current_status else 'Off'}"
+
+        success = retry(device.call, "set_channel_on" if status else "set_channel_off", channel, attempts=5, accept=bool)
+        if not success:
+            return f"❌ Failed to set {label} sensor {'On' if status else 'Off'}"
+        shadow.write(f"enabled_{label}", status)
+        if status and reset:
+            apply_default_channel_timing(channel)
+            if channel == 6:
+                apply_default_mxc_settings()
+        return f"✅ {label} sensor is now {'On' if status else 'Off'}"
+    return setter
+
+for suffix, (channel, label) in COMMAND_CHANNELS.items():
+    # "set_dwell_mxc:5.0", "set_pause_mxc:5.0" in s
+    commands.add(f"set_dwell_{suffix}", _channel_time_setter("set_channel_dwell_time", "dwell", channel, label),
+                 Argument("dwell", float, minimum=0.0, error="❌ Dwell time must be non-negative"),
+                 error=f"❌ Error setting dwell time for {label}", coalesce=True)
+    commands.add(f"set_pause_{suffix}", _channel_time_setter("set_channel_pause_time", "pause", channel, label),
+                 Argument("pause", float, minimum=0.0, error="❌ Pause time must be non-negative"),
+                 error=f"❌ Error setting pause time for {label}", coalesce=True)
+    # "set_channel_mxc:<1 on|0 off>[:<1 apply the default settings (default)|0 keep them>]"
+    commands.add(f"set_channel_{suffix}", _channel_status_setter(channel, label),
+                 Argument("status", int, choices=(0, 1), error=f"❌ {label} sensor status must be 1 (On) or 0 (Off)"),
+                 Argument("reset", int, choices=(0, 1), default=1),
+                 error=f"❌ Error setting {label} sensor status")
+
+def _update_mxc_resistance_settings(key: str, value) -> bool:
+    # Read-modify-write of the MXC excitation settings (channel 6), read from the shadow state
+    settings = {setting: shadow.get(name) for setting, name in RESISTANCE_SETTINGS.items()}
+    if None in settings.values():
+        settings = device.call("get_sensor_resistance_settings", channel=6, return_dict=True)
+    settings[key] = str(value)
+    if not device.call("set_sensor_resistance_settings", channel=6, settings=settings):
         return False
+    shadow.write(RESISTANCE_SETTINGS[key], str(value))
+    return True
+
+@commands.command("set_sensor_range_mxc",
+                  Argument("range", int, minimum=1, maximum=8, error="❌ Sensor range for MXC must be between 1 and 8"),
+                  error="❌ Error setting sensor range for MXC")
+def set_sensor_range_mxc(range):
+    new_range = str(range)
+    if not _update_mxc_resistance_settings('excitation_range', new_range):
+        return "❌ Failed to set sensor range for MXC"
+    return f"✅ Sensor range for MXC succesfully set to {SENSOR_RESISTANCE_RANGE_LIST[new_range][0]} {SENSOR_RESISTANCE_RANGE_LIST[new_range][1]}"
+
+@commands.command("set_sensor_mode_mxc",
+                  Argument("mode", int, choices=(0, 1), error="❌ Sensor mode for MXC must be 0 (voltage) or 1 (current)"),
+                  error="❌ Error setting sensor mode for MXC")
+def set_sensor_mode_mxc(mode):
+    if not _update_mxc_resistance_settings('excitation_mode', mode):
+        return "❌ Failed to set sensor mode for MXC"
+    return f"✅ Sensor mode for MXC succesfully set to {'voltage' if mode == 0 else 'current'}"
+
+@commands.command("set_autorange_mxc",
+                  Argument("autorange", int, choices=(0, 1), error="❌ Autorange for MXC must be 0 (OFF) or 1 (ON)"),
+                  error="❌ Error setting autorange for MXC")
+def set_autorange_mxc(autorange):
+    if not _update_mxc_resistance_settings('autorange', autorange):
+        return "❌ Failed to set autorange for MXC"
+    return f"✅ Autorange for MXC successfully set to {'ON' if autorange else 'OFF'}"
+
+# Diagnostics
+@commands.command("get_command_stats", Argument("reset", str, choices=("reset",), default=None),
+                  error="❌ Error getting command statistics")
+def get_command_stats(reset):
+    # "get_command_stats" or "get_command_stats:reset" to clear them after reading.
+    # Driver transactions (lock/rtt/parse), then the device worker operations (queue/run):
+    # the queue phase is the wait for the device worker, which the driver cannot see
+    summary = device.call("get_command_stats", reset=reset == "reset")
+    stats = "\n".join(part for part in (format_summary(summary), format_summary(device.stats.summary())) if part)
+    if reset == "reset":
+        device.stats.reset()
+    print(stats)
+    return "📊 " + (stats.replace("\n", " | ") if stats else "No commands recorded")
+
+@commands.command("get_server_command_stats", Argument("reset", str, choices=("reset",), default=None),
+                  error="❌ Error getting server command statistics")
+def get_server_command_stats(reset):
+    # Parse and run time of the commands above: "get_server_command_stats[:reset]"
+    stats = format_summary(commands.stats.summary())
+    superseded = commands.coalescer.superseded
+    if reset == "reset":
+        commands.stats.reset()
+        commands.coalescer.superseded = 0
+    print(stats)
+    return "⏱️ " + (stats.replace("\n", " | ") if stats else "No commands recorded") + f" | superseded={superseded}"
+
+@commands.command("get_subscriber_stats", error="❌ Error getting subscriber statistics")
+def get_subscriber_stats():
+    stats = server.subscriber_stats()
+    message = (f"📡 subscribers={stats['subscribers']} policy={stats['policy']} queue_size={stats['queue_size']} "
+               f"frames_sent={stats['frames_sent']} frames_dropped={stats['frames_dropped']} "
+               f"slow_disconnects={stats['slow_disconnects']} sessions={stats['sessions']}")
+    for addr, subscriber in stats['per_subscriber'].items():
+        if subscriber['dropped'] or subscriber['queued']:
+            message += f" | {addr} queued={subscriber['queued']} dropped={subscriber['dropped']}"
+    return message
+
+# Instrument state: the shadow of the configuration, answered without a device round trip
+@commands.command("get_state", Argument("name", str, default=None), error="❌ Error reading the shadow state")
+def get_state(name):
+    # "get_state" or "get_state:<parameter>" (e.g. get_state:dwell_MXC): no device round trip
+    entries = shadow.entries()
+    if name is not None:
+        if name not in entries:
+            return f"❌ Unknown parameter {name!r} (valid: {', '.join(entries)})"
+        entries = {name: entries[name]}
+    now = time.time()
+    parts = []
+    for parameter, entry in entries.items():
+        verified = f"verified {now - entry['verified']:.1f} s ago" if entry['verified'] is not None else "not verified"
+        parts.append(f"{parameter}={entry['value']!r} (v{entry['version']}, {verified})")
+    return "🗂️ " + " | ".join(parts) + f" | version={shadow.version} drifts={shadow.drifts}"
+
+# Asynchronous jobs: the reply is the job id, the outcome is pushed to the "SUB EVENTS" subscribers
+def _job_finished(job):
+    print(f"🧾 Job {job.id} {job.state}: {job.command} -> {job.result}")
+    if server.has_subscribers("events"):
+        server.broadcast(format_event("job", job.to_dict()), "events")
+
+jobs = JobQueue(commands.execute, on_finished=_job_finished)
+
+@commands.command("submit_job", Argument("command", str, rest=True), error="❌ Error submitting job")
+def submit_job(command):
+    # "submit_job:set_channel_mxc:1" -> runs "set_channel_mxc:1" after the jobs already queued
+    name = command.partition(":")[0].strip()
+    if commands.get(name) is None or name in ("submit_job", "get_job"):
+        return f"❌ Unknown command for a job {name!r}"
+    try:
+        job = jobs.submit(command)
+    except queue.Full:
+        return f"❌ Too many jobs queued ({jobs.pending()}), try again later"
+    return f"🧾 Job {job.id} queued: {command}"
+
+@commands.command("get_job", Argument("job_id", int), error="❌ Error getting job")
+def get_job(job_id):
+    # "get_job:12" -> state of the job and its reply once finished
+    job = jobs.get(job_id)
+    if job is None:
+        return f"❌ Unknown job {job_id}"
+    return f"🧾 Job {job.id} {job.state}: {job.command}" + (f" -> {job.result}" if job.result is not None else "")
+
+@commands.command("help")
+def list_commands():
+    return "Commands: " + ", ".join(commands.get(name).usage() for name in commands.names())
 
-def _prune_clients():
-    removed = 0
-    with clients_lock:
-        alive = []
-        for c, a in clients:
-            try:
-                # If fileno == -1 the socket is closed; skip it
-                if c.fileno() != -1:
-                    alive.append((c, a))
-                else:
-                    removed += 1
-            except Exception:
-                removed += 1
-        clients[:] = alive
-    if removed:
-        print(f"Pruned {removed} dead subscriber(s)")
-
-# Function to handle incoming commands from clients
 def handle_command(command):
-
-    # This function will be called in a separate thread for each client
-    # It will process the input commands and control the heater accordingly
-
+    # Runs on the command pool of the event server (one call per client command)
     print(f"Received command: {command}")
-
-    global current_mxc_temperature_setpoint
-    global current_mxc_proportional_gain
-    global current_mxc_integral_gain
-    global current_mxc_derivative_gain
-    global current_mxc_resistance_autorange
-    global current_mxc_resistance_range
-    global current_mxc_resistance_mode
-    global current_temperature_setpoint
-    global current_heater_power
-    global current_heater_range
-    global current_temperature_limit
-    global current_timeout
-    global current_proportional_gain
-    global current_integral_gain
-    global current_derivative_gain
-    
-    if command.startswith("set_temperature_setpoint"):
-        # Sintaxis to set the heater power: "set_temperature_setpoint:10" in Kelvin
-        try:
-            new_temperature_setpoint = float(command.split(":")[-1])
-            if 0.0 <= new_temperature_setpoint <= 20.0:
-                with heater_mutex:
-                    current_temperature_setpoint = new_temperature_setpoint
-                message = f"Temperature setpoint to {new_temperature_setpoint}"
-                print(message)
-            else:
-                message = f"Temperature setpoint should be between 0 K and 20 K"
-                print(message)
-            return message           
-        except Exception as e:
-            message = f"Error setting new temperature setpoint: {e}"
-            print(message)
-            return message
-
-    elif command.startswith("set_heater_power"):
-        # Sintaxis to set the heater power: "set_heater_power:0.5"
-        try:
-            new_power = float(command.split(":")[-1])
-            if 0.0 <= new_power <= 1.0:
-                with heater_mutex:
-                    current_heater_power = new_power
-                message = f"Set heater power to {new_power}"
-                print(message)
-            else:
-                message = f"Heater power must be between 0.0 and 1.0"
-                print(message)
-            return message           
-        except Exception as e:
-            message = f"Error setting heater power: {e}"
-            print(message)
-            return message
-        
-    elif command.startswith("set_heater_range"):
-        # Sintaxis to set the heater power: "ser_heater_range:LOW"
-        try:
-            new_range = command.split(":")[-1]
-            if new_range in ['LOW', 'MID', 'HIGH']:
-                with heater_mutex:
-                    current_heater_range = new_range
-                message = f"Set heater range to {new_range}"
-                print(message)
-            else:
-                message = f"Heater range must be LOW, MID or HIGH"
-                print(message)
-            return(message)
-        except Exception as e:
-            message = f"Error setting heater range: {e}"
-            print(message)
-            return message
-        
-    elif command.startswith("set_temperature_limit"):
-        # Sintaxis to set the temperature limit: "set_temperature_limit:20" in K
-        try:
-            new_temperature_limit = float(command.split(":")[-1])
-            if new_temperature_limit > 0. and new_temperature_limit <= 30.0:
-                with heater_mutex:
-                    current_temperature_limit = new_temperature_limit
-                message = f"Set temperature limit to {new_temperature_limit} K"
-                print(message)
-            else:
-                message = f"Temperature limit must be positive and lower than 30 K"
-                print(message)
-            return(message)
-        except Exception as e:
-            message = f"Error setting temperature limit"
-            print(message)
-            return message
-        
-    elif command.startswith("set_timeout"):
-        # Sintaxis to set the temperature limit: "set_timeout:300" in s
-        try:
-            new_timeout = float(command.split(":")[-1])
-            if new_timeout > 0.:
-                with heater_mutex:
-                    current_timeout = new_timeout
-                message = f"Set temperature limit to {new_timeout} s"
-                print(message)
-            else:
-                message = f"Controll timeout must be positive"
-                print(message)
-            return(message)
-        except Exception as e:
-            message = f"Error setting timeout"
-            print(message)
-            return message
-        
-    elif command.startswith("set_proportional_gain"):
-        # Sintaxis to set the proportional gain: "set_proportional_gain:0.5"
-        try:
-            new_gain = float(command.split(":")[-1])
-            if new_gain >= 0.0:
-                # Set the proportional gain 
-                with heater_mutex:
-                    current_proportional_gain = new_gain
-                message = f"Set proportional gain to {new_gain}"
-                print(message)
-            else:
-                message = f"Proportional gain must be non-negative"
-                print(message)
-            return message
-        except Exception as e:
-            print(f"Error setting proportional gain: {e}")
-
-    elif command.startswith("set_integral_gain"):
-        # Sintaxis to set the integral gain: "set_integral_gain:0.5"
-        try:
-            new_gain = float(command.split(":")[-1])
-            if new_gain >= 0.0:
-                # Set the integral gain
-                with heater_mutex:
-                    current_integral_gain = new_gain
-                message = f"Set integral gain to {new_gain}"
-                print(message)
-            else:
-                message = f"Integral gain must be non-negative"
-                print(message)
-            return message
-        except Exception as e:
-            print(f"Error setting integral gain: {e}")
-
-    elif command.startswith("set_derivative_gain"):
-        # Sintaxis to set the derivative gain: "set_derivative_gain:0.5"
-        try:
-            new_gain = float(command.split(":")[-1])
-            if new_gain >= 0.0:
-                # Set the derivative gain
-                with heater_mutex:
-                    current_derivative_gain = new_gain
-                message = f"Set derivative gain to {new_gain}"
-                print(message)
-            else:
-                message = f"Derivative gain must be non-negative"
-                print(message)
-            return message
-        except Exception as e:
-            print(f"Error setting derivative gain: {e}")
-
-    elif command.startswith("set_mxc_temperature_setpoint"):
-        # Sintaxis to set the temperature setpoint for MXC: "set_temperature_setpoint_mxc:100"
-        try:
-            new_temperature_setpoint = float(command.split(":")[-1])
-            if 10.0 <= new_temperature_setpoint <= 500.0:
-                with heater_mutex:
-                    # Mutex protection ensures that only one thread acces the LakeShore device at a time
-                    success = ls.set_channel_setpoint(new_temperature_setpoint, channel=6)  # Channel 6 is MXC
-                if success:
-                    attempts = 5
-                    actual_setpoint = None
-                    for i in range(attempts):
-                        time.sleep(0.2)
-                        with heater_mutex: actual_setpoint = ls.get_channel_setpoint(channel=6)
-                        if actual_setpoint is not None:
-                            break
-
-                    if actual_setpoint is None:
-                        message = "❌ Failed to read back MXC setpoint after multiple attempts."
-                        print(message)
-                        return message
-
-                    actual_setpoint *= 1000  # Convert to mK for consistency
-                    
-                    if abs(actual_setpoint - new_temperature_setpoint) < 1e-2:
-                        current_mxc_temperature_setpoint = new_temperature_setpoint
-                        message = f"✅ Setpoint for MXC succesfully set to {new_temperature_setpoint} mK"
-                    else:
-                        message = (
-                            f"⚠️ Mismatch: Tried to set MXC setpoint to {new_temperature_setpoint:.2f} mK, "+
-                            f"but the device reports {actual_setpoint:.2f} mK"
-                        )
-                else:
-                    message = f"❌ Failed to set temperature setpoint for MXC"
-            else:
-                message = f"❌ Temperature setpoint for MXC must be between 10 mK and 500 mK"
-            print(message)
-            return message
-
-        except Exception as e:
-            message = f"❌ Error setting temperature setpoint for MXC: {e}"
-            print(message)
-            return message
-    
-    elif command.startswith("set_mxc_proportional_gain"):
-        # Sintaxis to set the proportional gain for MXC: "set_proportional_gain_mxc:1.0"
-        try:
-            new_gain = float(command.split(":")[-1])
-            if new_gain >= 0.0:
-                with heater_mutex:
-                    # Mutex protection ensures that only one thread acces the LakeShore device at a time
-                    success = ls.set_control_parameters(P=new_gain)
-                if success:
-                    attempts = 3
-                    actual_gain = None
-                    for i in range(attempts):
-                        time.sleep(0.2)
-                        with heater_mutex: actual_gain = ls.get_control_parameters()['P']
-                        if actual_gain is not None:
-                            break
-                    if actual_gain is None:
-                        message = "❌ Failed to read back MXC proportional gain after multiple attempts."
-                        print(message)
-                        return message
-                    else:
-                        current_mxc_proportional_gain = new_gain
-                        message = f"✅ Proportional gain for MXC succesfully set to {new_gain}"
-                else:
-                    message = f"❌ Failed to set proportional gain for MXC"
-            else:
-                message = f"❌ Proportional gain must be non-negative"
-            print(message)
-            return message
-
-        except Exception as e:
-            message = f"❌ Error setting proportional gain for MXC: {e}"
-            print(message)
-            return message
-    
-    elif command.startswith("set_mxc_integral_gain"):
-        # Sintaxis to set the integral gain for MXC: "set_integral_gain_mxc:1.0"
-        try:
-            new_gain = float(command.split(":")[-1])
-            if new_gain >= 0.0:
-                with heater_mutex:
-                    # Mutex protection ensures that only one thread acces the LakeShore device at a time
-                    success = ls.set_control_parameters(I=new_gain)
-                if success:
-                    attemps = 3
-                    actual_gain = None
-                    for i in range(attemps):
-                        time.sleep(0.2)
-                        with heater_mutex: actual_gain = ls.get_control_parameters()['I']
-                        if actual_gain is not None:
-                            break
-                    if actual_gain is None:
-                        message = "❌ Failed to read back MXC integral gain after multiple attempts."
-                        print(message)
-                        return message
-                    else:
-                        current_mxc_integral_gain = new_gain
-                        message = f"✅ Integral gain for MXC succesfully set to {new_gain}"
-                else:
-                    message = f"❌ Failed to set integral gain for MXC"
-            else:
-                message = f"❌ Integral gain must be non-negative"
-            print(message)
-            return message
-        except Exception as e:
-            message = f"❌ Error setting integral gain for MXC: {e}"
-            print(message)
-            return message
-            
-    elif command.startswith("set_mxc_derivative_gain"):
-        # Sintaxis to set the derivative gain for MXC: "set_derivative_gain_mxc:1.0"
-        try:
-            new_gain = float(command.split(":")[-1])
-            if new_gain >= 0.0:
-                with heater_mutex:
-                    # Mutex protection ensures that only one thread acces the LakeShore device at a time
-                    success = ls.set_control_parameters(D=new_gain)
-                if success:
-                    attempts = 3
-                    actual_gain = None
-                    for i in range(attempts):
-                        time.sleep(0.2)
-                        with heater_mutex: actual_gain = ls.get_control_parameters()['D']
-                        if actual_gain is not None:
-                            break
-                    if actual_gain is None:
-                        message = "❌ Failed to read back MXC derivative gain after multiple attempts."
-                        print(message)
-                        return message
-                    else:
-                        current_mxc_derivative_gain = new_gain
-                        message = f"✅ Derivative gain for MXC succesfully set to {new_gain}"
-                else:
-                    message = f"❌ Failed to set derivative gain for MXC"
-            else:
-                message = f"❌ Derivative gain must be non-negative"
-            print(message)
-            return message  
-        except Exception as e:
-            message = f"❌ Error setting derivative gain for MXC: {e}"
-            print(message)
-            return message
-
-    elif command.startswith("set_mxc_heater_range"):
-        # Sintaxis to set the heater range for MXC (LakeShore 370): "set_mxc_heater_range:integer" with integer between (0:OFF and 8:100mA).
-        # Check CURRENT_RANGE_LIST for the range values.
-        try:
-            new_range = str(command.split(":")[-1])
-            if 0 <= int(new_range) <= 8:
-                with heater_mutex:
-                    current_range = ls.get_control_range()
-
-                time.sleep(0.1)  # Small delay to ensure communication channel is ready
-                with heater_mutex: success = ls.set_control_range(new_range)
-                if success:
-                    current_mxc_heater_range = new_range
-                    message = f"✅ Heater range for MXC succesfully set to {CURRENT_RANGE_LIST[str(new_range)][0]} {CURRENT_RANGE_LIST[str(new_range)][1]}"
-                else:
-                    message = f"❌ Failed to set heater range for MXC"
-                print(message)
-                return message
-            else:
-                message = f"❌ Heater range must be between 0 (OFF) and 8 (100 mA)"
-                print(message)
-                return message
-                
-        except Exception as e:
-            message = f"❌ Error setting heater range for MXC: {e}"
-            print(message)
-            return message
-
-    elif command.startswith("set_dwell_mxc"):
-        # Sintaxis to set the dwell time for MXC: "set_dwell_mxc:5.0"
-        try:
-            new_dwell_time = float(command.split(":")[-1])
-            if new_dwell_time >= 0.0:
-                with heater_mutex: success = ls.set_channel_dwell_time(new_dwell_time, channel=6)  # Channel 6 is MXC
-                if success:
-                    message = f"✅ Dwell time succesfully set for MXC to {new_dwell_time} s"
-                else:
-                    message = f"❌ Failed to set dwell time for MXC"
-                print(message)                
-            else:
-                message += f"Dwell time must be non-negative"
-                print(message)
-            return message
-
-        except Exception as e:
-            message = f"Error setting dwell time for MXC: {e}"
-            print(message)
-            return message
-
-    elif command.startswith("set_dwell_50k"):
+    return commands.dispatch(command)
+
+def reply_line(message: str) -> bytes:
+    # Line-delimited response sent back to the client
+    return b"Command received - " + message.encode('utf-8') + b"\n"
+
+def command_reply(text: str) -> bytes:
+    # Runs on the event server command pool; builds the line sent back to a command connection
+    return reply_line(handle_command(text))
+
+def superseded_reply(text: str, later_texts: list) -> bytes | None:
+    # A queued session command is skipped when the same session already queued a newer value of its parameter
+    key = commands.coalesce_key(text)
+    if key is None:
+        return None
+    for later in reversed(later_texts):
+        if commands.coalesce_key(later) == key:
+            commands.coalescer.superseded += 1
+            return reply_line(f"⏭️ {text.strip()} superseded by {later.strip()}")
+    return None
+
+def subscription_stream(request: str) -> str:
+    # "SUB" -> legacy text line, "SUB BIN" -> binary frames (see wire_format.py),
+    # "SUB DELTA" -> keyframes and deltas (see delta_stream.py), "SUB EVENTS" -> job events (see command_jobs.py),
+    # "SUB fields=.. rate=.. agg=.." -> filtered stream shared by identical requests (see subscriptions.py),
+    # "SUB BIN since=<seq|timestamp|-seconds>" or "SUB BIN REPLAY" -> history backlog, then live (see history_buffer.py)
+    # Only an exact "SUB" token selects the newer streams: legacy "SUB..." requests get the text line
+    tokens = request.split()
+    options = tokens[1:]
+    if tokens[0].upper() != "SUB" or not options:
+        return "text"
+    if [option.upper() for option in options] == ["BIN"]:
+        return "bin"
+    replay = [option for option in options if option.upper() == "REPLAY" or option.lower().startswith("since=")]
+    if replay:
+        if len(replay) > 1 or [option.upper() for option in options if option not in replay] != ["BIN"]:
+            raise ValueError("History replay needs the binary stream: SUB BIN since=<seq|timestamp|-seconds> or SUB BIN REPLAY")
+        if replay[0].upper() == "REPLAY":
+            return "bin", history.frames
         try:
-            new_dwell_time = float(command.split(":")[-1])
-            if new_dwell_time >= 0.0:
-                with heater_mutex:
-                    success = ls.set_channel_dwell_time(new_dwell_time, channel=1) 
-                if success:
-                    message = f"✅ Dwell time succesfully set for 50K to {new_dwell_time} s"
-                else:
-                    message = "❌ Failed to set dwell time for 50K"
-                print(message)
-            else:
-                message = "Dwell time must be non-negative"
-                print(message)
-            return message
-        except Exception as e:
-            message = f"Error setting dwell time for 50K: {e}"
-            print(message)
-            return message
+            kind, value = parse_since(replay[0].partition("=")[2], time.time())
+        except ValueError:
+            raise ValueError(f"Invalid {replay[0]!r}: expected a sequence number, a timestamp or -seconds")
+        if kind == "seq":
+            return "bin", functools.partial(history.frames_since_seq, value)
+        return "bin", functools.partial(history.frames_since_time, value)
+    if [option.upper() for option in options] == ["DELTA"]:
+        return "delta"
+    if [option.upper() for option in options] == ["EVENTS"]:
+        return "events"
+    if all("=" in option for option in options):
+        return subscription_groups.register(Subscription.parse(options))
+    raise ValueError(f"Unknown subscription options: {' '.join(options)}")
+
+# Event loop serving subscribers and command connections (see event_server.py)
+SUBSCRIBER_QUEUE_SIZE = 16              # Broadcast lines queued per subscriber
+SLOW_SUBSCRIBER_POLICY = "drop_oldest"  # "drop_oldest", "coalesce" or "disconnect"
+delta_encoder = DeltaEncoder()
+HISTORY_SECONDS = 6 * 3600              # Backfill window of the broadcast history
+# Broadcast ticks kept for backfill: 86400 at the 0.25 s ticks of "scan" mode (about 24 MB)
+HISTORY_SIZE = int(HISTORY_SECONDS / (SCAN_POLL_INTERVAL if ACQUISITION_MODE == "scan" else POLL_INTERVAL))
+history = HistoryRing(HISTORY_SIZE)
+subscription_groups = SubscriptionGroups()
+server = EventServer(HOST, PORT, command_reply, subscription_parser=subscription_stream, queue_size=SUBSCRIBER_QUEUE_SIZE, slow_policy=SLOW_SUBSCRIBER_POLICY,
+                     supersede=superseded_reply)
+publishers = {}     # {name: SnapshotPublisher}, started by start_server
+
+def _collect_metrics() -> list:
+    # Values kept by the other components, read at scrape time
+    now = time.monotonic()
+    window = min(SAMPLE_RATE_WINDOW, now - metrics_started) or SAMPLE_RATE_WINDOW
+    sample_rate = Gauge("lakeshore_channel_sample_rate_hz", f"Readings per second of each channel over the last {SAMPLE_RATE_WINDOW:g} s", ("channel",))
+    for channel_id, times in sample_times.items():
+        recent = [read_at for read_at in list(times) if now - read_at <= SAMPLE_RATE_WINDOW]
+        sample_rate.set(round(len(recent) / window, 4), channel=channel_id)
+
+    channel_age = Gauge("lakeshore_channel_age_seconds", "Age of the published reading of each channel", ("channel",))
+    tick_age = Gauge("lakeshore_last_tick_age_seconds", "Seconds since the last acquisition tick")
+    snapshot = snapshots.latest()
+    if snapshot is not None:
+        for channel_id, age in snapshot.sensor_values['ages'].items():
+            if age is not None:
+                channel_age.set(age, channel=channel_id)
+        tick_age.set(round(time.time() - snapshot.timestamp, 3))
+
+    device_queue = Gauge("lakeshore_device_queue_depth", "Device operations waiting for the device worker")
+    device_queue.set(device.pending())
+    jobs_queued = Gauge("tcp_jobs_queued", "Command jobs waiting to run")
+    jobs_queued.set(jobs.pending())
+    superseded = Counter("tcp_commands_superseded", "Coalesced commands replaced by a newer value before running")
+    superseded.set(commands.coalescer.superseded)
+
+    state_changes = Counter("lakeshore_state_changes", "Changes of the shadow state of the instrument configuration")
+    state_changes.set(shadow.version)
+    state_drifts = Counter("lakeshore_state_drifts", "Written values the device later contradicted")
+    state_drifts.set(shadow.drifts)
+    verified_age = Gauge("lakeshore_state_verified_age_seconds", "Seconds since the device last confirmed each parameter", ("parameter",))
+    wall_now = time.time()
+    for parameter, entry in shadow.entries().items():
+        if entry['verified'] is not None:
+            verified_age.set(round(wall_now - entry['verified'], 3), parameter=parameter)
+
+    published = Counter("tcp_publisher_snapshots", "Snapshots published per publisher", ("publisher",))
+    skipped = Counter("tcp_publisher_skipped_snapshots", "Snapshots a publisher skipped while behind", ("publisher",))
+    for name, publisher in publishers.items():
+        published.set(publisher.published, publisher=name)
+        skipped.set(publisher.skipped, publisher=name)
+
+    stats = server.subscriber_stats()
+    subscribers = Gauge("tcp_subscribers", "Connected subscribers per stream", ("stream",))
+    queue_depth = Gauge("tcp_subscriber_queue_depth", f"Frames queued per subscriber (limit {stats['queue_size']})", ("peer", "stream"))
+    dropped = Counter("tcp_subscriber_dropped_frames", "Frames dropped per subscriber by the slow-consumer policy", ("peer", "stream"))
+    per_stream = {}
+    for peer, subscriber in stats['per_subscriber'].items():
+        per_stream[subscriber['stream']] = per_stream.get(subscriber['stream'], 0) + 1
+        queue_depth.set(subscriber['queued'], peer=peer, stream=subscriber['stream'])
+        dropped.set(subscriber['dropped'], peer=peer, stream=subscriber['stream'])
+    for stream, count in per_stream.items():
+        subscribers.set(count, stream=stream)
+    sessions = Gauge("tcp_command_sessions", "Open command sessions")
+    sessions.set(stats['sessions'])
+    frames_sent = Counter("tcp_frames_broadcast", "Frames broadcast to the subscribers")
+    frames_sent.set(stats['frames_sent'])
+    frames_dropped = Counter("tcp_frames_dropped", "Frames dropped by the slow-consumer policy")
+    frames_dropped.set(stats['frames_dropped'])
+    slow_disconnects = Counter("tcp_slow_disconnects", "Subscribers disconnected for being too slow")
+    slow_disconnects.set(stats['slow_disconnects'])
+
+    return [sample_rate, channel_age, tick_age, device_queue, jobs_queued, superseded,
+            state_changes, state_drifts, verified_age, published, skipped,
+            subscribers, queue_depth, dropped, sessions, frames_sent, frames_dropped, slow_disconnects]
+
+metrics.add_collector(_collect_metrics)
+
+# Logging (see server_logging.py): asynchronous, rotated at LOG_MAX_BYTES, the per-tick
+# status line sampled every TICK_LOG_INTERVAL s and repeated errors rate-limited
+LOG_FILE = "tcp_server.log"
+LOG_LEVEL = "INFO"
+LOG_TO_CONSOLE = True   # Set to False when running under nohup, the log file has everything
+logger = logging.getLogger("tcp_server")
 
-    elif command.startswith("set_dwell_4k"):
-        try:
-            new_dwell_time = float(command.split(":")[-1])
-            if new_dwell_time >= 0.0:
-                with heater_mutex:
-                    success = ls.set_channel_dwell_time(new_dwell_time, channel=2)
-                if success:
-                    message = f"✅ Dwell time succesfully set for 4K to {new_dwell_time} s"
-                else:
-                    message = "❌ Failed to set dwell time for 4K"
-                print(message)
-            else:
-                message = "Dwell time must be non-negative"
-                print(message)
-            return message
-        except Exception as e:
-            message = f"Error setting dwell time for 4K: {e}"
-            print(message)
-            return message
+def start_server():
 
-    elif command.startswith("set_dwell_still"):
+    listener = setup_logging(LOG_FILE, LOG_LEVEL, console=LOG_TO_CONSOLE)
+    try:
         try:
-            new_dwell_time = float(command.split(":")[-1])
-            if new_dwell_time >= 0.0:
-                with heater_mutex:
-                    success = ls.set_channel_dwell_time(new_dwell_time, channel=5) 
-                if success:
-                    message = f"✅ Dwell time succesfully set for STILL to {new_dwell_time} s"
-                else:
-                    message = "❌ Failed to set dwell time for STILL"
-                print(message)
-            else:
-                message = "Dwell time must be non-negative"
-                print(message)
-            return message
-        except Exception as e:
-            message = f"Error setting dwell time for STILL: {e}"
-            print(message)
-            return message
+            MetricsServer(metrics, HOST, METRICS_PORT).start()
+            print(f"Metrics served on {HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠️ Metrics server not started on port {METRICS_PORT}: {e}")
+
+        # Start the temperature acquisition and its publishers in separate threads
+        for name, publish in SNAPSHOT_PUBLISHERS.items():
+            publishers[name] = SnapshotPublisher(snapshots, name, publish)
+            publishers[name].start()
+        # The first ticks publish the configuration from the shadow state: verify it once beforehand
+        config_verifier.verify()
+        config_verifier.start()
+        threading.Thread(target=lakeshore_temperature_sensor, daemon=True).start()
+        server.serve_forever()
 
-    elif command.startswith("set_pause_mxc"):
-        # Sintaxis to set the pause time for MXC: "set_pause_mxc:5.0"
-        try:
-            new_pause_time = float(command.split(":")[-1])
-            if new_pause_time >= 0.0:
-                with heater_mutex: ls.set_channel_pause_time(new_pause_time, channel=6)  # Channel 6 is MXC
-                message = f"✅ Pause time succesfully set for MXC to {new_pause_time} s"
-                print(message)
-            else:
-                message = f"❌ Pause time must be non-negative"
-                print(message)
-            return message
-        except Exception as e:
-            message = f"Error setting pause time for MXC: {e}"
-            print(message)
-            return message
-        
-    elif command.startswith("set_pause_50k"):
-        try:
-            new_pause_time = float(command.split(":")[-1])
-            if new_pause_time >= 0.0:
-                with heater_mutex:
-                    success = ls.set_channel_pause_time(new_pause_time, channel=1)
-                if success:
-                    message = f"✅ Pause time succesfully set for 50k to {new_pause_time} s"
-                else:
-                    message = "❌ Failed to set pause time for 50K"
-                print(message)
-            else:
-                message = "Pause time must be non-negative"
-                print(message)
-            return message
-        except Exception as e:
-            message = f"Error setting pause time for 50K: {e}"
-            print(message)
-            return message
+    except KeyboardInterrupt:
+        print("\nServer interrupted by user. Closing...")
 
-    elif command.startswith("set_pause_4k"):
-        try:
-            new_pause_time = float(command.split(":")[-1])
-            if new_pause_time >= 0.0:
-                with heater_mutex:
-                    success = ls.set_channel_pause_time(new_pause_time, channel=2)
-                if success:
-                    message = f"✅ Pause time succesfully set for 4k to {new_pause_time} s"
-                else:
-                    message = "❌ Failed to set pause time for 4K"
-                print(message)
-            else:
-                message = "Pause time must be non-negative"
-                print(message)
-            return message
-        except Exception as e:
-            message = f"Error setting pause time for 4K: {e}"
-            print(message)
-            return message
+    except Exception as e:
+        print(f"Unhandled exception: {e}")
 
-    elif command.startswith("set_pause_still"):
-        try:
-            new_pause_time = float(command.split(":")[-1])
-            if new_pause_time >= 0.0:
-                with heater_mutex:
-                    success = ls.set_channel_pause_time(new_pause_time, channel=5)
-                if success:
-                    message = f"✅ Pause time succesfully set for STILL to {new_pause_time} s"
-                else:
-                    message = "❌ Failed to set pause time for STILL"
-                print(message)
-            else:
-                message = "Pause time must be non-negative"
-                print(message)
-            return message
-        except Exception as e:
-            message = f"Error setting pause time for STILL: {e}"
-            print(message)
-            return message
+    finally:
+        listener.stop()
 
-    elif command.startswith("set_sensor_range_mxc"):
-        try:
-            new_range = str(command.split(":")[-1])
-            if 1<= int(new_range) <= 8:
-                with heater_mutex:
-                    current_sensor_settings = ls.get_sensor_resistance_settings(channel=6, return_dict=True)  # Channel 6 is MXC
-                time.sleep(0.1)  # Small delay to ensure communication channel is ready
-                current_sensor_settings['excitation_range'] = new_range
-                with heater_mutex:
-                    success = ls.set_sensor_resistance_settings(channel=6, settings=current_sensor_settings)  # Channel 6 is MXC
-                if success:
-                    current_mxc_resistance_range = new_range
-                    message = f"✅ Sensor range for MXC succesfully set to {SENSOR_RESISTANCE_RANGE_LIST[str(new_range)][0]} {SENSOR_RESISTANCE_RANGE_LIST[str(new_range)][1]}"
-                else:
-                    message = f"❌ Failed to set sensor range for MXC"
-                print(message)
-                return message
-        except Exception as e:
-            message = f"❌ Error setting sensor range for MXC: {e}"
-            print(message)
-            return message
-    elif command.startswith("set_channel_mxc"):
-        try:
-            parts = command.split(":")
-            channel_status = int(parts[1])    
-            reset_flag = int(parts[2]) if len(parts) > 2 else 1
-
-            with heater_mutex:
-                current_status = int(ls.get_channel_status(channel = 6))
-
-            time.sleep(0.5)  # Small delay to ensure communication channel is ready
-            if current_status == channel_status:
-                message = f"❌ MXC sensor is already {'On' if bool(current_status) else 'Off'}"
-                print(message)
-                return message
-
-            attempts = 5
-            success = False
-            for index in range(attempts):
-                if bool(channel_status): 
-                    with heater_mutex:
-                        success = ls.set_channel_on(6)
-                else:
-                    with heater_mutex:
-                        success = ls.set_channel_off(6)
-                            
-                time.sleep(0.5) 
-                if success: break
-
-            if success:
-                if bool(channel_status and reset_flag):
-                    apply_default_channel_timing(6)
-                    apply_default_mxc_settings()
-                message = f"✅ MXC sensor is now {'On' if bool(channel_status) else 'Off'}"
-            else:
-                message = f"❌ Failed to set MXC sensor {'On' if bool(channel_status) else 'Off'}"
-                
-            time.sleep(1.0) 
-            print(message)
-            return message
+# Polling tiers:
+#   fast - the readings (RDGK?/RDGR?/RDGPWR?, plus SCAN? in "scan" mode), read by the
+#          acquisition on every tick
+#   slow - the control/configuration state (CONFIG_QUERIES: POLL_CONFIG_QUERIES, INSET? of
+#          every channel and SCAN?), read by the config_verifier thread into the shadow state
+#          every CONFIG_POLL_INTERVAL s, and right after any set_* command so a write is
+#          verified at once. The acquisition publishes it from the shadow state.
+#          INSET? goes through query_many, straight to the device: the driver's INSET cache
+#          (inset_cache_ttl, written through by the commands) only serves the command paths
+CONFIG_POLL_INTERVAL = 10.0
+config_refresh = threading.Event()      # Set after a write: verify the slow tier at once
 
-        except Exception as e:
-            message = f"❌ Error setting MXC sensor status: {e}"
-            print(message)
-            time.sleep(1.0) 
-            return message
+def _refresh_after_write(key: str, samples: dict, error):
+    # Observer of the command registry statistics, called once a command has run
+    if key.startswith("set_"):
+        config_refresh.set()
 
-    elif command.startswith("set_channel_50k"):
-        try:
-            parts = command.split(":")
-            channel_status = int(parts[1])    
-            reset_flag = int(parts[2]) if len(parts) > 2 else 1
-
-            with heater_mutex:
-                current_status = int(ls.get_channel_status(channel = 1))
-
-            time.sleep(0.5)  # Small delay to ensure communication channel is ready
-            if current_status == channel_status:
-                message = f"❌ 50k sensor is already {'On' if bool(current_status) else 'Off'}"
-                print(message)
-                return message
-
-            attempts = 5
-            success = False
-            for index in range(attempts):
-                if bool(channel_status): 
-                    with heater_mutex:
-                        success = ls.set_channel_on(1)
-                else:
-                    with heater_mutex:
-                        success = ls.set_channel_off(1)
-                            
-                time.sleep(0.5) 
-                if success: break
-
-            if success:
-                if bool(channel_status and reset_flag):
-                    apply_default_channel_timing(1)
-                message = f"✅ 50k sensor is now {'On' if bool(channel_status) else 'Off'}"
-            else:
-                message = f"❌ Failed to set 50k sensor {'On' if bool(channel_status) else 'Off'}"
-                
-            time.sleep(1.0) 
-            print(message)
-            return message
+commands.stats.add_observer(_refresh_after_write)
 
-        except Exception as e:
-            message = f"❌ Error setting 50k sensor status: {e}"
-            print(message)
-            time.sleep(1.0) 
-            return message
+# Compute temperatures from RDGR? with the channel calibration curves (see curves.py)
+# instead of querying RDGK? for every channel
+LOCAL_CURVES = curves is not None
 
+# Control/configuration queries
+POLL_CONFIG_QUERIES = ["SETP? 6", "PID?", "HTRRNG?", "CSET?", "RDGRNG? 6"]
+CONFIG_QUERIES = POLL_CONFIG_QUERIES + [f"INSET? {channel}" for channel in DEFAULT_CHANNELS] + ["SCAN?"]
 
-    elif command.startswith("set_channel_4k"):
-        try:
-            parts = command.split(":")
-            channel_status = int(parts[1])    
-            reset_flag = int(parts[2]) if len(parts) > 2 else 1
-
-            with heater_mutex:
-                current_status = int(ls.get_channel_status(channel=2))
-
-            time.sleep(0.5)
-            if current_status == channel_status:
-                message = f"❌ 4K sensor is already {'On' if bool(current_status) else 'Off'}"
-                print(message)
-                return message
-
-            attempts = 5
-            success = False
-            for _ in range(attempts):
-                if bool(channel_status):
-                    with heater_mutex:
-                        success = ls.set_channel_on(2)
-                else:
-                    with heater_mutex:
-                        success = ls.set_channel_off(2)
-                time.sleep(0.5)
-                if success:
-                    break
-
-            if success:
-                if bool(channel_status and reset_flag):
-                    apply_default_channel_timing(2)
-                message = f"✅ 4K sensor is now {'On' if bool(channel_status) else 'Off'}"
-            else:
-                message = f"❌ Failed to set 4K sensor {'On' if bool(channel_status) else 'Off'}"
+def _reading_queries(channel: int) -> list:
+    return [f"RDGK? {channel}", f"RDGR? {channel}", f"RDGPWR? {channel}"]
 
-            print(message)
-            return message
+class LakeShoreAcquisition:
 
-        except Exception as e:
-            message = f"❌ Error setting 4K sensor status: {e}"
-            print(message)
-            return message
+    """
+    Keeps the acquisition state of the LakeShore 370 AC device between poll ticks.
+
+    The 370 is a scanner: only the channel selected by SCAN is measured, and its
+    reading is only valid once the channel pause (settle) time has elapsed since
+    the scanner switched to it. With autoscan, the scanner moves on to the next
+    enabled channel pause + dwell seconds after the switch. In "scan" mode each
+    tick sends a single chained query with SCAN?, plus the readings of the
+    channel being measured only while a fresh reading can exist (settled and not
+    yet due to switch), and the readings are kept only if the scanner is still
+    there. Other channels keep their last reading, published together with its
+    age in seconds (None for a channel never read yet).
+
+    In "all" mode every enabled channel is read on every tick.
+
+    In both modes the control/configuration settings and the channel state
+    (on/off, dwell, pause, curve) form the slow tier: config_verifier reads them
+    in its own thread to verify the shadow state, and every tick publishes them
+    from the shadow state.
+
+    With LOCAL_CURVES, the calibration curve assigned to each channel is loaded once
+    (from the disk cache or downloaded from the device) and the temperature is
+    computed from the resistance reading, so RDGK? is not queried.
+    """
 
-    elif command.startswith("set_channel_still"):
-        try:
-            parts = command.split(":")
-            channel_status = int(parts[1])    
-            reset_flag = int(parts[2]) if len(parts) > 2 else 1
-
-            with heater_mutex:
-                current_status = int(ls.get_channel_status(channel=5))
-
-            time.sleep(0.5)
-            if current_status == channel_status:
-                message = f"❌ STILL sensor is already {'On' if bool(current_status) else 'Off'}"
-                print(message)
-                return message
-
-            attempts = 5
-            success = False
-            for _ in range(attempts):
-                if bool(channel_status):
-                    with heater_mutex:
-                        success = ls.set_channel_on(5)
-                else:
-                    with heater_mutex:
-                        success = ls.set_channel_off(5)
-                time.sleep(0.5)
-                if success:
-                    break
-
-            if success:
-                if bool(channel_status and reset_flag):
-                    apply_default_channel_timing(5)
-                message = f"✅ STILL sensor is now {'On' if bool(channel_status) else 'Off'}"
+    def __init__(self, mode: str = ACQUISITION_MODE):
+        if mode not in ("all", "scan"):
+            raise ValueError(f"Unknown acquisition mode: {mode!r}")
+        self.mode = mode
+        self.interval = SCAN_POLL_INTERVAL if mode == "scan" else POLL_INTERVAL
+
+        self.readings = {channel_id: (None, None, None) for channel_id in DEFAULT_CHANNELS_ID}
+        self.read_at = {channel_id: None for channel_id in DEFAULT_CHANNELS_ID}   # None = never read
+
+        self.scan = ('0', '0')         # Last SCAN? reply: (channel, autoscan)
+        self.scan_since = None         # When the scanner was first seen on self.scan[0]
+
+        self.curves = {}               # {channel_id: curves.CalibrationCurve} used for local temperatures
+        self.curve_numbers = {}        # {channel_id: curve number} the loaded curves correspond to
+
+    def poll(self):
+        """
+        Reads one poll tick.
+        Returns:
+            tuple: (sensorValues, controlParams, sensorParams) as used by broadcast_temperature.
+        """
+
+        state = shadow.values()
+        channel_enabled = {channel_id: int(state[f"enabled_{channel_id}"] or 0) for channel_id in DEFAULT_CHANNELS_ID}
+        # Every channel keeps its key (None while unknown): the publishers index them all
+        pause_times = {channel_id: state[f"pause_{channel_id}"] for channel_id in DEFAULT_CHANNELS_ID}
+        dwell_times = {channel_id: state[f"dwell_{channel_id}"] for channel_id in DEFAULT_CHANNELS_ID}
+        self._update_curves({channel_id: state[f"curve_{channel_id}"] or 0 for channel_id in DEFAULT_CHANNELS_ID})
+
+        if self.mode == "scan":
+            self._poll_scanned_channel(channel_enabled, pause_times, dwell_times)
+        else:
+            self._poll_all_channels(channel_enabled)
+            self._update_scan(state["scan"], time.monotonic())
+
+        now = time.monotonic()
+        temperatures = {}
+        resistances = {}
+        powers = {}
+        ages = {}
+        for channel_id in DEFAULT_CHANNELS_ID:
+            if channel_enabled[channel_id]:
+                temperatures[channel_id], resistances[channel_id], powers[channel_id] = self.readings[channel_id]
+                read_at = self.read_at[channel_id]
+                ages[channel_id] = round(now - read_at, 2) if read_at is not None else None
             else:
-                message = f"❌ Failed to set STILL sensor {'On' if bool(channel_status) else 'Off'}"
+                temperatures[channel_id] = resistances[channel_id] = powers[channel_id] = "OFF"
+                ages[channel_id] = None
 
-            print(message)
-            return message
+        # The heater range is only meaningful when the heater output display is current
+        control_settings = state["control_settings"]
+        heaterRangeMXC = state["mxc_heater_range"]
+        if control_settings is None or control_settings[4] != '1':
+            heaterRangeMXC = None
 
-        except Exception as e:
-            message = f"❌ Error setting STILL sensor status: {e}"
-            print(message)
-            return message
+        controlParams = {
+            'MXCSP': state["mxc_setpoint"],
+            'P': state["mxc_P"],
+            'I': state["mxc_I"],
+            'D': state["mxc_D"],
+            'HR': heaterRangeMXC,
+        }
 
-    elif command.startswith("set_sensor_mode_mxc"):
-        
-        try:
-            new_mode = int(command.split(":")[-1])
+        sensorParams = {
+            'sensor_mode'      : state["mxc_excitation_mode"],
+            'sensor_range'     : state["mxc_excitation_range"],
+            'sensor_autorange' : state["mxc_autorange"],
+            'dwell_times'      : dwell_times,
+            'pause_times'      : pause_times,
+            'autoscan'         : self.scan,
+            'enabledMXC'       : channel_enabled['MXC'],
+            'enabled'          : channel_enabled,
+        }
 
-            if new_mode not in (0, 1):
-                message = f"❌ Sensor mode for MXC must be 0 (voltage) or 1 (current)"
-                print(message)
-                return message
+        sensorValues = {
+            'temperatures' : temperatures,
+            'resistances'  : resistances,
+            'powers'       : powers,
+            'ages'         : ages,
+        }
 
-            with heater_mutex:
-                current_settings = ls.get_sensor_resistance_settings(channel=6, return_dict=True)
+        return sensorValues, controlParams, sensorParams
+
+    def _poll_all_channels(self, channel_enabled: dict):
+        batches = []
+        for index, channel in enumerate(DEFAULT_CHANNELS):
+            if channel_enabled[DEFAULT_CHANNELS_ID[index]]:
+                batches.append(self._reading_queries(channel))
+
+        replies = _query_batches(batches)
+        now = time.monotonic()
+        for index, channel in enumerate(DEFAULT_CHANNELS):
+            channel_id = DEFAULT_CHANNELS_ID[index]
+            if channel_enabled[channel_id]:
+                self._store_reading(channel_id, self._reading_from(channel, replies), now)
+
+    def _poll_scanned_channel(self, channel_enabled: dict, pause_times: dict, dwell_times: dict):
+        # Read the channel the scanner was on last tick together with SCAN?, if it can hold
+        # a fresh reading; the readings are only used if the scanner is still there.
+        batch = ["SCAN?"]
+        guess = int(self.scan[0])
+        guess_id = _channel_id(guess)
+        if guess_id is not None and channel_enabled[guess_id] and self._fresh_reading(guess_id, channel_enabled, pause_times, dwell_times):
+            batch += self._reading_queries(guess)
+
+        batches = [batch]
+        # Channels never read yet get one reading so there is something to publish
+        unseen = [channel for index, channel in enumerate(DEFAULT_CHANNELS)
+                  if channel_enabled[DEFAULT_CHANNELS_ID[index]] and self.read_at[DEFAULT_CHANNELS_ID[index]] is None
+                  and channel != guess]
+        batches += [self._reading_queries(channel) for channel in unseen]
+
+        replies = _query_batches(batches)
+        now = time.monotonic()
+
+        previous_channel = self.scan[0]
+        self._update_scan(replies["SCAN?"], now)
+        scan_id = _channel_id(int(self.scan[0]))
+
+        if self.scan[0] == previous_channel and scan_id == guess_id and len(batch) > 1:
+            self._store_reading(guess_id, self._reading_from(guess, replies), now)
+
+        for channel in unseen:
+            self._store_reading(_channel_id(channel), self._reading_from(channel, replies), now)
+
+    def _fresh_reading(self, channel_id: str, channel_enabled: dict, pause_times: dict, dwell_times: dict) -> bool:
+        # Whether the scanner, last seen on channel_id, can hold a fresh reading of it now
+        elapsed = time.monotonic() - self.scan_since
+        pause = pause_times[channel_id] or 0
+        if elapsed < pause:
+            return False        # Still settling after the switch
+        dwell = dwell_times[channel_id]
+        if self.scan[1] != '1' or dwell is None or sum(channel_enabled.values()) < 2:
+            return True         # Parked: the scanner stays on the channel
+        # Autoscan moves on pause + dwell after the switch. The switch was seen up to a tick late, so
+        # the estimate may be a tick late too: skip the ticks within one interval of it, when the
+        # scanner is most likely settling on the next channel. Still there a tick after the estimate
+        # means it was off (e.g. a longer dwell on the front panel): read the channel again
+        switch_in = pause + dwell - elapsed
+        return not -self.interval < switch_in <= self.interval
+
+    def _store_reading(self, channel_id: str, reading: tuple, now: float):
+        if all(value is None for value in reading):
+            return      # Failed read: the last reading and its age are kept (a never read channel is retried)
+        self.readings[channel_id] = reading
+        self.read_at[channel_id] = now
+        channel_readings.inc(channel=channel_id)
+        sample_times[channel_id].append(now)
+
+    def _reading_queries(self, channel: int) -> list:
+        if _channel_id(channel) in self.curves:
+            return [f"RDGR? {channel}", f"RDGPWR? {channel}"]
+        return _reading_queries(channel)
+
+    def _reading_from(self, channel: int, replies: dict) -> tuple:
+        # (temperature, resistance, power) from the replies to self._reading_queries(channel)
+        curve = self.curves.get(_channel_id(channel))
+        if curve is None:
+            return tuple(replies[query] for query in _reading_queries(channel))
+        resistance = replies[f"RDGR? {channel}"]
+        temperature = curve.temperature(resistance) if resistance is not None else None
+        return (temperature, resistance, replies[f"RDGPWR? {channel}"])
+
+    def _update_curves(self, curve_numbers: dict):
+        # (Re)load the curve of every channel whose assigned curve changed
+        for channel_id, number in curve_numbers.items():
+            if self.curve_numbers.get(channel_id) == number:
+                continue
+            self.curve_numbers[channel_id] = number
+            self.curves.pop(channel_id, None)
+            if not LOCAL_CURVES or not number:
+                continue
+            try:
+                self.curves[channel_id] = device.call(curves.load_curve, number, priority=PRIORITY_POLL)
+                print(f"Channel {channel_id} temperatures computed locally with curve {number}")
+            except Exception as e:
+                print(f"Loading curve {number} for channel {channel_id} failed, reading RDGK? instead.\nReason: {e}")
 
-            time.sleep(0.1)
+    def _update_scan(self, scan, now: float):
+        # --- Normalizing autoscan format
+        if scan is None:
+            scan = ('0', '0')
+        elif isinstance(scan, (list, tuple)) and len(scan)>=2:
+            scan = (str(int(scan[0])), str(scan[1]))
+        else:
+            scan = ('0', str(scan))
+
+        if scan[0] != self.scan[0] or self.scan_since is None:
+            self.scan_since = now
+        self.scan = scan
+
+def _channel_id(channel: int):
+    if channel in DEFAULT_CHANNELS:
+        return DEFAULT_CHANNELS_ID[DEFAULT_CHANNELS.index(channel)]
+    return None
+
+def _read_configuration(ls) -> dict:
+    # Runs on the device worker: the whole slow tier in one query_many, read from the device itself
+    # (INSET? through query_many bypasses the INSET cache, which would only echo our own writes back)
+    replies = dict(zip(CONFIG_QUERIES, ls.query_many(CONFIG_QUERIES)))
+    return _config_shadow_values(replies)
+
+def _config_shadow_values(replies: dict) -> dict:
+    # Shadow parameters from the replies to CONFIG_QUERIES (None for the failed reads)
+    pid = replies["PID?"] or {}
+    resistance_settings = replies["RDGRNG? 6"] or {}
+    control_settings = replies["CSET?"]
+    scan = replies["SCAN?"]
+    values = {
+        "mxc_setpoint": replies["SETP? 6"],
+        "mxc_P": pid.get('P'),
+        "mxc_I": pid.get('I'),
+        "mxc_D": pid.get('D'),
+        "mxc_heater_range": replies["HTRRNG?"],
+        "control_settings": tuple(control_settings) if control_settings is not None else None,
+        "scan": tuple(scan) if scan is not None else None,
+    }
+    values.update({name: resistance_settings.get(setting) for setting, name in RESISTANCE_SETTINGS.items()})
+    for index, channel in enumerate(DEFAULT_CHANNELS):
+        channel_id = DEFAULT_CHANNELS_ID[index]
+        inset = replies[f"INSET? {channel}"]    # [on/off, dwell, pause, curve, tempco]
+        for position, parameter in enumerate(CHANNEL_PARAMETERS):
+            values[f"{parameter}_{channel_id}"] = int(inset[position]) if inset is not None else None
+    return values
+
+def _count_config_read(reason: str):
+    config_reads.inc(reason=reason)
+
+# Verifies the shadow state against the device in its own thread (see shadow_state.py)
+config_verifier = ShadowVerifier(shadow, functools.partial(device.call, _read_configuration, priority=PRIORITY_POLL),
+                                 CONFIG_POLL_INTERVAL, refresh=config_refresh, on_verify=_count_config_read)
+
+def _query_batches(batches: list) -> dict:
+    # Each batch is its own low-priority device operation, so client commands can run in between
+    futures = [(batch, device.submit("query_many", batch, priority=PRIORITY_POLL)) for batch in batches]
+    replies = {}
+    for batch, future in futures:
+        replies.update(zip(batch, future.result()))
+    return replies
 
-            current_settings['excitation_mode'] = new_mode
+def lakeshore_temperature_sensor():
 
-            with heater_mutex:
-                success = ls.set_sensor_resistance_settings(channel=6, settings=current_settings)
+    """
+    This function reads the temperature from the LakeShore 370 AC device
+    and stores every tick in the snapshot ring.
 
-            if success:
-                current_mxc_resistance_mode = new_mode
-                mode_str = "voltage" if new_mode == 0 else "current"
-                message = f"✅ Sensor mode for MXC succesfully set to {mode_str}"
-            else:
-                message = "❌ Failed to set sensor mode for MXC"
+    """
 
-            print(message)
-            return message
+    acquisition = LakeShoreAcquisition()
 
-        except Exception as e:
-            message = f"❌ Error setting sensor mode for MXC: {e}"
-            print(message)
-            return message
-            
-    elif command.startswith("set_autorange_mxc"):
+    while True:
+        tick_start = time.monotonic()
         try:
-            new_value = int(command.split(":")[-1])
-
-            if new_value not in (0, 1):
-                message = "❌ Autorange for MXC must be 0 (OFF) or 1 (ON)"
-                print(message)
-                return message
-
-            with heater_mutex:
-                current_sensor_settings = ls.get_sensor_resistance_settings(channel=6, return_dict=True)
-
-            time.sleep(0.1) 
-
-            current_sensor_settings['autorange'] = new_value
-
-            with heater_mutex:
-                success = ls.set_sensor_resistance_settings(channel=6, settings=current_sensor_settings)
-
-            if success:               
-                current_mxc_resistance_autorange = new_value
-                message = f"✅ Autorange for MXC successfully set to {'ON' if new_value else 'OFF'}"
-            else:
-                message = "❌ Failed to set autorange for MXC"
-
-            print(message)
-            return message
-
+            sensorValues, controlParams, sensorParams = acquisition.poll()
+            poll_duration.observe(time.monotonic() - tick_start)
         except Exception as e:
-            message = f"❌ Error setting autorange for MXC: {e}"
-            print(message)
-            return message
-        
-    else:
-        print("Unknown command")
-
-    
-            
-
-def start_server():
-
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server_socket.bind((HOST, PORT))
-            server_socket.listen()
-            print(f"Server listening on {HOST}:{PORT}")
-
-            # Start the fake temperature sensor in a separate thread
-            threading.Thread(target=lakeshore_temperature_sensor, daemon=True).start()
-
-            while True:
-                conn, addr = server_socket.accept()
-                print(f"Connected by {addr}")
-                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-                # Start a new thread to handle the client
-                threading.Thread(target=client_handler, args=(conn, addr), daemon=True).start()
-
-    except KeyboardInterrupt:
-        print("\nServer interrupted by user. Closing...")
-
-    except Exception as e:
-        print(f"Unhandled exception: {e}")
+            poll_errors.inc()
+            print(f"Error reading from LakeShore\nReason: {e}")
+            time.sleep(acquisition.interval)
+            continue
+
+        # Publishers (broadcast, log...) consume the snapshot from their own threads
+        snapshots.append(sensorValues, controlParams, sensorParams, extra=_software_heater_state())
+
+        time.sleep(max(0.0, acquisition.interval - (time.monotonic() - tick_start)))
+
+def _software_heater_state() -> dict:
+    # Software heater settings published with every snapshot
+    with heater_mutex:
+        return {
+            'setpoint': current_temperature_setpoint,
+            'heater_power': current_heater_power,
+            'heater_range': current_heater_range,
+            'temperature_limit': current_temperature_limit,
+            'timeout': current_timeout,
+            'proportional_gain': current_proportional_gain,
+            'integral_gain': current_integral_gain,
+            'derivative_gain': current_derivative_gain,
+        }
 
-def client_handler(conn, addr):
+def log_temperatures(snapshot):
 
-    # A first read determines the mode: "SUB" or "CMD"
-    try:
-        first = conn.recv(1024)
-        if not first:
-            conn.close()
-            return
-        text = first.decode('utf-8', errors='ignore').strip()
-    except Exception as e:
-        print(f"Error receiving first bytes from {addr}: {e}")
-        conn.close()
-        return
+    """
+    Publisher logging the status of a tick as one key=value line. The line is
+    sampled (one per TICK_LOG_INTERVAL s) unless the log level is DEBUG.
+    """
 
-    #---- Subscriber mode
-    if text.upper().startswith("SUB"):
-        print(f"Client {addr} connected in subscriber mode")
-        # Keep writes snappy and detect dead peers sooner
-        conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-        try:
-            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30)  # 30 seconds before sending first keepalive
-            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)  # 10 seconds between keepalive probes
-            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)  # 3 probes before considering the connection dead
-        except OSError as e:
-            pass # Ignore if the OS does not support these options
-        
-        with clients_lock:
-            clients.append((conn, addr))
-        # The broadcast loop will remove+close on error/peer close
+    if not logger.isEnabledFor(logging.INFO):
         return
 
-    #---- Command mode
-    try:
-        command = text
-        message = handle_command(command)
-        # send a line-delimited response back to the client
-        conn.sendall(b"Command received - " + message.encode('utf-8') + b"\n")
-    except Exception as e:
-        print(f"Error handling command from {addr}: {e}")
-        conn.sendall((b"Error handling command " + str(e).encode('utf-8') + b"\n"))
-    finally:
-        conn.close()
-        print(f"Connection with {addr} closed")
-
-def lakeshore_temperature_sensor():
+    temperatures = snapshot.sensor_values['temperatures']
+    controlParams = snapshot.control_params
+    sensorParams = snapshot.sensor_params
+
+    status = [f"seq={snapshot.seq}"]
+    for channel_id in DEFAULT_CHANNELS_ID:
+        channel_temperature = temperatures[channel_id]
+        if channel_temperature == "OFF" or channel_temperature is None:
+            continue
+        if channel_temperature > 1.0:
+            status.append(f"{channel_id}={channel_temperature:.4f}K")
+        else:
+            status.append(f"{channel_id}={channel_temperature * 1000:.3f}mK")
+
+    # HR is None while the heater output display is not current (or not read yet)
+    heater_range = CURRENT_RANGE_LIST.get(str(controlParams['HR'])) if controlParams['HR'] is not None else None
+    if heater_range is not None and heater_range[0] != "Off":
+        status.append(f"MXCSP={controlParams['MXCSP']}K")
+        status.append(f"heater_range={controlParams['HR']}({heater_range[0]}{heater_range[1]})")
+
+    status.append("autoscan=" + ("ON" if str(sensorParams['autoscan'][1]) == '1' else "OFF"))
+    if str(sensorParams['autoscan'][1]) == '1':
+        status.append(f"scanning={int(sensorParams['autoscan'][0])}")
+
+    # Likewise the excitation settings until the device has been read
+    sensor_range = SENSOR_RESISTANCE_RANGE_LIST.get(str(sensorParams['sensor_range']))
+    if sensor_range is not None and sensorParams['sensor_mode'] is not None:
+        if not int(sensorParams['sensor_mode']):
+            status.append(f"mode_MXC=voltage({sensor_range[0]}{sensor_range[1]})")
+        else:
+            status.append(f"mode_MXC=current({sensor_range[2]}{sensor_range[3]})")
+
+    sample = None if logger.isEnabledFor(logging.DEBUG) else "tick"
+    logger.info("tick " + " ".join(status), extra={"sample": sample})
+
+def broadcast_temperature(snapshot):
 
     """
-    This function reads the temperature from the LakeShore 370 AC device.
-
+    Publisher sending a snapshot to every subscriber: one text line to the
+    "SUB" subscribers, one binary frame to the "SUB BIN" subscribers (also
+    stored in the history for backfill) and a
+    keyframe or delta line to the "SUB DELTA" subscribers, and the selected
+    fields to each group of filtered subscribers.
+    Each format is encoded once per tick, and only if it has subscribers.
     """
-    temperatures = {}
-    resistances = {}
-    powers = {}
 
-    while True:
-        try:
-            for index, channel in enumerate(DEFAULT_CHANNELS):
-                if ls.get_channel_status(channel):
-                    with heater_mutex: temperatures[DEFAULT_CHANNELS_ID[index]] = ls.get_temperature(channel)
-                    with heater_mutex: resistances[DEFAULT_CHANNELS_ID[index]] = ls.get_resistance(channel)
-                    with heater_mutex: powers[DEFAULT_CHANNELS_ID[index]] = ls.get_power(channel)
-                else: 
-                    temperatures[DEFAULT_CHANNELS_ID[index]] = "OFF"
-                    resistances[DEFAULT_CHANNELS_ID[index]] = "OFF"
-                    powers[DEFAULT_CHANNELS_ID[index]] = "OFF"
-        except Exception as e:
-            print(f"Error reading temperature from LakeShore\nReason: {e}")
+    fields = wire_format.snapshot_fields(snapshot)
 
-        # Which channels are enabled?
-        try:
-            with heater_mutex: 
-                channel_enabled_MXC = int(ls.get_channel_status(6))  # MXC is channel 6
-                channel_enabled_50K = int(ls.get_channel_status(1))
-                channel_enabled_STILL = int(ls.get_channel_status(5))
-
-        except Exception as e:
-            print(f"Error reading MXC channel status\nReason: {e}")
-            channel_enabled_MXC = 0
-        
-        try:
-            with heater_mutex: tempSetPointMXC = ls.get_temperature_setpoint()  # Channel 6 is MXC
-        except Exception as e:
-            print(f"Error reading temperature setpoint for MXC from LakeShore\nReason: {e}")
-            tempSetPointMXC = None
+    # The binary frame is always encoded: it is also the history record.
+    # It is stored on the loop thread, in order with the broadcasts, so a backlog never misses a tick.
+    try:
+        frame = wire_format.encode_frame(snapshot.seq, snapshot.timestamp, fields)
+        server.call_soon_threadsafe(history.append, snapshot.seq, snapshot.timestamp, frame)
+        if server.has_subscribers("bin"):
+            server.broadcast(frame, "bin")
+    except Exception as e:
+        print(f"Error encoding binary broadcast frame: {e}")
 
-        try:
-            with heater_mutex: LSPID = ls.get_control_parameters()
-            proportionalMXC = LSPID['P']
-            integralMXC = LSPID['I']
-            derivativeMXC = LSPID['D']
-
-            time.sleep(0.1) # Small delay to ensure communictation channel is ready
-            
-            with heater_mutex: heaterRangeMXC = ls.get_control_range()
-            
-        except Exception as e:
-            print(f"Error reading control parameters from LakeShore\nReason: {e}")
-            proportionalMXC = integralMXC = derivativeMXC = None
+    # The delta encoder follows every tick, so new delta subscribers get the current keyframe
+    line = delta_encoder.update(snapshot.seq, snapshot.timestamp, fields)
+    if server.has_subscribers("delta"):
+        server.broadcast(line, "delta")
+    server.set_greeting("delta", functools.partial(encode_keyframe, snapshot.seq, snapshot.timestamp, fields))
 
+    # Filtered subscriptions: one aggregation and encoding per distinct request
+    subscription_groups.prune(server.has_subscribers)
+    for key, stream in subscription_groups.streams():
         try:
-            with heater_mutex: resistance_mxc_settings = ls.get_sensor_resistance_settings(channel=6, return_dict=True)  # Channel 6 is MXC
-            modeMXC = resistance_mxc_settings['excitation_mode']
-            excitationMXC = resistance_mxc_settings['excitation_range']
-            autorangeMXC = resistance_mxc_settings['autorange']
+            line = stream.update(snapshot.seq, snapshot.timestamp, snapshot.monotonic, fields)
         except Exception as e:
-            print(f"Error reading sensor resistance settings from LakeShore\nReason: {e}")
-            modeMXC = excitationMXC = autorangeMXC = None
-
-        try:
-            with heater_mutex: dwell_times = ls.get_channels_dwell_time(DEFAULT_CHANNELS)
-        except Exception as e: 
-            print(f"Error reading dwell times from LakeShore\nReason: {e}")
-            dwell_times = {channel: None for channel in DEFAULT_CHANNELS_ID}
-
-        try:
-            with heater_mutex: pause_times = ls.get_channels_pause_time(DEFAULT_CHANNELS) 
-        except Exception as e: 
-            print(f"Error reading pause times from LakeShore\nReason: {e}")
-            pause_times = {channel: None for channel in DEFAULT_CHANNELS_ID}
+            print(f"Error building filtered stream {key}: {e}")
+            continue
+        if line is not None:
+            server.broadcast(line, key)
 
-        
-        try:
-            with heater_mutex: autoscan = ls.get_autoscan()
-        except Exception as e:
-            print(f"Error reading autoscan setting from LakeShore\nReason: {e}")
-        
-        # --- Normalizing autoscan format
-        try: 
-            if autoscan is None:
-                autoscan = ('0', '0')
-            elif isinstance(autoscan, (list, tuple)) and len(autoscan)>=2:
-                autoscan =(str(autoscan[0]), str(autoscan[1]))
-            else:
-                autoscan = ('0', str(autoscan))
-        except NameError:
-            # Maybe ls.get_autoscan() fails and autoscan is not defined
-            autoscan = ('0', '0')
-                
-                
-        controlParams = {
-            'MXCSP': tempSetPointMXC,
-            'P': proportionalMXC,
-            'I': integralMXC,
-            'D': derivativeMXC,
-            'HR': heaterRangeMXC,
-        }
-
-        sensorParams = {
-            'sensor_mode'      : modeMXC,
-            'sensor_range'     : excitationMXC,
-            'sensor_autorange' : autorangeMXC,
-            'dwell_times'      : dwell_times,
-            'pause_times'      : pause_times,
-            'autoscan'         : autoscan,
-            'enabledMXC'       : channel_enabled_MXC
-        }
-
-        sensorValues = {
-            'temperatures' : temperatures,
-            'resistances'  : resistances,
-            'powers'       : powers,
-        }
-        
-        try:
-            broadcast_temperature(sensorValues, controlParams, sensorParams)
-        except Exception as e:
-            print(f"Error broadcasting temperature data: {e}")
-        
-        time.sleep(1)
+    if not server.has_subscribers("text"):
+        return
 
-def broadcast_temperature(sensorValues, controlParams, sensorParams):
+    sensorValues = snapshot.sensor_values
+    controlParams = snapshot.control_params
+    sensorParams = snapshot.sensor_params
+    heater = snapshot.extra
 
     temperatures = sensorValues['temperatures']
     resistances  = sensorValues['resistances']
     powers       = sensorValues['powers']
+    ages         = sensorValues['ages']
     
     dwell_times = sensorParams['dwell_times']
     pause_times = sensorParams['pause_times']
 
-    # Send the sensor data to all connected clients
-    global current_mxc_temperature_setpoint
-    global current_proportionalMXC
-    global current_integralMXC
-    global current_derivativeMXC
-    global current_ls_heater_range
-
-    global current_mxc_resistance_mode
-    global current_mxc_resistance_range
-    global current_mxc_resistance_autorange
-    global current_dwell_time
-    global current_pause_time
-    global autoscan
-
-    global current_temperature_setpoint
-    global current_heater_power
-    global current_timeout
-    global current_proportional_gain
-    global current_integral_gain
-    global current_derivative_gain
-    
-
-    print(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()), "Broadcasting temperatures:")
-
-    for index, channel in enumerate(DEFAULT_CHANNELS):
-        if temperatures[DEFAULT_CHANNELS_ID[index]] != "OFF":
-            channel_temperature = temperatures[DEFAULT_CHANNELS_ID[index]]
-            formated_temperature = f"{channel_temperature if channel_temperature > 1.0 else channel_temperature * 1000}"
-            formated_units = "K" if channel_temperature > 1.0 else "mK"
-            print(f"Channel {DEFAULT_CHANNELS_ID[index]} Temperature: {formated_temperature} {formated_units}")
-    
-    if CURRENT_RANGE_LIST[controlParams['HR']][0] != 0:
-        print(f"MXC Temperature Setpoint: {controlParams['MXCSP']} K")
-        print(f"Heater Range MXC: {controlParams['HR']} ({CURRENT_RANGE_LIST[controlParams['HR']][0]} {CURRENT_RANGE_LIST[controlParams['HR']][1]})")
-
-    print("Autoscan is set " + ("ON" if str(sensorParams['autoscan'][1]) == '1' else "OFF"))
-    if sensorParams['autoscan'][1] == '1': print(f"Scanning channel {int(sensorParams['autoscan'][0])}")
-    
-    if not int(sensorParams['sensor_mode']): print(f"Sensor Mode MXC: voltage ({SENSOR_RESISTANCE_RANGE_LIST[sensorParams['sensor_range']][0]} {SENSOR_RESISTANCE_RANGE_LIST[sensorParams['sensor_range']][1]})")
-    else: print(f"Sensor Mode MXC: current ({SENSOR_RESISTANCE_RANGE_LIST[sensorParams['sensor_range']][2]} {SENSOR_RESISTANCE_RANGE_LIST[sensorParams['sensor_range']][3]})")
-
     try:
         message = (
                     f"50K: {temperatures['50K']}," +
@@ -1164,14 +1066,14 @@ def broadcast_temperature(sensorValues, controlParams, sensorParams):
                     f"pause_50K: {pause_times['50K']}," +
                     f"pause_4K: {pause_times['4K']}," +
                     f"pause_STILL: {pause_times['STILL']}," +
-                    f"setpoint: {current_temperature_setpoint}," +
-                    f"heater_power:{current_heater_power}," +
-                    f"heater_range:{current_heater_range}," +
-                    f"temperature_limit:{current_temperature_limit}," +
-                    f"timeout:{current_timeout}," + 
-                    f"proportional_gain:{current_proportional_gain}," +
-                    f"integral_gain:{current_integral_gain}," +
-                    f"derivative_gain:{current_derivative_gain}," +
+                    f"setpoint: {heater['setpoint']}," +
+                    f"heater_power:{heater['heater_power']}," +
+                    f"heater_range:{heater['heater_range']}," +
+                    f"temperature_limit:{heater['temperature_limit']}," +
+                    f"timeout:{heater['timeout']}," + 
+                    f"proportional_gain:{heater['proportional_gain']}," +
+                    f"integral_gain:{heater['integral_gain']}," +
+                    f"derivative_gain:{heater['derivative_gain']}," +
                     f"autoscan:{sensorParams['autoscan'][1]}," +  
                     f"R50K: {resistances['50K']}," +
                     f"R4K: {resistances['4K']}," +
@@ -1182,40 +1084,28 @@ def broadcast_temperature(sensorValues, controlParams, sensorParams):
                     f"PSTILL: {powers['STILL']}," +
                     f"PMXC: {powers['MXC']}," +
                     f"enabledMXC: {sensorParams['enabledMXC']}," +
-                    f"enabled50K: {int(ls.get_channel_status(1))}," +
-                    f"enabled4K: {int(ls.get_channel_status(2))}," +
-                    f"enabledSTILL: {int(ls.get_channel_status(5))}\n"
+                    f"enabled50K: {sensorParams['enabled']['50K']}," +
+                    f"enabled4K: {sensorParams['enabled']['4K']}," +
+                    f"enabledSTILL: {sensorParams['enabled']['STILL']}," +
+                    f"age50K: {ages['50K']}," +
+                    f"age4K: {ages['4K']}," +
+                    f"ageSTILL: {ages['STILL']}," +
+                    f"ageMXC: {ages['MXC']}\n"
                     ).encode('utf-8')
         
     except Exception as e:
         print(f"Error formatting broadcast message: {e}")
+        return
     
-    _prune_clients() # clean up dead clients
+    # The event loop writes it to every subscriber without blocking the acquisition
+    server.broadcast(message, "text")
 
-    to_remove = []
-    with clients_lock:
-        target_list = list(clients)
-
-    for sock, addr in target_list:
-        try:
-            sock.sendall(message)
-        except Exception as e:
-            # Don't call getpeername() here—socket may be gone
-            print(f"Error broadcasting data to client {addr}: {e}")
-            to_remove.append((sock, addr))
-
-    if to_remove:
-        with clients_lock:
-            for dead in to_remove:
-                try:
-                    clients.remove(dead)
-                except ValueError:
-                    pass
-                try:
-                    dead[0].close()
-                except Exception:
-                    pass
 
+# Consumers of the acquisition snapshots, each one in its own publisher thread
+SNAPSHOT_PUBLISHERS = {
+    "broadcast": broadcast_temperature,
+    "log": log_temperatures,
+}
 
 if __name__ == "__main__":
     start_server()
\ No newline at end of file
@@ -0,0 +1,72 @@
+"""
+Shared fixtures. The modules of the server live at the repository root and
+are imported as top-level modules, as tcp_server.py does.
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_server import EventServer
+
+@pytest.fixture
+def start_server():
+    """ start_server(command_handler, **kwargs) -> running EventServer on a free local port. """
+    servers = []
+
+    def start(command_handler, **kwargs):
+        server = EventServer("127.0.0.1", 0, command_handler, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while not server._running:
+            assert time.monotonic() < deadline, "The event server did not start"
+            time.sleep(0.01)
+        servers.append((server, thread))
+        return server
+
+    yield start
+    for server, thread in servers:
+        server.stop()
+        thread.join(5)
+
+@pytest.fixture
+def emulated_lakeshore():
+    """ (EmulatedLakeShore370, LakeShore370 driver connected to it through a local socket). """
+    pytest.importorskip("pyvisa")
+    from lakeshore370 import LakeShore370
+    from lakeshore370_emulator import EmulatedLakeShore370, serve_socket
+
+    instrument = EmulatedLakeShore370()
+    ls = LakeShore370(addr=serve_socket(instrument, port=0, baud_rate=115200), baud_rate=115200)
+    yield instrument, ls
+    ls.close()
+
+def connect(server: EventServer, first_line: bytes | None = None, timeout: float = 5.0) -> socket.socket:
+    sock = socket.create_connection(("127.0.0.1", server.port), timeout=timeout)
+    if first_line is not None:
+        sock.sendall(first_line)
+    return sock
+
+def read_lines(sock: socket.socket, count: int) -> list:
+    """ The next count lines received (without their newline). """
+    reader = sock.makefile('rb')
+    lines = []
+    for _ in range(count):
+        line = reader.readline()
+        assert line, f"Connection closed after {len(lines)} of {count} lines"
+        lines.append(line.rstrip(b"\n").decode('utf-8'))
+    return lines
+
+def read_all(sock: socket.socket) -> bytes:
+    """ Everything received until the server closes the connection. """
+    data = b""
+    while chunk := sock.recv(65536):
+        data += chunk
+    return data
@@ -0,0 +1,93 @@
+"""
+Scan-aware acquisition (LakeShoreAcquisition in "scan" mode), with canned
+replies instead of the device.
+"""
+
+import time
+
+import pytest
+
+import tcp_server
+from default_config import DEFAULT_CHANNELS, DEFAULT_CHANNELS_ID
+from shadow_state import ShadowState
+from snapshot_buffer import SnapshotRing
+
+ENABLED = {channel_id: 1 for channel_id in DEFAULT_CHANNELS_ID}
+PAUSE = {channel_id: 3 for channel_id in DEFAULT_CHANNELS_ID}
+DWELL = {channel_id: 10 for channel_id in DEFAULT_CHANNELS_ID}
+
+def _scanning(channel: int, autoscan: str, since: float) -> tcp_server.LakeShoreAcquisition:
+    acquisition = tcp_server.LakeShoreAcquisition("scan")
+    acquisition.scan = (str(channel), autoscan)
+    acquisition.scan_since = time.monotonic() - since
+    return acquisition
+
+@pytest.mark.parametrize("since, fresh", [
+    (1.0, False),       # Settling (pause 3 s)
+    (5.0, True),        # Dwelling
+    (13.1, False),      # Autoscan due to switch at 13 s
+    (14.0, True),       # Still there well after the estimate: read again
+])
+def test_fresh_reading_follows_pause_and_dwell(since, fresh):
+    acquisition = _scanning(6, '1', since)
+    assert acquisition._fresh_reading("MXC", ENABLED, PAUSE, DWELL) is fresh
+
+def test_parked_scanner_is_read_after_the_dwell():
+    acquisition = _scanning(6, '0', 13.1)
+    assert acquisition._fresh_reading("MXC", ENABLED, PAUSE, DWELL)
+
+def test_settling_channel_is_not_queried(monkeypatch):
+    sent = []
+
+    def query_batches(batches):
+        sent.extend(batches)
+        return {query: None for batch in batches for query in batch} | {"SCAN?": ["6", "1"]}
+
+    monkeypatch.setattr(tcp_server, "_query_batches", query_batches)
+    acquisition = _scanning(6, '1', 1.0)
+    acquisition.read_at = {channel_id: 0.0 for channel_id in DEFAULT_CHANNELS_ID}
+    acquisition._poll_scanned_channel(ENABLED, PAUSE, DWELL)
+    assert sent == [["SCAN?"]]
+
+def test_first_reading_is_stamped_and_failed_reads_retried(monkeypatch):
+    def query_batches(batches):
+        replies = {"SCAN?": ["6", "0"]}
+        for batch in batches:
+            for query in batch:
+                # Channel 1 (50K) does not answer
+                replies[query] = None if query.endswith(f" {DEFAULT_CHANNELS[0]}") else 1.5
+        return replies
+
+    monkeypatch.setattr(tcp_server, "_query_batches", query_batches)
+    acquisition = _scanning(6, '0', 1.0)
+    acquisition._poll_scanned_channel(ENABLED, PAUSE, DWELL)
+
+    for index, channel_id in enumerate(DEFAULT_CHANNELS_ID):
+        if DEFAULT_CHANNELS[index] == 6:
+            assert acquisition.read_at[channel_id] is None      # Scanned channel still settling
+        elif index == 0:
+            assert acquisition.read_at[channel_id] is None      # Never read: retried next tick
+            assert acquisition.readings[channel_id] == (None, None, None)
+        else:
+            assert acquisition.read_at[channel_id] is not None
+            assert acquisition.readings[channel_id] == (1.5, 1.5, 1.5)
+
+@pytest.mark.parametrize("mode", ["scan", "all"])
+def test_unverified_shadow_is_polled_and_broadcast(monkeypatch, mode):
+    # The first verification failed: only the channel on/off states are known
+    state = ShadowState(tcp_server.SHADOW_PARAMETERS)
+    state.observe({f"enabled_{channel_id}": 1 for channel_id in DEFAULT_CHANNELS_ID}, time.monotonic())
+    monkeypatch.setattr(tcp_server, "shadow", state)
+    monkeypatch.setattr(tcp_server, "_query_batches",
+                        lambda batches: {query: None for batch in batches for query in batch} | {"SCAN?": None})
+    sent = []
+    monkeypatch.setattr(tcp_server.server, "has_subscribers", lambda stream: True)
+    monkeypatch.setattr(tcp_server.server, "broadcast", lambda data, stream="text": sent.append(stream))
+
+    sensorValues, controlParams, sensorParams = tcp_server.LakeShoreAcquisition(mode).poll()
+    assert sensorParams['dwell_times'] == sensorParams['pause_times'] == {channel_id: None for channel_id in DEFAULT_CHANNELS_ID}
+
+    snapshot = SnapshotRing(1).append(sensorValues, controlParams, sensorParams, extra=tcp_server._software_heater_state())
+    tcp_server.broadcast_temperature(snapshot)
+    tcp_server.log_temperatures(snapshot)
+    assert {"bin", "delta", "text"} <= set(sent)
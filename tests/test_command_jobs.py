@@ -0,0 +1,98 @@
+import json
+import queue
+import threading
+import time
+
+import pytest
+
+import tcp_server
+from command_jobs import JobQueue, format_event
+from conftest import connect, read_all, read_lines
+
+def _finished_jobs(count: int):
+    # on_finished callback collecting the finished jobs, and an event set after count of them
+    finished = []
+    done = threading.Event()
+
+    def on_finished(job):
+        finished.append(job)
+        if len(finished) == count:
+            done.set()
+    return finished, done, on_finished
+
+def test_jobs_run_in_order_and_report_their_state():
+    finished, done, on_finished = _finished_jobs(3)
+    jobs = JobQueue(lambda command: (not command.startswith("bad"), f"ran {command}"), on_finished=on_finished)
+    submitted = [jobs.submit(command) for command in ("first", "bad", "third")]
+    assert done.wait(5)
+
+    assert [job.id for job in submitted] == [1, 2, 3]
+    assert [(job.command, job.state, job.result) for job in finished] == [
+        ("first", "done", "ran first"), ("bad", "failed", "ran bad"), ("third", "done", "ran third")]
+    assert jobs.get(2).started <= jobs.get(2).finished
+
+def test_exceptions_fail_the_job():
+    finished, done, on_finished = _finished_jobs(1)
+    jobs = JobQueue(lambda command: 1 / 0, on_finished=on_finished)
+    jobs.submit("anything")
+    assert done.wait(5)
+    assert (finished[0].state, finished[0].result) == ("failed", "Error running job: division by zero")
+
+def test_only_the_last_finished_jobs_are_kept():
+    finished, done, on_finished = _finished_jobs(5)
+    jobs = JobQueue(lambda command: (True, command), on_finished=on_finished, history=2)
+    for index in range(5):
+        jobs.submit(f"job {index}")
+    assert done.wait(5)
+    assert jobs.get(1) is None and jobs.get(3) is None
+    assert jobs.get(4).state == jobs.get(5).state == "done"
+
+def test_a_full_queue_refuses_new_jobs():
+    release = threading.Event()
+    jobs = JobQueue(lambda command: (release.wait(5), command), max_queued=1)
+    jobs.submit("running")
+    deadline = time.monotonic() + 5
+    while jobs.get(1).state != "running":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    jobs.submit("queued")
+    with pytest.raises(queue.Full):
+        jobs.submit("one too many")
+    release.set()
+
+def test_events_subscribers_receive_the_finished_jobs(start_server):
+    server = None
+
+    def on_finished(job):
+        server.broadcast(format_event("job", job.to_dict()), "events")
+
+    jobs = JobQueue(lambda command: (True, f"✅ {command}"), on_finished=on_finished)
+    server = start_server(lambda text: f"🧾 Job {jobs.submit(text).id} queued: {text}\n".encode('utf-8'),
+                          subscription_parser=lambda request: "events")
+    subscriber = connect(server, b"SUB EVENTS\n")
+    deadline = time.monotonic() + 5
+    while not server.has_subscribers("events"):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    assert read_all(connect(server, b"set_channel_mxc:1\n")) == "🧾 Job 1 queued: set_channel_mxc:1\n".encode('utf-8')
+    kind, _, payload = read_lines(subscriber, 1)[0].partition(" job ")
+    event = json.loads(payload)
+    assert kind == "EVENT"
+    assert (event["id"], event["command"], event["state"], event["result"]) == (1, "set_channel_mxc:1", "done", "✅ set_channel_mxc:1")
+
+def test_server_jobs_only_run_known_commands():
+    ok, reply = tcp_server.commands.execute("submit_job:submit_job:get_state")
+    assert not ok and reply == "❌ Unknown command for a job 'submit_job'"
+    ok, reply = tcp_server.commands.execute("submit_job:no_such_command")
+    assert not ok
+
+    ok, reply = tcp_server.commands.execute("submit_job:get_state:mxc_setpoint")
+    assert ok
+    job_id = int(reply.split()[2])
+    deadline = time.monotonic() + 5
+    while tcp_server.jobs.get(job_id).state not in ("done", "failed"):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    ok, reply = tcp_server.commands.execute(f"get_job:{job_id}")
+    assert ok and reply.startswith(f"🧾 Job {job_id} done: get_state:mxc_setpoint -> 🗂️ mxc_setpoint=")
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+from command_registry import Argument, Coalescer, CommandRegistry
+
+def test_a_lone_request_runs_at_once():
+    coalescer = Coalescer()
+    started = time.perf_counter()
+    assert coalescer.run("setpoint", "set:1", lambda: "set 1") == (True, "set 1")
+    assert time.perf_counter() - started < 0.05
+    assert coalescer.superseded == 0
+
+def test_coalescer_runs_only_the_last_request_waiting_for_a_running_one():
+    coalescer = Coalescer()
+    running = threading.Event()
+    release = threading.Event()
+    ran = []
+    results = {}
+
+    def write(value):
+        ran.append(value)
+        if value == 0:
+            running.set()
+            release.wait(5)
+        return f"set {value}"
+
+    def request(value):
+        results[value] = coalescer.run("setpoint", f"set:{value}", lambda: write(value))
+
+    threads = [threading.Thread(target=request, args=(0,))]
+    threads[0].start()
+    assert running.wait(5)
+    for value in range(1, 5):
+        threads.append(threading.Thread(target=request, args=(value,)))
+        threads[-1].start()
+        time.sleep(0.005)
+    for thread in threads[1:4]:
+        thread.join(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert ran == [0, 4]
+    assert results[0] == (True, "set 0")
+    assert results[4] == (True, "set 4")
+    # Each superseded request names the newer request that woke it
+    for value in range(1, 4):
+        ran_it, newer = results[value]
+        assert not ran_it and int(newer.partition(":")[2]) > value
+    assert coalescer.superseded == 3
+
+def test_coalescer_keys_are_independent():
+    coalescer = Coalescer()
+    assert coalescer.run("a", "a:1", lambda: "a") == (True, "a")
+    assert coalescer.run("b", "b:1", lambda: "b") == (True, "b")
+    assert coalescer.superseded == 0
+
+def test_coalescer_frees_the_key_after_an_exception():
+    coalescer = Coalescer()
+    with pytest.raises(ZeroDivisionError):
+        coalescer.run("a", "a:1", lambda: 1 / 0)
+    assert coalescer.run("a", "a:2", lambda: "a") == (True, "a")
+
+def test_superseded_command_reply_names_the_newer_request():
+    commands = CommandRegistry()
+    running = threading.Event()
+    release = threading.Event()
+    written = []
+
+    def set_gain(gain):
+        written.append(gain)
+        running.set()
+        release.wait(5)
+        return f"gain {gain}"
+
+    commands.add("set_gain", set_gain, Argument("gain", float, minimum=0.0), coalesce=True)
+
+    replies = {}
+    threads = [threading.Thread(target=lambda text=text: replies.setdefault(text, commands.execute(text)))
+               for text in ("set_gain:1", "set_gain:2", "set_gain:3")]
+    threads[0].start()
+    assert running.wait(5)
+    threads[1].start()
+    time.sleep(0.01)
+    threads[2].start()
+    threads[1].join(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert written == [1.0, 3.0]
+    assert replies["set_gain:1"] == (True, "gain 1.0")
+    assert replies["set_gain:2"] == (True, "⏭️ set_gain:2 superseded by set_gain:3")
+    assert replies["set_gain:3"] == (True, "gain 3.0")
+    assert commands.coalesce_key("set_gain:4") == "set_gain"
+
+def _registry():
+    commands = CommandRegistry()
+    commands.add("set_heater_power", lambda power: f"✅ power {power}",
+                 Argument("power", float, minimum=0.0, maximum=1.0, error="❌ Heater power must be between 0.0 and 1.0"))
+    commands.add("get_stats", lambda reset: f"stats reset={reset}",
+                 Argument("reset", str, choices=("reset",), default=None))
+    commands.add("submit", lambda command: f"queued {command}", Argument("command", str, rest=True))
+    commands.add("fail", lambda: 1 / 0, error="❌ Error failing")
+    return commands
+
+def test_arguments_are_converted_and_validated():
+    commands = _registry()
+    assert commands.execute("set_heater_power:0.5") == (True, "✅ power 0.5")
+    assert commands.execute("set_heater_power:2") == (False, "❌ Heater power must be between 0.0 and 1.0")
+    ok, reply = commands.execute("set_heater_power:high")
+    assert not ok and reply == "❌ Invalid power 'high': expected float"
+    ok, reply = commands.execute("set_heater_power")
+    assert not ok and reply == "❌ Missing power: set_heater_power:<power>"
+    ok, reply = commands.execute("set_heater_power:0.1:0.2")
+    assert not ok and "takes at most 1 argument(s)" in reply
+
+def test_optional_arguments_and_choices():
+    commands = _registry()
+    assert commands.execute("get_stats") == (True, "stats reset=None")
+    assert commands.execute("get_stats:reset") == (True, "stats reset=reset")
+    ok, reply = commands.execute("get_stats:clear")
+    assert not ok and "one of ['reset']" in reply
+
+def test_rest_argument_keeps_the_colons():
+    assert _registry().execute("submit:set_channel_50k:0") == (True, "queued set_channel_50k:0")
+
+def test_names_match_exactly():
+    commands = _registry()
+    # No prefix matching: "get_stats_all" is not "get_stats"
+    assert commands.execute("get_stats_all") == (False, "Unknown command 'get_stats_all'")
+    assert commands.names() == ["fail", "get_stats", "set_heater_power", "submit"]
+    with pytest.raises(ValueError):
+        commands.add("submit", lambda command: command)
+
+def test_exceptions_become_error_replies_and_are_counted():
+    commands = _registry()
+    assert commands.execute("fail") == (False, "❌ Error failing: division by zero")
+    commands.execute("set_heater_power:7")
+    summary = commands.stats.summary()
+    assert summary["fail"]["errors"] == 1 and summary["fail"]["run"]["n"] == 1
+    # Rejected while parsing: no run phase
+    assert summary["set_heater_power"]["errors"] == 1 and summary["set_heater_power"]["run"]["n"] == 0
@@ -0,0 +1,87 @@
+"""
+Persistent command sessions: "CMD" first line, pipelined commands with
+optional "@<id>" request ids, run one at a time in the order sent.
+"""
+
+import socket
+import threading
+import time
+
+from command_session import CommandSession
+from conftest import connect, read_all, read_lines
+from event_server import SESSION_MAX_LINE
+
+def echo(text: str) -> bytes:
+    return f"reply {text}\n".encode('utf-8')
+
+def test_pipelined_commands_reply_in_order_with_their_ids(start_server):
+    server = start_server(echo)
+    sock = connect(server, b"CMD\n@a get_state\n@b help\nget_job:1\n")
+    assert read_lines(sock, 4) == ["CMD ready", "@a reply get_state", "@b reply help", "reply get_job:1"]
+
+def _overlap_checking_handler():
+    # Handler recording the commands that started while another one was running
+    running = []
+    overlaps = []
+    lock = threading.Lock()
+
+    def handler(text: str) -> bytes:
+        with lock:
+            if running:
+                overlaps.append(text)
+            running.append(text)
+        time.sleep(0.01)
+        with lock:
+            running.remove(text)
+        return echo(text)
+    return handler, overlaps
+
+def test_session_commands_do_not_overlap(start_server):
+    handler, overlaps = _overlap_checking_handler()
+    server = start_server(handler)
+    commands = [f"@{i} set:{i}" for i in range(8)]
+    sock = connect(server, ("CMD\n" + "\n".join(commands) + "\n").encode('utf-8'))
+    assert read_lines(sock, 9)[1:] == [f"@{i} reply set:{i}" for i in range(8)]
+    assert overlaps == []
+
+def test_end_of_file_finishes_the_pending_commands(start_server):
+    server = start_server(lambda text: (time.sleep(0.02), echo(text))[1])
+    sock = connect(server, b"CMD\none\ntwo\nthree")      # Last command without its newline
+    sock.shutdown(socket.SHUT_WR)
+    assert read_all(sock).decode('utf-8').splitlines() == ["CMD ready", "reply one", "reply two", "reply three"]
+
+def test_commands_split_across_reads(start_server):
+    server = start_server(echo)
+    sock = connect(server, b"CMD\n@1 he")
+    time.sleep(0.05)
+    sock.sendall(b"lp\n\n@2 get_state\n")      # Blank lines are ignored
+    assert read_lines(sock, 3) == ["CMD ready", "@1 reply help", "@2 reply get_state"]
+
+def test_handler_errors_are_replied_and_keep_the_session(start_server):
+    def handler(text: str) -> bytes:
+        if text == "boom":
+            raise RuntimeError("device gone")
+        return echo(text)
+
+    server = start_server(handler)
+    sock = connect(server, b"CMD\n@1 boom\n@2 help\n")
+    assert read_lines(sock, 3) == ["CMD ready", "@1 Error handling command device gone", "@2 reply help"]
+
+def test_client_fails_its_pending_commands_on_an_untagged_error(start_server):
+    release = threading.Event()
+
+    def handler(text: str) -> bytes:
+        release.wait(5)
+        return echo(text)
+
+    server = start_server(handler)
+    session = CommandSession("127.0.0.1", server.port, timeout=5)
+    try:
+        running = session.submit("get_state")
+        too_long = session.submit("x" * (SESSION_MAX_LINE + 1))
+        for future in (running, too_long):
+            error = future.exception(5)
+            assert isinstance(error, ConnectionError) and "longer than" in str(error)
+    finally:
+        release.set()
+        session.close()
@@ -0,0 +1,17 @@
+from command_stats import CommandStats, command_key, format_summary
+
+def test_chained_commands_are_keyed_by_their_mnemonics():
+    assert command_key("RDGK? 6;RDGR? 6") == "RDGK?;RDGR?"
+
+def test_transaction_phases():
+    stats = CommandStats(window=10)
+    stats.record_io("RDGR? 6", 0.002, 0.010)
+    stats.record_parse("RDGR? 6", 0.0001)
+    stats.record_io("RDGR? 6", 0.004, 0.0, error=RuntimeError("no reply"))
+
+    entry = stats.summary()["RDGR?"]
+    assert (entry['count'], entry['errors'], entry['timeouts']) == (2, 1, 0)
+    # lock: mutex and pacing only; a failed transaction has no round trip
+    assert entry['lock']['n'] == 2 and entry['lock']['max'] == 4.0
+    assert entry['rtt']['n'] == 1
+    assert format_summary(stats.summary()).startswith("RDGR?: n=2 timeouts=0 errors=1 lock ")
@@ -0,0 +1,127 @@
+"""
+The configuration (slow) tier: the verifier reads the instrument itself, not
+the INSET cache of the driver, and reconciles the shadow state with it.
+"""
+
+import threading
+import time
+
+import pytest
+
+import tcp_server
+from default_config import DEFAULT_CHANNELS, DEFAULT_CHANNELS_ID
+from shadow_state import ShadowState, ShadowVerifier
+
+def test_configuration_is_read_from_the_instrument(emulated_lakeshore):
+    instrument, ls = emulated_lakeshore
+    channel, channel_id = DEFAULT_CHANNELS[0], DEFAULT_CHANNELS_ID[0]
+    assert ls.update_inset(channel, dwell=7)
+    # Round trip after the write, so the emulator has applied it; the cache holds dwell 7
+    assert ls.get_inset_settings(channel, refresh=True)[1] == "007"
+    # Changed on the front panel (or by another client) behind the cached write
+    instrument.inset[channel][1] = 42
+    instrument.inset[channel][0] = 0
+
+    values = tcp_server._read_configuration(ls)
+
+    assert values[f"dwell_{channel_id}"] == 42
+    assert values[f"enabled_{channel_id}"] == 0
+    assert values[f"pause_{channel_id}"] == instrument.inset[channel][2]
+    assert values[f"curve_{channel_id}"] == instrument.inset[channel][3]
+    assert values["mxc_heater_range"] is not None
+    assert values["scan"] is not None
+
+def test_verifier_reports_a_contradicted_write(emulated_lakeshore):
+    instrument, ls = emulated_lakeshore
+    channel, channel_id = DEFAULT_CHANNELS[0], DEFAULT_CHANNELS_ID[0]
+    state = ShadowState(tcp_server.SHADOW_PARAMETERS)
+    verifier = ShadowVerifier(state, lambda: tcp_server._read_configuration(ls), interval=60)
+    assert verifier.verify()
+
+    assert ls.update_inset(channel, dwell=7)
+    state.write(f"dwell_{channel_id}", 7)
+    ls.get_inset_settings(channel, refresh=True)
+    instrument.inset[channel][1] = 42
+    assert verifier.verify("interval")
+
+    entry = state.entry(f"dwell_{channel_id}")
+    assert (entry.value, entry.source) == (42, "device")
+    assert entry.verified is not None
+    assert state.drifts == 1
+
+def test_verifier_runs_at_once_after_a_refresh():
+    state = ShadowState(["gain"])
+    reads = []
+    read_done = threading.Event()
+
+    def read():
+        reads.append(time.monotonic())
+        read_done.set()
+        return {"gain": len(reads)}
+
+    reasons = []
+    verifier = ShadowVerifier(state, read, interval=60, on_verify=reasons.append).start()
+    try:
+        verifier.refresh.set()
+        assert read_done.wait(5)
+        assert reasons == ["write"]
+        assert state.get("gain") == 1
+    finally:
+        verifier.stop(5)
+    assert not verifier._thread.is_alive()
+
+def test_shadow_ignores_a_read_older_than_the_write():
+    state = ShadowState(["setpoint"])
+    requested = time.monotonic()
+    state.write("setpoint", 0.05)
+    # The read was requested before the write: it cannot confirm nor undo it
+    state.observe({"setpoint": 0.01}, requested)
+    assert state.get("setpoint") == 0.05
+    assert state.entry("setpoint").verified is None
+    assert state.drifts == 0
+
+    state.observe({"setpoint": 0.05}, time.monotonic())
+    assert state.entry("setpoint").verified is not None
+    assert state.drifts == 0
+
+def test_dwell_command_writes_the_whole_seconds_the_device_keeps(monkeypatch):
+    state = ShadowState(tcp_server.SHADOW_PARAMETERS)
+    monkeypatch.setattr(tcp_server, "shadow", state)
+    verifier = ShadowVerifier(state, lambda: tcp_server.device.call(tcp_server._read_configuration), interval=60)
+    original = tcp_server.device.call("get_dwell_time", 6)
+    try:
+        reply = tcp_server.handle_command("set_dwell_mxc:5.5")
+        assert reply.startswith("✅") and reply.endswith("to 5 s")
+        assert state.get("dwell_MXC") == 5
+        assert verifier.verify("write")
+        assert state.drifts == 0
+        assert state.entry("dwell_MXC").value == 5
+    finally:
+        tcp_server.device.call("set_channel_dwell_time", original, channel=6)
+
+@pytest.mark.parametrize("mode", ["scan", "all"])
+def test_fast_tier_only_reads_the_channels(monkeypatch, mode):
+    state = ShadowState(tcp_server.SHADOW_PARAMETERS)
+    state.observe({f"enabled_{channel_id}": 1 for channel_id in DEFAULT_CHANNELS_ID} | {"scan": ("06", "0")}, time.monotonic())
+    monkeypatch.setattr(tcp_server, "shadow", state)
+    sent = []
+
+    def query_batches(batches):
+        sent.extend(query for batch in batches for query in batch)
+        return {query: None for batch in batches for query in batch} | {"SCAN?": ["06", "0"]}
+
+    monkeypatch.setattr(tcp_server, "_query_batches", query_batches)
+    acquisition = tcp_server.LakeShoreAcquisition(mode)
+    for _ in range(3):
+        acquisition.poll()
+
+    assert sent
+    assert {query.split()[0] for query in sent} <= {"RDGK?", "RDGR?", "RDGPWR?", "SCAN?"}
+
+def test_set_commands_trigger_a_configuration_read():
+    tcp_server.config_refresh.clear()
+    tcp_server.commands.stats.record_call("get_state", {"parse": 0.0, "run": 0.0}, None)
+    assert not tcp_server.config_refresh.is_set()
+    tcp_server.commands.stats.record_call("set_mxc_heater_range", {"parse": 0.0, "run": 0.0}, None)
+    assert tcp_server.config_refresh.is_set()
+    tcp_server.config_refresh.clear()
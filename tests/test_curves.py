@@ -0,0 +1,25 @@
+import json
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+from curves import CURVE_FORMAT_LOG_OHM, CURVE_FORMAT_OHM, CalibrationCurve
+
+def test_temperature_is_interpolated_inside_the_curve():
+    curve = CalibrationCurve(1, "RX-102A", "1234", CURVE_FORMAT_OHM, 40.0, 1, [[1000.0, 4.0], [2000.0, 2.0]])
+    assert curve.temperature(1500.0) == pytest.approx(3.0)
+
+@pytest.mark.parametrize("resistance", [500.0, 5000.0, 0.0])
+def test_out_of_range_resistance_gives_none(resistance):
+    curve = CalibrationCurve(4, "RX-102A", "1234", CURVE_FORMAT_LOG_OHM, 40.0, 1, [[3.0, 4.0], [3.3, 2.0]])
+    temperature = curve.temperature(resistance)
+    assert temperature is None
+    # Browsers' JSON.parse rejects NaN, null is fine
+    json.loads(json.dumps({"MXC": temperature}, allow_nan=False))
+
+def test_arrays_keep_nan_outside_the_curve():
+    curve = CalibrationCurve(1, "RX-102A", "1234", CURVE_FORMAT_OHM, 40.0, 1, [[1000.0, 4.0], [2000.0, 2.0]])
+    temperatures = curve.temperature([1500.0, 5000.0])
+    assert temperatures[0] == pytest.approx(3.0)
+    assert math.isnan(temperatures[1])
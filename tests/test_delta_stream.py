@@ -0,0 +1,26 @@
+from delta_stream import DeltaDecoder, DeltaEncoder
+
+def test_deltas_carry_only_the_changed_fields():
+    encoder = DeltaEncoder(keyframe_interval=3)
+    lines = [encoder.update(1, 10.0, {"MXC": 0.01, "4K": 4.2}),
+             encoder.update(2, 11.0, {"MXC": 0.02, "4K": 4.2}),
+             encoder.update(3, 12.0, {"MXC": 0.02, "4K": 4.2}),
+             encoder.update(4, 13.0, {"MXC": 0.03, "4K": 4.2})]
+    assert lines[0] == b"K 1 10.000 MXC: 0.01,4K: 4.2\n"
+    assert lines[1] == b"D 2 1 11.000 MXC: 0.02\n"
+    assert lines[2] == b"D 3 2 12.000 \n"
+    assert lines[3].startswith(b"K 4 ")     # Periodic keyframe
+    assert encoder.keyframe() == b"K 4 13.000 MXC: 0.03,4K: 4.2\n"
+
+def test_decoder_asks_for_a_resync_after_a_gap():
+    encoder = DeltaEncoder()
+    lines = [encoder.update(seq, float(seq), {"MXC": seq / 100}).decode('utf-8') for seq in range(1, 5)]
+    decoder = DeltaDecoder()
+    assert decoder.feed_line(lines[0]) and decoder.feed_line(lines[1])
+    # lines[2] dropped by the slow-consumer policy
+    assert not decoder.feed_line(lines[3])
+    assert decoder.needs_resync and decoder.fields["MXC"] == "0.02"
+
+    assert decoder.feed_line(encoder.keyframe().decode('utf-8'))
+    assert not decoder.needs_resync
+    assert (decoder.seq, decoder.fields["MXC"]) == (4, "0.04")
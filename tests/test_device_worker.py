@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+from device_worker import DeviceWorker, PRIORITY_COMMAND, PRIORITY_POLL
+
+class Driver:
+    def read(self):
+        return 42
+
+    def scale(self, value, factor=1):
+        return value * factor
+
+    def fail(self):
+        raise TimeoutError("VISA timeout")
+
+def test_every_operation_runs_on_the_worker_thread_one_at_a_time():
+    worker = DeviceWorker(Driver())
+    threads_seen = set()
+    running = []
+    overlaps = []
+    lock = threading.Lock()
+
+    def operation(driver, value):
+        with lock:
+            overlaps.extend(running)
+            running.append(value)
+        threads_seen.add(threading.current_thread().name)
+        with lock:
+            running.remove(value)
+        return value
+
+    results = {}
+    callers = [threading.Thread(target=lambda i=i: results.setdefault(i, worker.call(operation, i, timeout=5)))
+               for i in range(20)]
+    try:
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join(5)
+    finally:
+        worker.stop()
+    assert results == {i: i for i in range(20)}
+    assert threads_seen == {"lakeshore-device"}
+    assert overlaps == []
+
+def test_driver_methods_and_errors_reach_the_caller():
+    worker = DeviceWorker(Driver())
+    try:
+        assert worker.call("scale", 3, factor=2, timeout=5) == 6
+        with pytest.raises(TimeoutError):
+            worker.call("fail", timeout=5)
+        # The worker survives a failed operation
+        assert worker.call("read", timeout=5) == 42
+    finally:
+        worker.stop()
+
+def test_stop_runs_the_operations_already_queued():
+    worker = DeviceWorker(Driver())
+    release = threading.Event()
+    worker.submit(lambda driver: release.wait(5))
+    queued = worker.submit("read", priority=PRIORITY_POLL)
+    cancelled = worker.submit("read", priority=PRIORITY_POLL)
+    assert cancelled.cancel()
+    release.set()
+    worker.stop()
+    assert queued.result(0) == 42
+    assert worker.pending() == 0
+
+def test_commands_overtake_queued_polls():
+    worker = DeviceWorker(Driver())
+    release = threading.Event()
+    order = []
+    try:
+        worker.submit(lambda driver: release.wait(5))
+        polls = [worker.submit(lambda driver, i=i: order.append(f"poll {i}"), priority=PRIORITY_POLL) for i in range(2)]
+        command = worker.submit(lambda driver: order.append("command"), priority=PRIORITY_COMMAND)
+        release.set()
+        for future in polls + [command]:
+            future.result(5)
+    finally:
+        worker.stop()
+    assert order == ["command", "poll 0", "poll 1"]
+
+def test_stats_include_the_queue_wait():
+    waits = []
+    worker = DeviceWorker(Driver(), on_wait=lambda priority, seconds: waits.append(seconds))
+    release = threading.Event()
+    try:
+        blocker = worker.submit(lambda driver: release.wait(5))
+        read = worker.submit("read")
+        threading.Timer(0.05, release.set).start()
+        assert read.result(5) == 42
+        blocker.result(5)
+    finally:
+        worker.stop()
+
+    summary = worker.stats.summary()
+    # Queued behind the blocker for about 50 ms, before the driver was called
+    assert summary["read"]["queue"]["max"] >= 40
+    assert summary["read"]["count"] == 1
+    assert summary["<lambda>"]["run"]["max"] >= 40
+    assert max(waits) >= 0.04
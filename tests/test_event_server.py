@@ -0,0 +1,100 @@
+import threading
+import time
+
+from conftest import connect, read_all, read_lines
+from event_server import COMMAND_WORKERS
+
+def echo(text: str) -> bytes:
+    return f"reply {text}\n".encode('utf-8')
+
+def test_single_command_gets_its_reply_and_is_closed(start_server):
+    server = start_server(echo)
+    sock = connect(server, b"help\n")
+    assert read_all(sock) == b"reply help\n"
+
+def test_command_starting_with_sub_is_not_a_subscription(start_server):
+    server = start_server(echo)
+    sock = connect(server, b"submit_job:set_channel_50k:0\n")
+    assert read_all(sock) == b"reply submit_job:set_channel_50k:0\n"
+
+def test_sub_request_receives_broadcasts(start_server):
+    server = start_server(echo)
+    sock = connect(server, b"SUB\n")
+    deadline = time.monotonic() + 5
+    while server.subscriber_count() == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    server.broadcast(b"tick 1\n")
+    server.broadcast(b"tick 2\n")
+    assert read_lines(sock, 2) == ["tick 1", "tick 2"]
+
+def slow_echo(text: str) -> bytes:
+    time.sleep(0.02)
+    return echo(text)
+
+def supersede_p(text: str, later_texts: list) -> bytes | None:
+    # "P<n>" commands write the same parameter: a later one makes an earlier one pointless
+    if text.startswith("P") and any(later.startswith("P") for later in later_texts):
+        return f"superseded {text}\n".encode('utf-8')
+    return None
+
+def test_superseded_session_replies_keep_submission_order(start_server):
+    server = start_server(slow_echo, supersede=supersede_p)
+    sock = connect(server, b"CMD\nP1\nI1\nP2\nP3\n")
+    assert read_lines(sock, 5) == ["CMD ready", "superseded P1", "reply I1", "superseded P2", "reply P3"]
+
+def test_superseded_session_replies_keep_their_ids(start_server):
+    server = start_server(slow_echo, supersede=supersede_p)
+    sock = connect(server, b"CMD\n@1 P1\n@2 I1\n@3 P2\n@4 P3\n")
+    assert read_lines(sock, 5) == ["CMD ready", "@1 superseded P1", "@2 reply I1", "@3 superseded P2", "@4 reply P3"]
+
+def test_legacy_sub_prefix_still_subscribes(start_server):
+    server = start_server(echo)
+    sock = connect(server, b"SUBSCRIBE\n")
+    deadline = time.monotonic() + 5
+    while server.subscriber_count() == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    server.broadcast(b"tick 1\n")
+    assert read_lines(sock, 1) == ["tick 1"]
+
+def _wait_for_subscribers(server, count: int):
+    deadline = time.monotonic() + 5
+    while server.subscriber_count() != count:
+        assert time.monotonic() < deadline, f"Expected {count} subscribers, got {server.subscriber_count()}"
+        time.sleep(0.01)
+
+def test_many_connections_share_the_loop_and_command_pool(start_server):
+    threads_before = threading.active_count()
+    server = start_server(echo)
+    socks = [connect(server, f"get:{i}\n".encode('utf-8')) for i in range(50)]
+    for i, sock in enumerate(socks):
+        assert read_all(sock) == f"reply get:{i}\n".encode('utf-8')
+    # The loop thread and the command pool, not one thread per connection
+    assert threading.active_count() <= threads_before + 1 + COMMAND_WORKERS
+
+def test_a_slow_command_does_not_delay_broadcasts(start_server):
+    release = threading.Event()
+
+    def blocking(text: str) -> bytes:
+        release.wait(5)
+        return echo(text)
+
+    server = start_server(blocking)
+    command = connect(server, b"set:1\n")
+    subscriber = connect(server, b"SUB\n")
+    try:
+        _wait_for_subscribers(server, 1)
+        server.broadcast(b"tick 1\n")
+        assert read_lines(subscriber, 1) == ["tick 1"]
+    finally:
+        release.set()
+    assert read_all(command) == b"reply set:1\n"
+
+def test_closed_subscribers_are_removed(start_server):
+    server = start_server(echo)
+    subscriber = connect(server, b"SUB\n")
+    _wait_for_subscribers(server, 1)
+    subscriber.close()
+    _wait_for_subscribers(server, 0)
+    server.broadcast(b"tick 1\n")
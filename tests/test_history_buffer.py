@@ -0,0 +1,49 @@
+import pytest
+
+import tcp_server
+from history_buffer import FRAME_SIZE, HistoryRing, parse_since
+from wire_format import FrameReader, encode_frame
+
+def _ring(capacity: int, seqs) -> HistoryRing:
+    ring = HistoryRing(capacity)
+    for seq in seqs:
+        ring.append(seq, 1000.0 + seq, encode_frame(seq, 1000.0 + seq, {"MXC": seq / 100}))
+    return ring
+
+def _seqs(frames: bytes) -> list:
+    return [seq for seq, _, _ in FrameReader().feed(frames)]
+
+def test_the_oldest_ticks_are_overwritten():
+    ring = _ring(4, range(1, 7))
+    assert len(ring) == 4
+    assert (ring.first_seq(), ring.last_seq()) == (3, 6)
+    assert _seqs(ring.frames()) == [3, 4, 5, 6]
+
+def test_backfill_after_a_sequence_number_or_a_time():
+    ring = _ring(4, range(1, 7))        # Wrapped around
+    assert _seqs(ring.frames_since_seq(4)) == [5, 6]
+    assert _seqs(ring.frames_since_seq(0)) == [3, 4, 5, 6]
+    assert ring.frames_since_seq(6) == b""
+    assert _seqs(ring.frames_since_time(1004.5)) == [5, 6]
+
+def test_frames_have_a_fixed_size():
+    with pytest.raises(ValueError):
+        HistoryRing(2).append(1, 1.0, b"short")
+    assert len(_ring(2, [1]).frames()) == FRAME_SIZE
+
+def test_since_values():
+    assert parse_since("1234", 2e9) == ("seq", 1234)
+    assert parse_since("1792190000.5", 2e9) == ("time", 1792190000.5)
+    assert parse_since("-600", 2e9) == ("time", 2e9 - 600)
+    with pytest.raises(ValueError):
+        parse_since("yesterday", 2e9)
+
+def test_server_backfills_only_the_binary_stream():
+
+    stream, backlog = tcp_server.subscription_stream("SUB BIN since=-60")
+    assert stream == "bin" and callable(backlog)
+    with pytest.raises(ValueError):
+        tcp_server.subscription_stream("SUB since=5")
+
+def test_server_history_covers_its_window_at_the_acquisition_rate():
+    assert tcp_server.history.capacity * tcp_server.LakeShoreAcquisition().interval == tcp_server.HISTORY_SECONDS
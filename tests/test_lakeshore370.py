@@ -0,0 +1,155 @@
+"""
+The LakeShore370 driver against the protocol emulator, through a local socket.
+"""
+
+import threading
+import time
+
+import lakeshore370
+from default_config import DEFAULT_CHANNELS
+
+def _count_transactions(ls) -> list:
+    """ Record every line the driver sends (one per device round trip). """
+    sent = []
+    query = ls._query
+
+    def counting_query(command, parse=None):
+        sent.append(command)
+        return query(command, parse)
+
+    ls._query = counting_query
+    return sent
+
+def test_query_many_chains_and_parses_the_replies(emulated_lakeshore):
+    instrument, ls = emulated_lakeshore
+    sent = _count_transactions(ls)
+
+    temperature, setpoint, pid, inset, scan = ls.query_many(["RDGK? 6", "SETP?", "PID?", "INSET? 6", "SCAN?"])
+
+    assert len(sent) == 1
+    assert isinstance(temperature, float) and temperature > 0
+    assert setpoint == instrument.setpoint
+    assert pid == dict(zip("PID", instrument.pid))
+    on, dwell, pause, curve, tempco = instrument.inset[6]
+    assert inset == [str(on), f"{dwell:03d}", f"{pause:03d}", f"{curve:02d}", str(tempco)]
+    assert scan == [f"{instrument.scan_channel:02d}", str(instrument.autoscan)]
+
+def test_query_many_splits_long_lines_and_keeps_the_order(emulated_lakeshore):
+    _, ls = emulated_lakeshore
+    sent = _count_transactions(ls)
+    queries = [f"INSET? {channel}" for channel in DEFAULT_CHANNELS] * 2
+
+    results = ls.query_many(queries)
+
+    assert all(len(line) <= lakeshore370.MAX_CHAINED_QUERY_LENGTH for line in sent)
+    assert len(sent) > 1
+    assert results == results[:len(DEFAULT_CHANNELS)] * 2
+    assert all(result is not None for result in results)
+
+def test_a_failed_batch_yields_none_for_its_queries_only(emulated_lakeshore):
+    _, ls = emulated_lakeshore
+    # The instrument ignores the unknown query, so the batch gets one reply too few
+    queries = ["SETP?", "BOGUS?"] + ["HTRRNG?"] * 20
+
+    results = ls.query_many(queries)
+
+    batches = list(lakeshore370._chain_queries(queries))
+    assert len(batches) > 1
+    assert results[:len(batches[0])] == [None] * len(batches[0])
+    assert results[len(batches[0]):] == [results[-1]] * (len(queries) - len(batches[0]))
+    assert results[-1] is not None
+
+def test_inset_reply_without_a_channel_does_not_break_the_batch(emulated_lakeshore):
+    _, ls = emulated_lakeshore
+    ls._query = lambda command, parse=None: "1,010,003,00,2;1,010,003,00,2;+1.00000E-01"
+
+    assert ls.query_many(["INSET?", "INSET? x", "SETP?"]) == [["1", "010", "003", "00", "2"]] * 2 + [0.1]
+    assert ls._inset_cache == {}
+
+def test_inset_records_are_cached_until_their_ttl(emulated_lakeshore):
+    instrument, ls = emulated_lakeshore
+    channel = DEFAULT_CHANNELS[0]
+    sent = _count_transactions(ls)
+
+    assert ls.get_dwell_time(channel) == instrument.inset[channel][1]
+    assert ls.get_pause_time(channel) == instrument.inset[channel][2]
+    assert sent == [f"INSET? {channel}"]
+
+    ls.get_inset_settings(channel, refresh=True)
+    ls.inset_cache_ttl = 0
+    ls.get_dwell_time(channel)
+    assert len(sent) == 3
+
+def test_inset_cache_is_filled_by_query_many_and_cleared(emulated_lakeshore):
+    _, ls = emulated_lakeshore
+    channel = DEFAULT_CHANNELS[0]
+    record = ls.query_many([f"INSET? {channel}"])[0]
+    sent = _count_transactions(ls)
+
+    assert ls.get_inset_settings(channel) == record
+    assert sent == []
+    ls.clear_inset_cache(channel)
+    assert ls.get_inset_settings(channel) == record
+    assert len(sent) == 1
+
+def test_update_inset_merges_with_the_device_record(emulated_lakeshore):
+    instrument, ls = emulated_lakeshore
+    channel = DEFAULT_CHANNELS[0]
+    ls.get_inset_settings(channel)
+    # Changed behind the cache: the update must not write the stale curve back
+    instrument.inset[channel][3] = 7
+    sent = _count_transactions(ls)
+
+    assert ls.update_inset(channel, dwell=12, pause=5)
+
+    assert sent == [f"INSET? {channel}"]
+    ls.get_inset_settings(channel, refresh=True)
+    assert instrument.inset[channel][1:4] == [12, 5, 7]
+
+def test_update_inset_rejects_invalid_fields_without_writing(emulated_lakeshore):
+    instrument, ls = emulated_lakeshore
+    channel = DEFAULT_CHANNELS[0]
+    record = list(instrument.inset[channel])
+    sent = _count_transactions(ls)
+
+    assert not ls.update_inset(channel, dwell=0)
+    assert not ls.update_inset(channel, speed=3)
+    assert not ls.update_inset(channel, pause="slow")
+
+    assert sent == []
+    ls.get_inset_settings(channel, refresh=True)
+    assert instrument.inset[channel] == record
+
+def test_concurrent_updates_of_different_fields_are_all_kept(emulated_lakeshore):
+    instrument, ls = emulated_lakeshore
+    channel = DEFAULT_CHANNELS[0]
+
+    def update(field, values):
+        for value in values:
+            assert ls.update_inset(channel, **{field: value})
+
+    threads = [threading.Thread(target=update, args=("dwell", range(20, 31))),
+               threading.Thread(target=update, args=("pause", range(40, 51)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    ls.get_inset_settings(channel, refresh=True)
+    assert instrument.inset[channel][1:3] == [30, 50]
+
+def _timed(function, *args) -> float:
+    started = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started
+
+def test_commands_wait_only_for_what_is_left_of_the_spacing(emulated_lakeshore):
+    _, ls = emulated_lakeshore
+    ls.min_command_interval = 0.3
+    ls.write_settle_time = 0.5
+
+    ls._write("HTRRNG 2")
+    assert _timed(ls._query, "HTRRNG?") >= 0.45
+    # The spacing already elapsed while the caller was busy: no extra wait
+    time.sleep(0.35)
+    assert _timed(ls._query, "HTRRNG?") < 0.2
@@ -0,0 +1,27 @@
+import asyncio
+
+from device_worker import DeviceWorker
+from lakeshore370_async import AsyncLakeShore370
+from lakeshore370_dummy import LakeShore370
+
+def test_close_leaves_a_shared_worker_running():
+    worker = DeviceWorker(LakeShore370())
+
+    async def use():
+        async with AsyncLakeShore370(worker=worker) as ls:
+            await ls.call("get_autoscan")
+
+    asyncio.run(use())
+    # The synchronous code sharing the worker can still use it
+    assert worker.call(lambda driver: "still running", timeout=5) == "still running"
+    worker.stop()
+
+def test_close_stops_its_own_worker():
+    async def use():
+        ls = AsyncLakeShore370(LakeShore370())
+        await ls.close()
+        return ls
+
+    ls = asyncio.run(use())
+    assert ls.owns_worker
+    assert not ls.worker._thread.is_alive()
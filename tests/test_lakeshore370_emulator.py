@@ -0,0 +1,49 @@
+"""
+The Lake Shore 370 emulator: its command set, and the scanner measuring only
+the selected channel.
+"""
+
+import socket
+
+from lakeshore370_emulator import EmulatedLakeShore370, serve_socket
+
+def test_chained_queries_are_answered_in_order():
+    instrument = EmulatedLakeShore370()
+    assert instrument.handle_line("SETP 0.05;SETP?;HTRRNG?;PID?\r") == f"{0.05:+.5E};{instrument.heater_range};" + \
+        ",".join(f"{value:+.4f}" for value in instrument.pid)
+    assert instrument.handle_line("HTRRNG 3") is None
+    assert instrument.heater_range == 3
+
+def test_malformed_commands_are_ignored():
+    instrument = EmulatedLakeShore370()
+    record = list(instrument.inset[6])
+    assert instrument.handle_line("INSET 6,1;BOGUS?;SCAN?") == "06,0"
+    assert instrument.inset[6] == record
+
+def test_only_the_scanned_channel_is_measured():
+    instrument = EmulatedLakeShore370()
+    instrument.handle_line("SCAN 6,0")
+    instrument.scan_since -= instrument.inset[6][2]     # Past the pause (settling) time
+    held = instrument.held[1]
+
+    readings = {instrument.handle_line("RDGR? 6") for _ in range(5)}
+
+    assert len(readings) > 1
+    assert instrument.handle_line("RDGK? 1") == f"{held[0]:+.5E}"
+
+def test_autoscan_moves_to_the_next_enabled_channel():
+    instrument = EmulatedLakeShore370()
+    enabled = [channel for channel in range(1, 17) if instrument.inset[channel][0]]
+    instrument.handle_line(f"SCAN {enabled[-1]},1")
+    _, dwell, pause, _, _ = instrument.inset[enabled[-1]]
+    instrument.scan_since -= pause + dwell
+
+    assert instrument.handle_line("SCAN?") == f"{enabled[0]:02d},1"
+
+def test_socket_link_terminates_the_replies():
+    address = serve_socket(EmulatedLakeShore370(), port=0, baud_rate=0)
+    _, host, port, _ = address.split("::")
+    with socket.create_connection((host, int(port)), timeout=5) as sock:
+        sock.sendall(b"HTRRNG 2\r\n*IDN?\r\n")
+        reader = sock.makefile('rb')
+        assert reader.readline() == b"LSCI,MODEL370,EMULATOR,1.0\r\n"
@@ -0,0 +1,26 @@
+import logging
+
+import tcp_server
+from snapshot_buffer import SnapshotRing
+
+def _snapshot(heater_range, sensor_range="5", sensor_mode="0"):
+    return SnapshotRing(1).append(
+        {"temperatures": {"50K": 49.8, "4K": 4.2, "STILL": 0.9, "MXC": 0.01}},
+        {"MXCSP": 0.01, "P": 1.0, "I": 1.0, "D": 0.0, "HR": heater_range},
+        {"autoscan": ("6", "0"), "sensor_range": sensor_range, "sensor_mode": sensor_mode})
+
+def _logged(snapshot, caplog) -> str:
+    with caplog.at_level(logging.DEBUG, logger="tcp_server"):
+        tcp_server.log_temperatures(snapshot)
+    return caplog.records[-1].getMessage()
+
+def test_heater_range_is_logged(caplog):
+    line = _logged(_snapshot("5"), caplog)
+    assert "heater_range=5(3.16mA)" in line
+    assert "mode_MXC=voltage(" in line
+
+def test_unknown_settings_are_left_out(caplog):
+    # HR is None while the heater output display is not current; the excitation is not read yet
+    line = _logged(_snapshot(None, sensor_range=None, sensor_mode=None), caplog)
+    assert line.startswith("tick seq=1 ")
+    assert "heater_range" not in line and "mode_MXC" not in line
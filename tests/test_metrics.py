@@ -0,0 +1,68 @@
+import urllib.request
+
+import pytest
+
+import tcp_server
+from metrics import CONTENT_TYPE, Gauge, MetricsRegistry, MetricsServer
+
+def test_instruments_render_in_the_openmetrics_format():
+    registry = MetricsRegistry()
+    polls = registry.counter("polls", "Poll cycles")
+    readings = registry.counter("readings", "Readings per channel", ("channel",))
+    duration = registry.histogram("duration_seconds", "Poll duration", buckets=(0.1, 1.0))
+    polls.inc()
+    readings.inc(channel="MXC")
+    readings.inc(2, channel="MXC")
+    duration.observe(0.05)
+    duration.observe(0.5)
+    duration.observe(5.0)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE polls counter" in lines and "polls_total 1" in lines
+    assert 'readings_total{channel="MXC"} 3' in lines
+    assert ['duration_seconds_bucket{le="0.1"} 1', 'duration_seconds_bucket{le="1.0"} 2',
+            'duration_seconds_bucket{le="+Inf"} 3', "duration_seconds_count 3",
+            "duration_seconds_sum 5.55"] == [line for line in lines if line.startswith("duration_seconds_")]
+    assert lines[-1] == "# EOF"
+
+def test_labels_are_checked_and_escaped():
+    registry = MetricsRegistry()
+    gauge = registry.gauge("queue", "Queue depth", ("peer",))
+    with pytest.raises(ValueError):
+        gauge.set(1)
+    gauge.set(float("nan"), peer='a"b')
+    assert 'queue{peer="a\\"b"} NaN' in registry.render()
+    with pytest.raises(ValueError):
+        registry.gauge("queue", "Registered twice")
+
+def test_collectors_are_read_at_scrape_time_and_isolated():
+    registry = MetricsRegistry()
+    value = {"depth": 1}
+
+    def collector():
+        gauge = Gauge("depth", "Depth")
+        gauge.set(value["depth"])
+        return [gauge]
+
+    registry.add_collector(lambda: 1 / 0)
+    registry.add_collector(collector)
+    value["depth"] = 7
+    assert "depth 7" in registry.render().splitlines()
+
+def test_metrics_server_serves_the_registry():
+    registry = MetricsRegistry()
+    registry.counter("hits", "Hits").inc()
+    server = MetricsServer(registry, "127.0.0.1", 0)
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.httpd.server_address[1]}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"] == CONTENT_TYPE
+            assert "hits_total 1" in response.read().decode('utf-8')
+    finally:
+        server.stop()
+
+def test_server_metrics_render():
+    text = tcp_server.metrics.render()
+    for name in ("lakeshore_poll_duration_seconds", "lakeshore_device_queue_depth", "lakeshore_state_drifts_total",
+                 "tcp_subscribers"):
+        assert name in text
@@ -0,0 +1,72 @@
+"""
+Asynchronous rotating logging: the sampling and rate-limit filters, the
+print() capture and the queue listener writing the rotated files.
+"""
+
+import logging
+
+import pytest
+
+from server_logging import PrintCapture, RateLimitFilter, SamplingFilter, print_level, setup_logging
+
+def _record(message: str, level: int = logging.INFO, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("tcp_server", level, __file__, 0, message, None, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_sampled_records_pass_once_per_interval():
+    sampling = SamplingFilter(interval=60)
+    assert sampling.filter(_record("tick 1", sample="tick"))
+    assert not sampling.filter(_record("tick 2", sample="tick"))
+    assert sampling.filter(_record("other", sample="other"))
+    assert sampling.filter(_record("not sampled"))
+
+    sampling.interval = 0
+    assert sampling.filter(_record("tick 3", sample="tick"))
+
+def test_repeated_errors_are_counted_in_the_next_report():
+    limit = RateLimitFilter(period=60)
+    assert limit.filter(_record("Query failed", logging.ERROR))
+    assert not limit.filter(_record("Query failed", logging.ERROR))
+    assert not limit.filter(_record("Query failed", logging.ERROR))
+    assert limit.filter(_record("Query failed", logging.INFO))     # Below WARNING: never limited
+
+    limit.period = 0
+    record = _record("Query failed", logging.ERROR)
+    assert limit.filter(record)
+    assert record.getMessage() == "Query failed (repeated 2 times since the last report)"
+
+@pytest.mark.parametrize("line, level", [
+    ("❌ Failed to set heater range", logging.ERROR),
+    ("Chained query ['SETP?'] failed.", logging.ERROR),
+    ("⚠️ dwell_MXC was written as 5 but the device reports 7", logging.WARNING),
+    ("Client ('127.0.0.1', 5000) opened a command session", logging.INFO),
+])
+def test_print_lines_get_a_level(line, level):
+    assert print_level(line) == level
+
+def test_print_capture_logs_complete_lines(caplog):
+    capture = PrintCapture(logging.getLogger("print"))
+    with caplog.at_level(logging.INFO, logger="print"):
+        capture.write("first ")
+        capture.write("line\n\nError reading\nunfinished")
+    assert [(record.levelno, record.getMessage()) for record in caplog.records] == [
+        (logging.INFO, "first line"), (logging.ERROR, "Error reading")]
+
+def test_records_are_written_by_the_listener_and_rotated(tmp_path):
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    log_file = tmp_path / "server.log"
+    listener = setup_logging(str(log_file), "INFO", console=False, max_bytes=2000, backup_count=2, capture_prints=False)
+    try:
+        logger = logging.getLogger("tcp_server")
+        for index in range(100):
+            logger.info(f"line {index:03d} " + "x" * 50)
+    finally:
+        listener.stop()
+        root.handlers[:] = handlers
+        root.setLevel(level)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["server.log", "server.log.1", "server.log.2"]
+    assert "line 099" in log_file.read_text(encoding="utf-8")
+    assert all(path.stat().st_size <= 2000 for path in tmp_path.iterdir())
@@ -0,0 +1,72 @@
+"""
+Slow-consumer policies of the event server, on a subscriber whose socket
+buffer is already full (nothing it is sent leaves the queue).
+"""
+
+import socket
+
+import pytest
+
+from event_server import EventServer, _Connection
+
+def _stalled_subscriber(server: EventServer):
+    sock, peer = socket.socketpair()
+    sock.setblocking(False)
+    try:
+        while True:
+            sock.send(b"x" * 65536)
+    except BlockingIOError:
+        pass
+    connection = _Connection(sock, ("127.0.0.1", 0))
+    connection.mode = "SUB"
+    connection.stream = "text"
+    server._connections[sock] = connection
+    server._subscribers.add(connection)
+    server._streams.setdefault("text", set()).add(connection)
+    return connection, peer
+
+@pytest.mark.parametrize("policy, queued", [
+    ("drop_oldest", [b"4", b"5", b"6"]),
+    # On overflow the whole queue goes: [0 1 2] + 3 -> [3], [3 4 5] + 6 -> [6]
+    ("coalesce", [b"6"]),
+])
+def test_full_queues_drop_frames(policy, queued):
+    server = EventServer("127.0.0.1", 0, lambda text: b"", queue_size=3, slow_policy=policy)
+    connection, peer = _stalled_subscriber(server)
+    for index in range(7):
+        server._broadcast(str(index).encode(), "text")
+    assert list(connection.outbox) == queued
+    assert connection.dropped == server.frames_dropped == 7 - len(queued)
+    assert server.frames_sent == 7
+    peer.close()
+
+def test_disconnect_policy_closes_the_slow_subscriber():
+    server = EventServer("127.0.0.1", 0, lambda text: b"", queue_size=2, slow_policy="disconnect")
+    connection, peer = _stalled_subscriber(server)
+    for index in range(3):
+        server._broadcast(str(index).encode(), "text")
+    assert connection.sock not in server._connections
+    assert not server.has_subscribers("text")
+    assert server.slow_disconnects == 1
+    peer.close()
+
+def test_partially_sent_frame_is_never_dropped():
+    server = EventServer("127.0.0.1", 0, lambda text: b"", queue_size=2, slow_policy="coalesce")
+    connection, peer = _stalled_subscriber(server)
+    server._broadcast(b"head", "text")
+    connection.offset = 2       # "he" already written to the socket
+    server._broadcast(b"1", "text")
+    server._broadcast(b"2", "text")
+    assert list(connection.outbox) == [b"head", b"2"]
+    peer.close()
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        EventServer("127.0.0.1", 0, lambda text: b"", slow_policy="block")
+
+def test_stats_are_read_directly_while_the_loop_is_not_running():
+    server = EventServer("127.0.0.1", 0, lambda text: b"", slow_policy="drop_oldest")
+    # The metrics server scrapes before the loop starts: no timeout, no call left queued
+    stats = server.subscriber_stats(timeout=0.5)
+    assert (stats['subscribers'], stats['per_subscriber']) == (0, {})
+    assert not server._calls
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from snapshot_buffer import SnapshotPublisher, SnapshotRing
+
+def _append(ring: SnapshotRing, count: int):
+    for index in range(count):
+        ring.append({"temperatures": {"MXC": index}}, {}, {})
+
+def _wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+def test_ring_keeps_the_last_snapshots():
+    ring = SnapshotRing(3)
+    _append(ring, 5)
+    assert ring.last_seq == 5 and ring.latest().seq == 5
+    assert [snapshot.seq for snapshot in ring.since(0)] == [3, 4, 5]
+    assert [snapshot.seq for snapshot in ring.since(4)] == [5]
+    assert ring.since(5) == []
+    assert ring.wait_since(5, timeout=0.01) == []
+
+def test_snapshots_are_read_only():
+    ring = SnapshotRing(1)
+    snapshot = ring.append({"temperatures": {}}, {"HR": "5"}, {})
+    try:
+        snapshot.control_params["HR"] = "0"
+    except TypeError:
+        pass
+    assert snapshot.control_params["HR"] == "5"
+
+def test_publisher_catches_up_with_the_latest_snapshot():
+    ring = SnapshotRing(8)
+    release = threading.Event()
+    published = []
+
+    def publish(snapshot):
+        published.append(snapshot.seq)
+        if snapshot.seq == 1:
+            release.wait(5)     # A slow consumer: ticks 2 to 4 arrive meanwhile
+
+    publisher = SnapshotPublisher(ring, "test", publish).start()
+    _append(ring, 1)
+    _wait_until(lambda: published)
+    _append(ring, 3)
+    release.set()
+    _wait_until(lambda: publisher.published == 2)
+    publisher.stop(5)
+    assert published == [1, 4]
+    assert publisher.skipped == 2
+
+def test_publisher_with_every_snapshot_skips_none():
+    ring = SnapshotRing(8)
+    published = []
+    done = threading.Event()
+
+    def publish(snapshot):
+        published.append(snapshot.seq)
+        if snapshot.seq == 4:
+            done.set()
+
+    publisher = SnapshotPublisher(ring, "test", publish, every_snapshot=True).start()
+    _append(ring, 4)
+    assert done.wait(5)
+    publisher.stop(5)
+    assert published == [1, 2, 3, 4] and publisher.skipped == 0
@@ -0,0 +1,52 @@
+import pytest
+
+import tcp_server
+from subscriptions import FilteredStream, Subscription, SubscriptionGroups
+from wire_format import parse_text_fields
+
+def test_fields_are_kept_in_schema_order():
+    subscription = Subscription.parse(["fields=RMXC,MXC", "rate=0.5", "agg=MEAN"])
+    assert subscription.fields == ("MXC", "RMXC")
+    assert (subscription.rate, subscription.agg) == (0.5, "mean")
+    assert subscription.key == "filtered:MXC,RMXC;rate=0.5;agg=mean"
+
+def test_channels_select_every_reading_field():
+    assert set(Subscription.parse(["channels=mxc"]).fields) == {"MXC", "RMXC", "PMXC", "ageMXC", "enabledMXC"}
+
+@pytest.mark.parametrize("options", [["fields=nope"], ["channels=1K"], ["rate=0"], ["rate=fast"],
+                                     ["agg=median"], ["bogus=1"], ["fields="]])
+def test_invalid_options_are_rejected(options):
+    with pytest.raises(ValueError):
+        Subscription.parse(options)
+
+def test_every_tick_without_rate():
+    stream = FilteredStream(Subscription(["MXC"]))
+    line = stream.update(7, 1000.0, 0.0, {"MXC": 0.01, "4K": 4.2})
+    assert parse_text_fields(line.decode('utf-8')) == {"seq": "7", "time": "1000.000", "MXC": "0.01"}
+
+def test_rate_decimates_and_aggregates():
+    stream = FilteredStream(Subscription(["MXC", "autoscan"], rate=1.0, agg="mean"))
+    lines = [stream.update(seq, 1000.0 + seq / 4, seq / 4, {"MXC": float(seq), "autoscan": str(seq)})
+             for seq in range(6)]
+    # One line per second: ticks 0..4 (t = 0 to 1 s) are combined
+    assert [line is not None for line in lines] == [False, False, False, False, True, False]
+    fields = parse_text_fields(lines[4].decode('utf-8'))
+    assert float(fields["MXC"]) == pytest.approx(2.0)
+    assert fields["autoscan"] == "4"    # Not numeric: the last value
+
+def test_identical_requests_share_a_group():
+    groups = SubscriptionGroups()
+    first = groups.register(Subscription.parse(["fields=MXC,RMXC"]))
+    second = groups.register(Subscription.parse(["fields=RMXC,MXC"]))
+    assert first == second
+    assert len(groups.streams()) == 1
+
+def test_server_maps_sub_requests_to_streams():
+    assert tcp_server.subscription_stream("SUB") == "text"
+    assert tcp_server.subscription_stream("SUB bin") == "bin"
+    assert tcp_server.subscription_stream("SUB fields=MXC rate=1").startswith("filtered:MXC;rate=1")
+    with pytest.raises(ValueError):
+        tcp_server.subscription_stream("SUB fields=MXC REPLAY")
+    # Legacy clients keep the text line whatever follows "SUB"
+    assert tcp_server.subscription_stream("SUBSCRIBE BIN") == "text"
+    assert tcp_server.subscription_stream("sub") == "text"
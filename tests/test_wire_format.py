@@ -0,0 +1,27 @@
+import pytest
+
+from wire_format import FIELD_NAMES, FrameReader, HEADER_STRUCT, PAYLOAD_STRUCT, decode_frame, encode_frame
+
+def test_frames_round_trip_with_missing_values():
+    fields = {"MXC": 0.0123, "MXCHR": 5, "heater_range": "LOW", "50K": "OFF", "ageMXC": None, "autoscan": "1"}
+    frame = encode_frame(42, 1792190000.25, fields)
+    assert len(frame) == HEADER_STRUCT.size + PAYLOAD_STRUCT.size
+
+    seq, timestamp, decoded = decode_frame(frame)
+    assert (seq, timestamp) == (42, 1792190000.25)
+    assert set(decoded) == set(FIELD_NAMES)
+    assert (decoded["MXC"], decoded["MXCHR"], decoded["heater_range"], decoded["autoscan"]) == (0.0123, 5, "LOW", 1)
+    # "OFF" and None travel as NaN / -1 and come back as None
+    assert decoded["50K"] is None and decoded["ageMXC"] is None and decoded["dwellMXC"] is None
+
+def test_frame_reader_reassembles_split_frames():
+    stream = encode_frame(1, 1.0, {"MXC": 0.01}) + encode_frame(2, 2.0, {"MXC": 0.02})
+    reader = FrameReader()
+    frames = reader.feed(stream[:10]) + reader.feed(stream[10:-5]) + reader.feed(stream[-5:])
+    assert [(seq, fields["MXC"]) for seq, _, fields in frames] == [(1, 0.01), (2, 0.02)]
+
+def test_bad_frames_are_rejected():
+    frame = bytearray(encode_frame(1, 1.0, {}))
+    frame[0:2] = b"XX"
+    with pytest.raises(ValueError):
+        decode_frame(bytes(frame))
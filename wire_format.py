@@ -0,0 +1,174 @@
+"""
+Broadcast fields and their compact binary framing.
+
+FIELDS is the ordered schema of the values published on every acquisition
+tick, with the same names as the legacy text line ("50K: ...,4K: ...").
+snapshot_fields() extracts them from a snapshot_buffer.Snapshot.
+
+Binary frames (subscribers that send "SUB BIN") are:
+
+    header  HEADER_STRUCT: magic b"LS", version, schema id, payload length,
+            sequence number, timestamp (time.time() of the tick)
+    payload struct of the schema (little endian, no padding)
+
+Missing values travel as NaN for floats and -1 for integers and are decoded
+back to None. A client only needs this module (or the two struct formats for
+the schema id it supports) to decode the stream:
+
+    reader = FrameReader()
+    for seq, timestamp, fields in reader.feed(sock.recv(4096)):
+        ...
+"""
+
+import math
+import struct
+
+MAGIC = b"LS"
+VERSION = 1
+SCHEMA_ID = 1
+
+# (name, struct code): "d" float64, "h" int16 (-1 = None), "8s" short text
+FIELDS = (
+    ("50K", "d"), ("4K", "d"), ("STILL", "d"), ("MXC", "d"),
+    ("MXCSP", "d"), ("MXCP", "d"), ("MXCI", "d"), ("MXCD", "d"), ("MXCHR", "h"),
+    ("dwellMXC", "h"), ("pauseMXC", "h"), ("modeMXC", "h"), ("rangeMXC", "h"), ("autorangeMXC", "h"),
+    ("dwell_50K", "h"), ("dwell_4K", "h"), ("dwell_STILL", "h"),
+    ("pause_50K", "h"), ("pause_4K", "h"), ("pause_STILL", "h"),
+    ("setpoint", "d"), ("heater_power", "d"), ("heater_range", "8s"), ("temperature_limit", "d"),
+    ("timeout", "d"), ("proportional_gain", "d"), ("integral_gain", "d"), ("derivative_gain", "d"),
+    ("autoscan", "h"),
+    ("R50K", "d"), ("R4K", "d"), ("RSTILL", "d"), ("RMXC", "d"),
+    ("P50K", "d"), ("P4K", "d"), ("PSTILL", "d"), ("PMXC", "d"),
+    ("enabledMXC", "h"), ("enabled50K", "h"), ("enabled4K", "h"), ("enabledSTILL", "h"),
+    ("age50K", "d"), ("age4K", "d"), ("ageSTILL", "d"), ("ageMXC", "d"),
+)
+FIELD_NAMES = tuple(name for name, _ in FIELDS)
+
+HEADER_STRUCT = struct.Struct("<2sBBHId")
+PAYLOAD_STRUCT = struct.Struct("<" + "".join(code for _, code in FIELDS))
+
+CHANNEL_IDS = ("50K", "4K", "STILL", "MXC")
+
+def snapshot_fields(snapshot) -> dict:
+    """ Values of every field in FIELDS from a snapshot, as published in the text line. """
+    values = snapshot.sensor_values
+    control = snapshot.control_params
+    sensor = snapshot.sensor_params
+    heater = snapshot.extra
+    dwell_times = sensor['dwell_times']
+    pause_times = sensor['pause_times']
+
+    fields = {}
+    for channel_id in CHANNEL_IDS:
+        fields[channel_id] = values['temperatures'][channel_id]
+    fields.update({
+        'MXCSP': control['MXCSP'],
+        'MXCP': control['P'],
+        'MXCI': control['I'],
+        'MXCD': control['D'],
+        'MXCHR': control['HR'],
+        'dwellMXC': dwell_times['MXC'],
+        'pauseMXC': pause_times['MXC'],
+        'modeMXC': sensor['sensor_mode'],
+        'rangeMXC': sensor['sensor_range'],
+        'autorangeMXC': sensor['sensor_autorange'],
+    })
+    for channel_id in ("50K", "4K", "STILL"):
+        fields[f'dwell_{channel_id}'] = dwell_times[channel_id]
+    for channel_id in ("50K", "4K", "STILL"):
+        fields[f'pause_{channel_id}'] = pause_times[channel_id]
+    for name in ('setpoint', 'heater_power', 'heater_range', 'temperature_limit', 'timeout',
+                 'proportional_gain', 'integral_gain', 'derivative_gain'):
+        fields[name] = heater.get(name)
+    fields['autoscan'] = sensor['autoscan'][1]
+    for channel_id in CHANNEL_IDS:
+        fields[f'R{channel_id}'] = values['resistances'][channel_id]
+    for channel_id in CHANNEL_IDS:
+        fields[f'P{channel_id}'] = values['powers'][channel_id]
+    fields['enabledMXC'] = sensor['enabledMXC']
+    for channel_id in ("50K", "4K", "STILL"):
+        fields[f'enabled{channel_id}'] = sensor['enabled'][channel_id]
+    for channel_id in CHANNEL_IDS:
+        fields[f'age{channel_id}'] = values['ages'][channel_id]
+    return fields
+
+def format_text_fields(fields: dict, names=None) -> str:
+    """ "name: value,name: value" text of some fields (all of them, in order, by default). """
+    if names is None:
+        names = fields.keys()
+    return ",".join(f"{name}: {fields[name]}" for name in names)
+
+def parse_text_fields(text: str) -> dict:
+    """ {name: value as text} from a "name: value,..." text line. """
+    fields = {}
+    for pair in text.strip().split(","):
+        name, separator, value = pair.partition(":")
+        if separator:
+            fields[name.strip()] = value.strip()
+    return fields
+
+def _pack_value(code: str, value):
+    if code == "d":
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return math.nan     # None, "OFF", ...
+    if code == "h":
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return -1
+    return str(value if value is not None else "").encode('utf-8')
+
+def _unpack_value(code: str, value):
+    if code == "d":
+        return None if math.isnan(value) else value
+    if code == "h":
+        return None if value == -1 else value
+    return value.rstrip(b"\0").decode('utf-8') or None
+
+def encode_frame(seq: int, timestamp: float, fields: dict) -> bytes:
+    """ Binary frame of a tick from its field values (see snapshot_fields). """
+    payload = PAYLOAD_STRUCT.pack(*(_pack_value(code, fields.get(name)) for name, code in FIELDS))
+    header = HEADER_STRUCT.pack(MAGIC, VERSION, SCHEMA_ID, len(payload), seq & 0xFFFFFFFF, timestamp)
+    return header + payload
+
+def encode_snapshot(snapshot) -> bytes:
+    return encode_frame(snapshot.seq, snapshot.timestamp, snapshot_fields(snapshot))
+
+def decode_frame(frame: bytes) -> tuple:
+    """
+    Decode one complete frame.
+    Returns:
+        tuple: (seq, timestamp, {field name: value})
+    Raises:
+        ValueError: Bad magic, unsupported version/schema or wrong length.
+    """
+    magic, version, schema_id, length, seq, timestamp = HEADER_STRUCT.unpack_from(frame)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} frame: {frame[:HEADER_STRUCT.size]!r}")
+    if schema_id != SCHEMA_ID or length != PAYLOAD_STRUCT.size:
+        raise ValueError(f"Unsupported schema {schema_id} with a {length} byte payload")
+    values = PAYLOAD_STRUCT.unpack_from(frame, HEADER_STRUCT.size)
+    fields = {name: _unpack_value(code, value) for (name, code), value in zip(FIELDS, values)}
+    return seq, timestamp, fields
+
+class FrameReader:
+
+    """ Reassembles frames from a byte stream (e.g. successive socket reads). """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        """ Add received bytes and return the frames completed by them, decoded. """
+        self._buffer += data
+        frames = []
+        while len(self._buffer) >= HEADER_STRUCT.size:
+            length = HEADER_STRUCT.unpack_from(self._buffer)[3]
+            size = HEADER_STRUCT.size + length
+            if len(self._buffer) < size:
+                break
+            frames.append(decode_frame(bytes(self._buffer[:size])))
+            del self._buffer[:size]
+        return frames